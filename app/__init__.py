@@ -1,74 +1,80 @@
-import sqlite3
+from .startup import StartupTimer, PROCESS_STARTED
+import time
 from flask import Flask, g, session
 from datetime import datetime
-import markdown
 from markupsafe import Markup
+_IMPORTS_DONE = time.perf_counter()
 
 def create_app():
     """De application factory functie."""
+    timer = StartupTimer()
+    timer.record('import flask', _IMPORTS_DONE - PROCESS_STARTED)
     app = Flask(__name__, template_folder='templates')
 
     # --- Laad Configuratie ---
-    app.config.from_object('config.settings')
-    app.config.update(
-        SESSION_COOKIE_HTTPONLY=True,
-        SESSION_COOKIE_SAMESITE='Lax'
-    )
-
-    # --- Koppel de teardown functie aan de app ---
-    @app.teardown_appcontext
-    def close_db(e=None):
-        """Sluit de database connectie aan het einde van de request."""
-        db = g.pop('db', None)
-        if db is not None:
-            try:
-                db.close()
-            except sqlite3.Error as e:
-                print(f"Fout bij sluiten van de database: {e}")
+    with timer.phase('configuratie'):
+        app.config.from_object('config.settings')
+        app.config.update(
+            SESSION_COOKIE_HTTPONLY=True,
+            SESSION_COOKIE_SAMESITE='Lax'
+        )
 
     # --- Initialiseer de Database ---
-    from . import database
-    with app.app_context():
+    # utils eerst: database importeert het ook, dus anders telt het mee onder 'import database'.
+    with timer.phase('import utils'):
+        from . import utils
+    with timer.phase('import database'):
+        from . import database
+    with timer.phase('database migraties'):
         database.init_db(app.config)
+    database.init_pool(app)
+    database.init_reference_cache(app)
+    database.register_commands(app)
+
+    # --- Koppel de teardown functie aan de app ---
+    # Geeft de verbinding aan het einde van de request terug aan de pool.
+    app.teardown_appcontext(database.close_db)
 
     # --- Registreer Custom Jinja Filters ---
-    from . import utils
+    utils.init_keyring(app)
     app.jinja_env.filters['datetimeformat'] = utils.format_datetime
+    app.jinja_env.filters['filesize'] = utils.format_filesize
 
     def markdown_filter(s):
-        return Markup(markdown.markdown(s, extensions=['fenced_code', 'tables']))
+        return Markup(utils.render_markdown(s))
     app.jinja_env.filters['markdown'] = markdown_filter
 
+    # --- Start de Print Spooler ---
+    # Nieuwe tickets worden op de achtergrond geprint, vanuit de wachtrij in de database.
+    from . import printer
+    printer.init_spooler(app)
+
     # --- Registreer Blueprints ---
-    from . import auth, routes_main, routes_kb, routes_reports
-    app.register_blueprint(auth.bp)
-    app.register_blueprint(routes_main.bp)
-    app.register_blueprint(routes_kb.bp)
-    app.register_blueprint(routes_reports.bp)
+    # De blueprints zelf zijn licht; hun zware afhankelijkheden worden pas bij gebruik geladen.
+    with timer.phase('blueprints'):
+        from . import auth, routes_main, routes_kb, routes_reports
+        app.register_blueprint(auth.bp)
+        app.register_blueprint(routes_main.bp)
+        app.register_blueprint(routes_kb.bp)
+        app.register_blueprint(routes_reports.bp)
 
-    from .routes_kb import bp_templates
-    app.register_blueprint(bp_templates)
+        from .routes_kb import bp_templates
+        app.register_blueprint(bp_templates)
 
     # --- Functies die voor elke request worden uitgevoerd ---
     @app.before_request
     def before_request_callbacks():
         """
         Wordt uitgevoerd voor elke request.
-        Opent de databaseverbinding en laadt de ingelogde gebruiker.
+        Laadt de ingelogde gebruiker; de databaseverbinding wordt pas bij
+        het eerste gebruik via database.get_db() uit de pool geleend.
         """
-        try:
-            g.db = sqlite3.connect(app.config['DATABASE_FILE'])
-            g.db.row_factory = sqlite3.Row
-        except sqlite3.Error as e:
-            print(f"Fout bij openen van de database: {e}")
-            return "Database fout", 500
-
         username = session.get('username')
         g.user = username
-        if username:
-            g.master_password = session.get('master_password')
-        else:
-            g.master_password = None
+        if username and 'master_password' in session:
+            # Sessie van vóór de keyring: sleutel eenmalig afleiden en het wachtwoord wissen
+            session['key_handle'] = utils.get_keyring().open(session.pop('master_password'))
+        g.key_handle = session.get('key_handle') if username else None
 
     # --- Maak variabelen beschikbaar in alle templates ---
     @app.context_processor
@@ -76,4 +82,6 @@ def create_app():
         """Injecteert de huidige datum/tijd in de template context."""
         return {'now': datetime.utcnow()}
 
+    timer.install_first_response_hook(app)
+    timer.report()
     return app
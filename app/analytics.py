@@ -0,0 +1,248 @@
+import re
+import sqlite3
+import threading
+from datetime import date, timedelta
+from . import database
+
+# ==============================================================================
+# ANALYSES
+# Trends (aangemaakt/opgelost per dag of week) en SLA-doorlooptijden (eerste reactie en
+# oplossing, p50/p90/p99 per prioriteit en medewerker), afgeleid uit de audit trail in
+# 'comments' en tickets.created_at. Afgeronde dagen worden eenmalig berekend en bewaard in
+# 'analytics_daily'; alleen nieuwe dagen en vandaag worden bij een opvraging berekend.
+# NumPy wordt pas bij het eerste gebruik geïmporteerd, net als matplotlib in utils.py.
+# ==============================================================================
+
+RESOLVED_STATUSES = ('Resolved', 'Closed')
+PERCENTILES = (50, 90, 99)
+SYSTEM_AUTHOR = 'Systeem'  # Auteur van automatische events zoals 'Ticket aangemaakt.'
+
+FIRST_RESPONSE = 'first_response'
+RESOLUTION = 'resolution'
+
+_STATUS_CHANGE = re.compile(r"^Status gewijzigd van '(.*)' naar '(.*)'\.$")
+_KEY_SEPARATOR = '\x1f'
+_STATE_KEY = 'rolled_up_until'  # Eerste dag die nog niet in de rollup staat
+_refresh_lock = threading.Lock()
+
+# Alle events van medewerkers in een dagbereik, met de gegevens van het ticket erbij.
+# 'is_first' markeert de eerste reactie: er is geen eerder event van een medewerker op
+# hetzelfde ticket (een index seek op idx_comments_timeline per event).
+_MILESTONE_SQL = '''
+    SELECT c.created_at, c.author, c.comment_text, t.created_at, t.priority,
+           NOT EXISTS (
+               SELECT 1 FROM comments p
+               WHERE p.ticket_id = c.ticket_id AND p.author != ?
+                 AND (p.created_at, p.id) < (c.created_at, c.id)
+           )
+    FROM comments c JOIN tickets t ON t.id = c.ticket_id
+    WHERE c.created_at >= ? AND c.created_at < ? AND c.author != ? AND t.created_at IS NOT NULL
+'''
+
+_CREATED_SQL = '''
+    SELECT substr(created_at, 1, 10) AS day, priority, COUNT(*)
+    FROM tickets
+    WHERE created_at >= ? AND created_at < ?
+    GROUP BY day, priority
+'''
+
+def _split_groups(keys, values):
+    """Splitst values per unieke sleutel: één keer sorteren en op de grenzen knippen."""
+    import numpy as np
+    unique, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.flatnonzero(np.diff(inverse[order])) + 1
+    return unique, np.split(values[order], bounds)
+
+def _load_milestones(db, start, end):
+    """
+    Leest de events in [start, end) in één streaming pass en zet de mijlpalen (eerste reactie
+    en oplossing) om naar NumPy arrays: soort, dag, prioriteit, medewerker en doorlooptijd.
+    Retourneert None als er in het bereik geen mijlpalen zijn.
+    """
+    import numpy as np
+    milestones = []
+    cursor = db.execute(_MILESTONE_SQL, (SYSTEM_AUTHOR, start, end, SYSTEM_AUTHOR))
+    for event_at, author, text, ticket_created, priority, is_first in cursor:
+        if is_first:
+            milestones.append((FIRST_RESPONSE, event_at, ticket_created, priority, author))
+        change = _STATUS_CHANGE.match(text)
+        # Resolved -> Closed is geen nieuwe oplossing; heropenen en opnieuw oplossen wel
+        if change and change[2] in RESOLVED_STATUSES and change[1] not in RESOLVED_STATUSES:
+            milestones.append((RESOLUTION, event_at, ticket_created, priority, author))
+
+    if not milestones:
+        return None
+
+    kinds, event_times, created_times, priorities, agents = zip(*milestones)
+    events = np.array(event_times, dtype='datetime64[us]')
+    durations = (events - np.array(created_times, dtype='datetime64[us]')) / np.timedelta64(1, 's')
+    return {
+        'kind': np.array(kinds, dtype=str),
+        'day': events.astype('datetime64[D]').astype(str),
+        'priority': np.array(priorities, dtype=str),
+        'agent': np.array(agents, dtype=str),
+        'duration': np.maximum(durations, 0.0)  # Klokverschillen leveren geen negatieve tijden op
+    }
+
+def _compute_rollup(db, start, end):
+    """
+    Berekent de rollup rijen voor de dagen in [start, end):
+    (dag, prioriteit, medewerker, aangemaakt, opgelost, eerste-reactietijden, oplostijden).
+    Aanmaken hoort bij geen medewerker (''); mijlpalen bij de medewerker die ze uitvoerde.
+    """
+    import numpy as np
+    rollup = {}
+
+    def entry(key):
+        return rollup.setdefault(key, {'created': 0, FIRST_RESPONSE: None, RESOLUTION: None})
+
+    for day, priority, count in db.execute(_CREATED_SQL, (start, end)):
+        entry((day, priority, ''))['created'] = count
+
+    milestones = _load_milestones(db, start, end)
+    if milestones is not None:
+        keys = milestones['kind']
+        for column in ('day', 'priority', 'agent'):
+            keys = np.char.add(np.char.add(keys, _KEY_SEPARATOR), milestones[column])
+        for key, durations in zip(*_split_groups(keys, milestones['duration'])):
+            kind, day, priority, agent = str(key).split(_KEY_SEPARATOR)
+            entry((day, priority, agent))[kind] = durations
+
+    rows = []
+    for (day, priority, agent), values in sorted(rollup.items()):
+        resolutions = values[RESOLUTION]
+        rows.append((
+            day, priority, agent, values['created'],
+            0 if resolutions is None else len(resolutions),
+            None if values[FIRST_RESPONSE] is None else values[FIRST_RESPONSE].astype('<f8').tobytes(),
+            None if resolutions is None else resolutions.astype('<f8').tobytes()
+        ))
+    return rows
+
+def refresh_rollup():
+    """
+    Werkt de rollup bij tot en met gisteren. Alleen dagen na de laatst verwerkte dag worden
+    berekend; vandaag is nog niet af en wordt bij elke opvraging live berekend.
+    """
+    today = date.today().isoformat()
+    with _refresh_lock:
+        db = database.get_db()
+        row = db.execute('SELECT value FROM analytics_state WHERE name = ?', (_STATE_KEY,)).fetchone()
+        if row is not None:
+            start = row[0]
+        else:
+            first_ticket = db.execute('SELECT min(created_at) FROM tickets').fetchone()[0]
+            start = first_ticket[:10] if first_ticket else today
+        if start >= today:
+            return
+
+        rows = _compute_rollup(db, start, today)
+        try:
+            with database.transaction() as db:
+                db.execute('DELETE FROM analytics_daily WHERE day >= ? AND day < ?', (start, today))
+                db.executemany(
+                    'INSERT INTO analytics_daily (day, priority, agent, created, resolved, first_response, resolution) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+                db.execute(
+                    'INSERT INTO analytics_state (name, value) VALUES (?, ?) '
+                    'ON CONFLICT (name) DO UPDATE SET value = excluded.value',
+                    (_STATE_KEY, today)
+                )
+        except sqlite3.Error as e:
+            print(f"Fout bij bijwerken van de analytics rollup: {e}")
+            raise
+
+def _period_start(days, granularity):
+    """Eerste dag van de periode (dag, of maandag van de week) voor een datetime64[D] array."""
+    if granularity == 'week':
+        # 1970-01-01 was een donderdag; +3 maakt maandag weekdag 0
+        return days - ((days.astype('int64') + 3) % 7).astype('timedelta64[D]')
+    return days
+
+def _period_label(period, granularity):
+    """Leesbaar label voor een periode: '18-10' voor een dag, '2026-W42' voor een week."""
+    if granularity == 'week':
+        year, week, _ = period.isocalendar()
+        return f'{year}-W{week:02d}'
+    return period.strftime('%d-%m')
+
+def _throughput(rows, since, until, granularity):
+    """Aangemaakte en opgeloste tickets per periode, zonder gaten voor periodes zonder activiteit."""
+    import numpy as np
+    days = np.array([row[0] for row in rows], dtype='datetime64[D]')
+    all_periods = np.unique(_period_start(
+        np.arange(np.datetime64(since), np.datetime64(until), dtype='datetime64[D]'), granularity
+    ))
+    index = np.searchsorted(all_periods, _period_start(days, granularity))
+    created = np.bincount(index, weights=[row[3] for row in rows], minlength=len(all_periods))
+    resolved = np.bincount(index, weights=[row[4] for row in rows], minlength=len(all_periods))
+    periods = all_periods.astype(object)
+    return {
+        'periods': [period.isoformat() for period in periods],
+        'labels': [_period_label(period, granularity) for period in periods],
+        'created': created.astype(int).tolist(),
+        'resolved': resolved.astype(int).tolist()
+    }
+
+def _percentile_summary(values):
+    """Aantal en p50/p90/p99 (in seconden) van een array doorlooptijden."""
+    import numpy as np
+    percentiles = np.percentile(values, PERCENTILES)
+    summary = {'count': int(len(values))}
+    summary.update({f'p{q}': round(float(p), 1) for q, p in zip(PERCENTILES, percentiles)})
+    return summary
+
+def _sla_breakdown(rows, column):
+    """
+    Percentielen van één doorlooptijd (kolom 5: eerste reactie, kolom 6: oplossing), voor
+    alle tickets samen en per prioriteit en medewerker. Alle arrays worden samengevoegd en
+    per groep in één keer gesorteerd, in plaats van per groep opnieuw te verzamelen.
+    """
+    import numpy as np
+    arrays, priorities, agents = [], [], []
+    for row in rows:
+        if row[column]:
+            arrays.append(np.frombuffer(row[column], dtype='<f8'))
+            priorities.append(row[1])
+            agents.append(row[2])
+    if not arrays:
+        return {'overall': None, 'priority': {}, 'agent': {}}
+
+    values = np.concatenate(arrays)
+    sizes = [len(array) for array in arrays]
+    breakdown = {'overall': _percentile_summary(values)}
+    for name, labels in (('priority', priorities), ('agent', agents)):
+        groups = np.repeat(np.array(labels, dtype=str), sizes)
+        breakdown[name] = {
+            str(label): _percentile_summary(chunk) for label, chunk in zip(*_split_groups(groups, values))
+        }
+    breakdown['priority'] = dict(sorted(breakdown['priority'].items(), key=lambda item: database.priority_rank(item[0])))
+    return breakdown
+
+def get_analytics(since, until, granularity='day'):
+    """
+    Trends en SLA-percentielen voor de dagen in [since, until) (ISO datums, until exclusief).
+    Afgeronde dagen komen uit de rollup; vandaag wordt live berekend en niet opgeslagen.
+    """
+    refresh_rollup()
+    db = database.get_db()
+    rows = db.execute(
+        'SELECT day, priority, agent, created, resolved, first_response, resolution '
+        'FROM analytics_daily WHERE day >= ? AND day < ?',
+        (since, until)
+    ).fetchall()
+
+    today = date.today()
+    if since <= today.isoformat() < until:
+        rows += _compute_rollup(db, today.isoformat(), (today + timedelta(days=1)).isoformat())
+
+    return {
+        'window': {'since': since, 'until': until},
+        'granularity': granularity,
+        'throughput': _throughput(rows, since, until, granularity),
+        FIRST_RESPONSE: _sla_breakdown(rows, 5),
+        RESOLUTION: _sla_breakdown(rows, 6)
+    }
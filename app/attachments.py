@@ -0,0 +1,199 @@
+import hashlib
+import hmac
+import io
+import mimetypes
+import os
+import tempfile
+from flask import current_app
+
+# ==============================================================================
+# BIJLAGEN
+# Bestanden bij tickets en reacties. De inhoud staat op schijf naast de database, per
+# bestand één blob met de SHA-256 van de inhoud als naam: hetzelfde bestand wordt maar
+# één keer opgeslagen. SQLite bevat alleen de metadata (attachments, attachment_blobs).
+#
+# Uploads worden in blokken van ATTACHMENT_CHUNK_SIZE naar een tijdelijk bestand gekopieerd
+# en pas bij de commit van de metadata op hun definitieve plek gezet. Met
+# ATTACHMENTS_ENCRYPT wordt elk blok met AES-GCM versleuteld onder een eigen data key,
+# omhuld met de hoofdsleutel, net als de gevoelige notities (envelope encryptie).
+# ==============================================================================
+
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+_RECORD_OVERHEAD = _NONCE_SIZE + _TAG_SIZE  # Per versleuteld blok: nonce + authenticatietag
+
+# Types die de browser direct mag tonen; al het andere wordt als download aangeboden
+INLINE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'text/plain', 'application/pdf'}
+
+def storage_dir() -> str:
+    """Map met de blobs: ATTACHMENTS_DIR, of standaard 'attachments' naast DATABASE_FILE."""
+    config = current_app.config
+    return config.get('ATTACHMENTS_DIR') or os.path.join(os.path.dirname(config['DATABASE_FILE']), 'attachments')
+
+def blob_path(blob_id: str) -> str:
+    # Twee niveaus, zodat geen enkele map tienduizenden bestanden krijgt
+    return os.path.join(storage_dir(), blob_id[:2], blob_id)
+
+def guess_content_type(filename: str) -> str:
+    """Content type op basis van de bestandsnaam; het type van de browser wordt niet vertrouwd."""
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+def _encrypted_blob_id(id_key: bytes, digest: str) -> str:
+    """
+    Naam van een versleutelde blob: een HMAC van de inhoudshash, zodat ontdubbelen werkt
+    zonder dat de hash van de inhoud zelf leesbaar op schijf of in de database staat.
+    id_key komt uit database.get_attachment_id_key() en verandert niet bij een rotatie.
+    """
+    return hmac.new(id_key, digest.encode(), hashlib.sha256).hexdigest()
+
+def receive(stream, master_key: bytes | None = None) -> dict:
+    """
+    Kopieert een upload in vaste blokken naar een tijdelijk bestand in de opslagmap en
+    berekent onderweg de hash. Met master_key wordt elk blok versleuteld.
+    Retourneert de blob die nog op de commit van zijn metadata wacht: 'blob_id', 'size',
+    'temp_path', en bij versleuteling 'chunk_size', 'wrapped_key' en 'master_key_id'.
+    Het tijdelijke bestand wordt met place() vastgelegd of met discard() opgeruimd.
+    """
+    from . import database, utils
+    chunk_size = current_app.config.get('ATTACHMENT_CHUNK_SIZE', 64 * 1024)
+    os.makedirs(storage_dir(), exist_ok=True)
+
+    aes = data_key = None
+    if master_key is not None:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        id_key = database.get_attachment_id_key(master_key)
+        data_key = AESGCM.generate_key(bit_length=256)
+        aes = AESGCM(data_key)
+
+    digest = hashlib.sha256()
+    size = index = 0
+    temp = tempfile.NamedTemporaryFile(dir=storage_dir(), prefix='.upload-', delete=False)
+    try:
+        with temp:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                # Een stream kan kortere stukken leveren; vul aan tot een volledig blok,
+                # zodat versleutelde blobs een vaste blokgrootte hebben
+                while len(chunk) < chunk_size:
+                    more = stream.read(chunk_size - len(chunk))
+                    if not more:
+                        break
+                    chunk += more
+                digest.update(chunk)
+                size += len(chunk)
+                if aes is not None:
+                    nonce = os.urandom(_NONCE_SIZE)
+                    chunk = nonce + aes.encrypt(nonce, chunk, index.to_bytes(8, 'big'))
+                temp.write(chunk)
+                index += 1
+            temp.flush()
+            os.fsync(temp.fileno())
+    except BaseException:
+        os.unlink(temp.name)
+        raise
+
+    blob = {'blob_id': digest.hexdigest(), 'size': size, 'temp_path': temp.name,
+            'chunk_size': None, 'wrapped_key': None, 'master_key_id': None}
+    if master_key is not None:
+        from cryptography.fernet import Fernet
+        blob.update(
+            blob_id=_encrypted_blob_id(id_key, blob['blob_id']),
+            chunk_size=chunk_size,
+            wrapped_key=Fernet(master_key).encrypt(data_key).decode(),
+            master_key_id=utils.master_key_id(master_key)
+        )
+    return blob
+
+def place(blob: dict, is_new: bool):
+    """
+    Zet een blob op zijn definitieve plek, of gooit hem weg als de blob al bestond.
+    Alleen degene die de metadata-rij aanmaakte (is_new) schrijft het bestand; een
+    achtergebleven bestand zonder metadata wordt daarbij overschreven.
+    """
+    if not is_new:
+        discard(blob)
+        return
+    path = blob_path(blob['blob_id'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(blob['temp_path'], path)
+
+def remove(blob_id: str):
+    """Verwijdert een geplaatste blob, als de metadata ervan toch niet is vastgelegd."""
+    try:
+        os.unlink(blob_path(blob_id))
+    except FileNotFoundError:
+        pass
+
+def discard(blob: dict):
+    """Ruimt het tijdelijke bestand van een niet (meer) gebruikte upload op."""
+    try:
+        os.unlink(blob['temp_path'])
+    except FileNotFoundError:
+        pass
+
+class _DecryptingReader(io.RawIOBase):
+    """
+    Leesbaar, doorzoekbaar bestand over een versleutelde blob. Alleen de blokken die
+    gelezen worden, worden ontsleuteld; zo werken range requests zonder de rest te lezen.
+    """
+
+    def __init__(self, path, data_key, size, chunk_size):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self._file = open(path, 'rb')
+        self._aes = AESGCM(data_key)
+        self._size = size
+        self._chunk_size = chunk_size
+        self._position = 0
+        self._cached = (None, b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def _chunk(self, index):
+        if self._cached[0] != index:
+            record_size = self._chunk_size + _RECORD_OVERHEAD
+            self._file.seek(index * record_size)
+            record = self._file.read(record_size)
+            plain = self._aes.decrypt(record[:_NONCE_SIZE], record[_NONCE_SIZE:], index.to_bytes(8, 'big'))
+            self._cached = (index, plain)
+        return self._cached[1]
+
+    def readinto(self, buffer):
+        if self._position >= self._size:
+            return 0
+        index, offset = divmod(self._position, self._chunk_size)
+        data = self._chunk(index)[offset:offset + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def open_blob(attachment, master_key: bytes | None = None):
+    """
+    Opent de inhoud van een bijlage (rij uit database.get_attachment) als binair bestand.
+    Versleutelde blobs vragen de hoofdsleutel; LookupError als die ontbreekt.
+    """
+    path = blob_path(attachment['blob_id'])
+    if not attachment['wrapped_key']:
+        return open(path, 'rb')
+    if master_key is None:
+        raise LookupError("Geen sleutel om deze bijlage te openen")
+    from cryptography.fernet import Fernet
+    data_key = Fernet(master_key).decrypt(attachment['wrapped_key'].encode())
+    return _DecryptingReader(path, data_key, attachment['size'], attachment['chunk_size'])
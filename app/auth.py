@@ -4,19 +4,25 @@ from flask import (
 )
 from werkzeug.security import check_password_hash
 from config.settings import USERS
+from . import utils
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 def login_required(view):
     """
     Decorator die controleert of een gebruiker is ingelogd.
-    Indien niet, wordt de gebruiker omgeleid naar de inlogpagina.
+    Indien niet, wordt de gebruiker omgeleid naar de inlogpagina. Dat geldt ook als de
+    encryptiesleutel van de sessie is verlopen of het proces is herstart.
     """
     @functools.wraps(view)
     def wrapped_view(**kwargs):
         if g.user is None:
             flash('Je moet eerst inloggen om deze pagina te bekijken.', 'warning')
             return redirect(url_for('auth.login'))
+        if utils.get_keyring().get(g.key_handle) is None:
+            session.clear()
+            flash('Je sessie is verlopen. Log opnieuw in.', 'warning')
+            return redirect(url_for('auth.login'))
         return view(**kwargs)
 
     return wrapped_view
@@ -46,7 +52,8 @@ def login():
         if error is None:
             session.clear()
             session['username'] = username
-            session['master_password'] = password  # Opslaan als platte tekst (veilig in lokale context)
+            # De sleutel wordt hier één keer afgeleid; de sessie krijgt alleen het handvat
+            session['key_handle'] = utils.get_keyring().open(password)
             flash(f'Welkom terug, {username}!', 'success')
             return redirect(url_for('main.index'))
 
@@ -59,6 +66,7 @@ def login():
 @login_required
 def logout():
     """Verwerkt het uitloggen van de gebruiker."""
+    utils.get_keyring().close(g.key_handle)
     session.clear()
     flash('Je bent succesvol uitgelogd.', 'info')
     return redirect(url_for('auth.login'))
@@ -1,23 +1,474 @@
 import sqlite3
 import os
-from datetime import datetime
-from flask import g
-def init_db(config):
-    """Initialiseert de database en maakt/update tabellen op een robuuste manier."""
-    DATABASE_FILE = config['DATABASE_FILE']
-    os.makedirs(os.path.dirname(DATABASE_FILE), exist_ok=True)
+import re
+import json
+import time
+import base64
+import functools
+import threading
+import click
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import g, current_app
+from . import attachments, utils
+
+# --- Rangordes voor Sorteren ---
+# Opgeslagen als integer kolommen (priority_rank, status_rank) zodat sorteren op prioriteit
+# of status een index-doorloop is in plaats van een CASE expressie over de hele tabel.
+PRIORITY_RANKS = {'Hoog': 1, 'Gemiddeld': 2, 'Laag': 3}
+STATUS_RANKS = {'New': 1, 'In Progress': 2, 'Pending': 3, 'Resolved': 4, 'Closed': 5}  # Workflow volgorde
+
+def priority_rank(priority):
+    """Geeft de sorteerrang van een prioriteit; onbekende waarden komen achteraan."""
+    return PRIORITY_RANKS.get(priority, len(PRIORITY_RANKS) + 1)
+
+def status_rank(status):
+    """Geeft de sorteerrang van een status volgens de workflow; onbekende waarden komen achteraan."""
+    return STATUS_RANKS.get(status, len(STATUS_RANKS) + 1)
+
+def _rank_case_sql(column, ranks):
+    """Bouwt een SQL CASE expressie die dezelfde rang berekent als priority_rank()/status_rank()."""
+    whens = ' '.join(f"WHEN '{value}' THEN {rank}" for value, rank in ranks.items())
+    return f"CASE {column} {whens} ELSE {len(ranks) + 1} END"
+
+# --- Connectie Pool ---
+class ConnectionPool:
+    """
+    Houdt per worker thread één persistente SQLite verbinding vast.
+
+    Waitress draait een vast aantal worker threads; door elke thread zijn eigen
+    verbinding te laten hergebruiken wordt het openen van het bestand, het parsen
+    van het schema en het opwarmen van de page cache maar één keer betaald.
+    Langlevende achtergrondthreads (de print spooler) krijgen met dedicate_thread()
+    een eigen verbinding die niet meetelt voor 'size'.
+    """
+
+    def __init__(self, database_file, size=4, pragmas=None, health_check=True):
+        self.database_file = database_file
+        self.size = size
+        self.pragmas = dict(pragmas or {})
+        self.health_check = health_check
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._dedicated = set()
+        self._observer = None  # Vaste verbinding die alleen PRAGMA data_version leest
+        self._observer_lock = threading.Lock()
+        self._data_version = None
+
+    def _connect(self):
+        """Opent een nieuwe verbinding en past de geconfigureerde pragma's toe."""
+        conn = sqlite3.connect(self.database_file)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if not name.isidentifier():
+                raise ValueError(f"Ongeldige pragma naam: {name}")
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
 
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
+    def _is_healthy(self, conn):
+        """Controleert of een gepoolde verbinding nog bruikbaar is."""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        """Verwijdert een verbinding uit de pool en sluit deze."""
+        with self._lock:
+            self._connections.discard(conn)
+            self._dedicated.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        """Leent de verbinding van de huidige thread uit, of opent een nieuwe."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self.health_check and not self._is_healthy(conn):
+            self._discard(conn)
+            conn = self._local.conn = None
+
+        if conn is None and getattr(self._local, 'dedicated', False):
+            return self.dedicate_thread()
+
+        if conn is None:
+            with self._lock:
+                pooled = len(self._connections) < self.size
+            conn = self._connect()
+            if not pooled:
+                return conn  # Overflow: wordt bij release gesloten
+            with self._lock:
+                self._connections.add(conn)
+            self._local.conn = conn
+        return conn
+
+    def dedicate_thread(self):
+        """
+        Geeft de huidige thread een eigen, persistente verbinding buiten de pool. Bedoeld voor
+        een achtergrondthread die de hele levensduur van het proces draait: die zou anders
+        blijvend een plek bezetten, waardoor een waitress thread op de overflow terugvalt.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            with self._lock:
+                self._dedicated.add(conn)
+            self._local.conn = conn
+        self._local.dedicated = True
+        return conn
+
+    def release(self, conn):
+        """Geeft een verbinding terug aan de pool na afloop van een request."""
+        if conn is getattr(self._local, 'conn', None):
+            if conn.in_transaction:
+                conn.rollback()  # Laat geen half afgeronde transactie achter
+            return
+        conn.close()
+
+    def data_changed(self):
+        """
+        Geeft aan of er sinds de vorige aanroep een commit op de database is gedaan, door welke
+        verbinding of welk proces dan ook. PRAGMA data_version is alleen binnen één verbinding
+        vergelijkbaar; daarom leest één vaste waarnemer hem voor de hele pool.
+        """
+        with self._observer_lock:
+            try:
+                if self._observer is None:
+                    self._observer = sqlite3.connect(self.database_file, check_same_thread=False)
+                    self._data_version = self._observer.execute('PRAGMA data_version').fetchall()[0][0]
+                    return False
+                data_version = self._observer.execute('PRAGMA data_version').fetchall()[0][0]
+            except sqlite3.Error:
+                self._close_observer()
+                return True  # Onbekend: voor de zekerheid als gewijzigd behandelen
+            changed, self._data_version = data_version != self._data_version, data_version
+            return changed
+
+    def _close_observer(self):
+        """Sluit de waarnemer (houdt _observer_lock al vast)."""
+        if self._observer is not None:
+            try:
+                self._observer.close()
+            except sqlite3.Error:
+                pass
+        self._observer = None
+
+    def close_all(self):
+        """Sluit alle gepoolde verbindingen (bijv. bij het afsluiten van de applicatie)."""
+        with self._observer_lock:
+            self._close_observer()
+        with self._lock:
+            connections, self._connections = self._connections | self._dedicated, set()
+            self._dedicated = set()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+def init_pool(app):
+    """Maakt de connectie pool aan op basis van de configuratie en registreert deze op de app."""
+    config = app.config
+    pool = ConnectionPool(
+        config['DATABASE_FILE'],
+        size=config.get('DATABASE_POOL_SIZE', 4),
+        pragmas=config.get('DATABASE_PRAGMAS'),
+        health_check=config.get('DATABASE_POOL_HEALTH_CHECK', True)
+    )
+    app.extensions['db_pool'] = pool
+    return pool
+
+def close_db(e=None):
+    """Geeft de verbinding van deze request terug aan de pool."""
+    db = g.pop('db', None)
+    if db is not None:
+        try:
+            current_app.extensions['db_pool'].release(db)
+        except sqlite3.Error as e:
+            print(f"Fout bij sluiten van de database: {e}")
+
+# --- Referentiedata Cache ---
+class ReferenceCache:
+    """
+    Read-through LRU cache voor referentiedata (kennisbank en sjablonen), die veel vaker
+    gelezen dan geschreven wordt.
 
-    def _column_exists(table_name, column_name):
-        """Controleert of een kolom bestaat in een tabel."""
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [row[1] for row in cursor.fetchall()]
-        return column_name in columns
+    De schrijffuncties in deze module invalideren hun dataset na de commit. Wijzigingen
+    van buitenaf (een ander proces, de sqlite3 shell) worden opgemerkt via PRAGMA
+    data_version: pas als die voor een verbinding verandert, wordt 'reference_versions'
+    gelezen, een tabel met per dataset een versienummer dat door triggers wordt opgehoogd.
+    Zo leiden schrijfacties op tickets niet tot het legen van de cache.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # (dataset, sleutel) -> resultaat
+        self._generations = {}          # dataset -> teller, opgehoogd bij elke invalidatie
+        self._db_versions = {}          # dataset -> laatst geziene versie uit reference_versions
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Per thread: verbinding en laatst geziene data_version
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.external_invalidations = 0
+
+    def _check_external_changes(self, db):
+        """Invalideert datasets die buiten deze cache om zijn gewijzigd."""
+        data_version = db.execute('PRAGMA data_version').fetchone()[0]
+        if getattr(self._local, 'conn', None) is db and self._local.data_version == data_version:
+            return
+        self._local.conn, self._local.data_version = db, data_version
+
+        for dataset, version in db.execute('SELECT dataset, version FROM reference_versions').fetchall():
+            with self._lock:
+                known = self._db_versions.get(dataset)
+                self._db_versions[dataset] = version
+            if known is not None and known != version:
+                self.invalidate(dataset, external=True)
+
+    def get(self, dataset, key, loader):
+        """Geeft het gecachte resultaat, of laadt het met loader(db) en bewaart het."""
+        db = get_db()
+        self._check_external_changes(db)
+        cache_key = (dataset, key)
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return self._entries[cache_key]
+            self.misses += 1
+            generation = self._generations.get(dataset, 0)
+
+        value = loader(db)
+
+        with self._lock:
+            # Niet bewaren als de dataset tijdens het laden is gewijzigd
+            if self._generations.get(dataset, 0) == generation:
+                self._entries[cache_key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, dataset, external=False, db_version=None):
+        """
+        Verwijdert alle resultaten van een dataset. Een schrijffunctie geeft de versie
+        uit reference_versions mee die zij zelf heeft veroorzaakt, zodat andere verbindingen
+        haar eigen wijziging niet nog eens als externe wijziging zien.
+        """
+        with self._lock:
+            self._generations[dataset] = self._generations.get(dataset, 0) + 1
+            if db_version is not None:
+                self._db_versions[dataset] = max(self._db_versions.get(dataset, db_version), db_version)
+            for cache_key in [k for k in self._entries if k[0] == dataset]:
+                del self._entries[cache_key]
+            if external:
+                self.external_invalidations += 1
+            else:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'external_invalidations': self.external_invalidations,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None
+            }
+
+def init_reference_cache(app):
+    """Maakt de referentiedata cache aan en registreert deze op de app."""
+    cache = ReferenceCache(app.config.get('REFERENCE_CACHE_SIZE', 256))
+    app.extensions['reference_cache'] = cache
+    return cache
+
+def _cached(dataset, key, loader):
+    """Leest via de referentiedata cache; loader(db) geeft het (onveranderlijke) resultaat."""
+    return current_app.extensions['reference_cache'].get(dataset, key, loader)
+
+def _invalidate_reference(dataset):
+    """
+    Invalideert een dataset zodra de lopende transactie is gecommit.
+    Aanroepen na de wijziging, binnen de transactie, zodat de nieuwe versie wordt gelezen.
+    """
+    cache = current_app.extensions['reference_cache']
+    row = get_db().execute('SELECT version FROM reference_versions WHERE dataset = ?', (dataset,)).fetchone()
+    version = row[0] if row else None
+    _after_commit(lambda: cache.invalidate(dataset, db_version=version))
+
+# Triggers die de zoekindex synchroon houden met 'tickets' en 'comments'.
+# Alleen echte reacties (event_type = 'comment') worden geïndexeerd, geen systeemgebeurtenissen.
+_FTS_COMMENTS_REBUILD = '''
+    UPDATE tickets_fts SET comments = (
+        SELECT group_concat(comment_text, ' ') FROM comments
+        WHERE ticket_id = {ref}.ticket_id AND event_type = 'comment'
+    ) WHERE rowid = {ref}.ticket_id;
+'''
+_FTS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS tickets_fts_ai AFTER INSERT ON tickets BEGIN
+        INSERT INTO tickets_fts (rowid, title, description, requester_name, requester_email, comments)
+        VALUES (new.id, new.title, new.description, new.requester_name, new.requester_email, NULL);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS tickets_fts_au
+    AFTER UPDATE OF title, description, requester_name, requester_email ON tickets BEGIN
+        UPDATE tickets_fts SET title = new.title, description = new.description,
+            requester_name = new.requester_name, requester_email = new.requester_email
+        WHERE rowid = new.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS tickets_fts_ad AFTER DELETE ON tickets BEGIN
+        DELETE FROM tickets_fts WHERE rowid = old.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS comments_fts_ai AFTER INSERT ON comments
+    WHEN new.event_type = 'comment' BEGIN
+        UPDATE tickets_fts SET comments = coalesce(comments || ' ', '') || new.comment_text
+        WHERE rowid = new.ticket_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS comments_fts_au AFTER UPDATE OF comment_text, event_type ON comments BEGIN
+    ''' + _FTS_COMMENTS_REBUILD.format(ref='old') + _FTS_COMMENTS_REBUILD.format(ref='new') + '''
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS comments_fts_ad AFTER DELETE ON comments
+    WHEN old.event_type = 'comment' BEGIN
+    ''' + _FTS_COMMENTS_REBUILD.format(ref='old') + '''
+    END
+    ''',
+]
+
+# Zoekindexen voor de typeahead van kennisbankartikelen en sjablonen (rowid = id van de bronrij).
+_LOOKUP_FTS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS kb_articles_fts_ai AFTER INSERT ON kb_articles BEGIN
+        INSERT INTO kb_articles_fts (rowid, title, category) VALUES (new.id, new.title, new.category);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS kb_articles_fts_au AFTER UPDATE OF title, category ON kb_articles BEGIN
+        UPDATE kb_articles_fts SET title = new.title, category = new.category WHERE rowid = new.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS kb_articles_fts_ad AFTER DELETE ON kb_articles BEGIN
+        DELETE FROM kb_articles_fts WHERE rowid = old.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS templates_fts_ai AFTER INSERT ON templates BEGIN
+        INSERT INTO templates_fts (rowid, title) VALUES (new.id, new.title);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS templates_fts_au AFTER UPDATE OF title ON templates BEGIN
+        UPDATE templates_fts SET title = new.title WHERE rowid = new.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS templates_fts_ad AFTER DELETE ON templates BEGIN
+        DELETE FROM templates_fts WHERE rowid = old.id;
+    END
+    ''',
+]
+
+# --- Rapportage Tellers ---
+# De dashboardtellingen worden bijgehouden in 'report_counters' door triggers, zodat de
+# rapportagefuncties een paar rijen lezen in plaats van een GROUP BY over de hele tabel.
+# Per dimensie: (brontabel, bronkolom, expressie voor de bucket; {ref} wordt 'new' of 'old').
+REPORT_COUNTER_DIMENSIONS = {
+    'status': ('tickets', 'status', '{ref}.status'),
+    'priority': ('tickets', 'priority', '{ref}.priority'),
+    'assignment': ('tickets', 'assigned_to', "coalesce({ref}.assigned_to, 'Unassigned')"),
+    'kb_category': ('kb_articles', 'category', '{ref}.category'),
+}
+
+def _counter_delta_sql(dimension, ref, delta):
+    """SQL die de teller van één bucket met delta (+1/-1) aanpast."""
+    bucket = REPORT_COUNTER_DIMENSIONS[dimension][2].format(ref=ref)
+    if delta > 0:
+        return (
+            f"INSERT INTO report_counters (dimension, bucket, count) VALUES ('{dimension}', {bucket}, 1) "
+            f"ON CONFLICT (dimension, bucket) DO UPDATE SET count = count + 1;"
+        )
+    return f"UPDATE report_counters SET count = count - 1 WHERE dimension = '{dimension}' AND bucket = {bucket};"
+
+def _report_counter_triggers():
+    """Genereert de INSERT/UPDATE/DELETE triggers voor alle brontabellen van de tellers."""
+    triggers = []
+    for table in ('tickets', 'kb_articles'):
+        dimensions = [d for d, (source, _, _) in REPORT_COUNTER_DIMENSIONS.items() if source == table]
+        columns = [REPORT_COUNTER_DIMENSIONS[d][1] for d in dimensions]
+        increments = '\n'.join(_counter_delta_sql(d, 'new', 1) for d in dimensions)
+        decrements = '\n'.join(_counter_delta_sql(d, 'old', -1) for d in dimensions)
+        triggers.append(f"CREATE TRIGGER IF NOT EXISTS {table}_counters_ai AFTER INSERT ON {table} BEGIN\n{increments}\nEND")
+        triggers.append(f"CREATE TRIGGER IF NOT EXISTS {table}_counters_ad AFTER DELETE ON {table} BEGIN\n{decrements}\nEND")
+        triggers.append(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_counters_au AFTER UPDATE OF {', '.join(columns)} ON {table} "
+            f"BEGIN\n{decrements}\n{increments}\nEND"
+        )
+    return triggers
+
+def _report_counter_source_sql(where=''):
+    """
+    De GROUP BY queries waaruit de tellers zijn af te leiden (voor controle en herbouw).
+    Een optionele WHERE clausule wordt per brontabel herhaald; de parameters dus ook.
+    """
+    queries = []
+    for dimension, (table, _, bucket) in REPORT_COUNTER_DIMENSIONS.items():
+        expr = bucket.format(ref=table)
+        queries.append(f"SELECT '{dimension}', {expr}, COUNT(*) FROM {table} {where} GROUP BY {expr}")
+    return ' UNION ALL '.join(queries)
 
-    # --- TABELDEFINITIES ---
-    cursor.execute('''
+# --- Schema Migraties ---
+# Elke migratie heeft een oplopend versienummer dat na afloop in PRAGMA user_version wordt
+# vastgelegd. De schema-stap draait in één transactie; een optionele backfill-stap draait
+# daarna in batches van MIGRATION_BATCH_SIZE rijen, elk in een eigen korte transactie, zodat
+# de schrijflock op grote databases niet minutenlang wordt vastgehouden. Beide stappen zijn
+# idempotent, zodat een onderbroken migratie bij de volgende start gewoon wordt hervat.
+
+def _column_exists(conn, table_name, column_name):
+    """Controleert of een kolom bestaat in een tabel."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+    return column_name in columns
+
+def _run_in_batches(conn, sql, batch_size, table='tickets'):
+    """
+    Voert een backfill uit per id-bereik. De SQL krijgt twee parameters: (vanaf_id, tot_en_met_id).
+    Elke batch is een eigen transactie, zodat andere schrijvers tussendoor aan de beurt komen.
+    """
+    low, high = conn.execute(f'SELECT MIN(id), MAX(id) FROM {table}').fetchone()
+    if low is None:
+        return
+    start = low - 1
+    while start < high:
+        end = start + batch_size
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(sql, (start, end))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        start = end
+
+def _migrate_base_schema(conn):
+    """Basistabellen, inclusief de kolommen die vóór het migratiesysteem zijn toegevoegd."""
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS tickets (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
@@ -33,7 +484,7 @@ def init_db(config):
             sensitive_notes TEXT
         )
     ''')
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS comments (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             ticket_id INTEGER NOT NULL,
@@ -43,7 +494,7 @@ def init_db(config):
             FOREIGN KEY (ticket_id) REFERENCES tickets(id) ON DELETE CASCADE
         )
     ''')
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS kb_articles (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
@@ -53,7 +504,7 @@ def init_db(config):
             updated_at TEXT NOT NULL
         )
     ''')
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS templates (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
@@ -61,59 +512,539 @@ def init_db(config):
         )
     ''')
 
-    # --- KOLOMMEN BIJWERKEN (voor upgrades) ---
-    # Controleer of de kolom bestaat voordat je deze toevoegt
-    if not _column_exists('tickets', 'kb_article_id'):
-        print("Migratie: Kolom 'kb_article_id' wordt toegevoegd aan 'tickets' tabel...")
-        cursor.execute("ALTER TABLE tickets ADD COLUMN kb_article_id INTEGER REFERENCES kb_articles(id) ON DELETE SET NULL")
+    # Databases van vóór het migratiesysteem kunnen deze kolommen al hebben
+    if not _column_exists(conn, 'tickets', 'kb_article_id'):
+        conn.execute("ALTER TABLE tickets ADD COLUMN kb_article_id INTEGER REFERENCES kb_articles(id) ON DELETE SET NULL")
+    if not _column_exists(conn, 'comments', 'event_type'):
+        conn.execute("ALTER TABLE comments ADD COLUMN event_type TEXT DEFAULT 'comment'")
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_comments_ticket_id ON comments (ticket_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_kb_articles_category ON kb_articles (category)')
+
+def _migrate_list_indexes(conn):
+    """
+    Covering indexes voor de ticketlijsten: bevatten alle kolommen uit _TICKET_SUMMARY_COLUMNS,
+    zodat een lijstpagina volledig uit de index wordt beantwoord zonder de tabel te lezen.
+    """
+    conn.execute('DROP INDEX IF EXISTS idx_tickets_status')
+    conn.execute('DROP INDEX IF EXISTS idx_tickets_created_at')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tickets_status_created
+        ON tickets (status, created_at, priority, assigned_to, requester_name, title)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tickets_created_list
+        ON tickets (created_at, status, assigned_to, priority, requester_name, title)
+    ''')
+    # Dient zowel 'Mijn Tickets' (assigned_to = ?) als 'Niet-toegewezen' (assigned_to IS NULL)
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tickets_assigned_list
+        ON tickets (assigned_to, created_at, status, priority, requester_name, title)
+    ''')
+
+def _migrate_rank_columns(conn):
+    """Opgeslagen sorteerrang voor prioriteit en status, met bijbehorende indexes."""
+    if not _column_exists(conn, 'tickets', 'priority_rank'):
+        conn.execute("ALTER TABLE tickets ADD COLUMN priority_rank INTEGER")
+    if not _column_exists(conn, 'tickets', 'status_rank'):
+        conn.execute("ALTER TABLE tickets ADD COLUMN status_rank INTEGER")
+
+    # Sorteren op prioriteit of status (workflow volgorde) loopt deze indexes op volgorde af
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tickets_priority_list
+        ON tickets (priority_rank, created_at, status, assigned_to, priority, requester_name, title)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tickets_status_rank_list
+        ON tickets (status_rank, created_at, status, assigned_to, priority, requester_name, title)
+    ''')
+
+def _backfill_rank_columns(conn, batch_size):
+    """Vult priority_rank en status_rank voor bestaande tickets."""
+    _run_in_batches(conn, f'''
+        UPDATE tickets SET
+            priority_rank = {_rank_case_sql('priority', PRIORITY_RANKS)},
+            status_rank = {_rank_case_sql('status', STATUS_RANKS)}
+        WHERE id > ? AND id <= ? AND (priority_rank IS NULL OR status_rank IS NULL)
+    ''', batch_size)
+
+def _migrate_fts_index(conn):
+    """Full-text zoekindex (FTS5) met triggers die hem synchroon houden."""
+    # Eén rij per ticket (rowid = ticket id) met de doorzoekbare velden en alle reacties.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+            title, description, requester_name, requester_email, comments,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    for trigger_sql in _FTS_TRIGGERS:
+        conn.execute(trigger_sql)
+
+def _backfill_fts_index(conn, batch_size):
+    """Vult de zoekindex met bestaande tickets; al geïndexeerde tickets worden overgeslagen."""
+    _run_in_batches(conn, '''
+        INSERT INTO tickets_fts (rowid, title, description, requester_name, requester_email, comments)
+        SELECT t.id, t.title, t.description, t.requester_name, t.requester_email,
+               (SELECT group_concat(c.comment_text, ' ') FROM comments c
+                WHERE c.ticket_id = t.id AND c.event_type = 'comment')
+        FROM tickets t
+        WHERE t.id > ? AND t.id <= ? AND t.id NOT IN (SELECT rowid FROM tickets_fts)
+    ''', batch_size)
+
+def _migrate_report_counters(conn):
+    """Tellertabel voor de rapportages met de triggers die hem bijhouden."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS report_counters (
+            dimension TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, bucket)
+        ) WITHOUT ROWID
+    ''')
+    for trigger_sql in _report_counter_triggers():
+        conn.execute(trigger_sql)
+    _rebuild_report_counters(conn)
+
+def _migrate_timeline_index(conn):
+    """Index voor de gepagineerde tijdlijn; vervangt de index op alleen ticket_id."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_comments_timeline ON comments (ticket_id, created_at, id)')
+    conn.execute('DROP INDEX IF EXISTS idx_comments_ticket_id')
+
+def _migrate_analytics_rollup(conn):
+    """
+    Dagelijkse rollup voor de trend- en SLA-analyses (zie analytics.py).
+    Per (dag, prioriteit, medewerker) het aantal aangemaakte en opgeloste tickets, plus de
+    losse doorlooptijden in seconden als float64 array, zodat percentielen over elke
+    periode exact te berekenen zijn. 'analytics_state' onthoudt tot welke dag de rollup klaar is.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_daily (
+            day TEXT NOT NULL,
+            priority TEXT NOT NULL,
+            agent TEXT NOT NULL,
+            created INTEGER NOT NULL DEFAULT 0,
+            resolved INTEGER NOT NULL DEFAULT 0,
+            first_response BLOB,
+            resolution BLOB,
+            PRIMARY KEY (day, priority, agent)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_state (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    # De rollup leest de events per dagbereik; zonder deze index is dat een volledige tabelscan
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_comments_created ON comments (created_at)')
+
+def _migrate_kb_html(conn):
+    """Opgeslagen HTML van kennisbankartikelen, met de versie van de renderer die hem maakte."""
+    if not _column_exists(conn, 'kb_articles', 'content_html'):
+        conn.execute('ALTER TABLE kb_articles ADD COLUMN content_html TEXT')
+    if not _column_exists(conn, 'kb_articles', 'content_html_version'):
+        conn.execute('ALTER TABLE kb_articles ADD COLUMN content_html_version TEXT')
 
-    if not _column_exists('comments', 'event_type'):
-        print("Migratie: Kolom 'event_type' wordt toegevoegd aan 'comments' tabel...")
-        cursor.execute("ALTER TABLE comments ADD COLUMN event_type TEXT DEFAULT 'comment'")
+def _migrate_lookup_fts(conn):
+    """Zoekindexen (FTS5, met prefix-indexen) op de titels van artikelen en sjablonen."""
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS kb_articles_fts USING fts5(
+            title, category,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    ''')
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS templates_fts USING fts5(
+            title,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    ''')
+    for trigger_sql in _LOOKUP_FTS_TRIGGERS:
+        conn.execute(trigger_sql)
 
-    # --- DATABASE INDEXES ---
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets (status)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tickets_created_at ON tickets (created_at)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_comments_ticket_id ON comments (ticket_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_kb_articles_category ON kb_articles (category)')
+def _migrate_reference_versions(conn):
+    """
+    Versienummer per referentiedataset, opgehoogd door triggers bij elke wijziging.
+    Hiermee ziet de ReferenceCache ook wijzigingen die buiten de applicatie om zijn gedaan.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reference_versions (
+            dataset TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for dataset in ('kb_articles', 'templates'):
+        conn.execute('INSERT OR IGNORE INTO reference_versions (dataset, version) VALUES (?, 0)', (dataset,))
+        for suffix, event in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE')):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {dataset}_version_{suffix} AFTER {event} ON {dataset} BEGIN
+                    UPDATE reference_versions SET version = version + 1 WHERE dataset = '{dataset}';
+                END
+            ''')
 
-    conn.commit()
-    conn.close()
+def _migrate_change_feed(conn):
+    """
+    Compacte wijzigingsfeed voor de live ticketlijst: één rij per wijziging aan een ticket.
+    De oplopende id dient als positie in de feed (Last-Event-ID van /changes).
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+
+def _migrate_ticket_keys(conn):
+    """
+    Omhulde data keys voor envelope encryptie van de gevoelige notities, één per ticket.
+    master_key_id geeft aan met welke hoofdsleutel de data key is omhuld; de index
+    laat het rotatiecommando de nog niet omgezette sleutels direct vinden.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ticket_keys (
+            ticket_id INTEGER PRIMARY KEY REFERENCES tickets (id),
+            wrapped_key TEXT NOT NULL,
+            master_key_id TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ticket_keys_master ON ticket_keys (master_key_id, ticket_id)')
+
+def _migrate_notes_index(conn):
+    """
+    Blind index over de versleutelde notities: HMAC tokens van de termen per ticket.
+    Wordt gevuld bij het aanmaken van tickets en met 'flask rebuild-notes-index'
+    (dat het hoofdwachtwoord nodig heeft, dus geen backfill hier).
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notes_index (
+            token BLOB NOT NULL,
+            ticket_id INTEGER NOT NULL,
+            PRIMARY KEY (token, ticket_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_index_ticket ON notes_index (ticket_id)')
+
+def _migrate_attachments(conn):
+    """
+    Metadata van bijlagen; de inhoud staat als blobs op schijf (zie attachments.py).
+    attachment_blobs heeft één rij per unieke inhoud, attachments één per geüpload bestand.
+    Versleutelde blobs hebben een omhulde data key, net als ticket_keys.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attachment_blobs (
+            id TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            chunk_size INTEGER,
+            wrapped_key TEXT,
+            master_key_id TEXT,
+            created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_attachment_blobs_master ON attachment_blobs (master_key_id, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL REFERENCES tickets (id),
+            comment_id INTEGER REFERENCES comments (id),
+            blob_id TEXT NOT NULL REFERENCES attachment_blobs (id),
+            filename TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            uploaded_by TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_attachments_ticket ON attachments (ticket_id, id)')
+
+def _migrate_print_jobs(conn):
+    """
+    Wachtrij voor de printer. Een job wordt samen met het ticket geschreven en door de
+    print spooler afgewerkt; next_attempt_at is het moment van de (volgende) poging, of
+    bij 'printing' het einde van de claim van de worker die hem afdrukt.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS print_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL REFERENCES tickets (id),
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_print_jobs_due ON print_jobs (status, next_attempt_at)')
+
+def _migrate_attachment_id_key(conn):
+    """
+    Eén willekeurige sleutel voor de namen van versleutelde blobs, omhuld met de hoofdsleutel.
+    Bij een rotatie wordt alleen de omhulling vernieuwd, zodat dezelfde inhoud dezelfde naam houdt.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attachment_id_keys (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            wrapped_key TEXT NOT NULL,
+            master_key_id TEXT NOT NULL
+        )
+    ''')
+
+def _backfill_lookup_fts(conn, batch_size):
+    """Vult de zoekindexen met bestaande artikelen en sjablonen."""
+    _run_in_batches(conn, '''
+        INSERT INTO kb_articles_fts (rowid, title, category)
+        SELECT id, title, category FROM kb_articles
+        WHERE id > ? AND id <= ? AND id NOT IN (SELECT rowid FROM kb_articles_fts)
+    ''', batch_size, table='kb_articles')
+    _run_in_batches(conn, '''
+        INSERT INTO templates_fts (rowid, title)
+        SELECT id, title FROM templates
+        WHERE id > ? AND id <= ? AND id NOT IN (SELECT rowid FROM templates_fts)
+    ''', batch_size, table='templates')
+
+# (versie, omschrijving, schema-stap, backfill-stap of None). Voeg nieuwe migraties alleen
+# achteraan toe en pas bestaande nooit aan; databases in het veld hebben ze al uitgevoerd.
+MIGRATIONS = [
+    (1, "Basisschema", _migrate_base_schema, None),
+    (2, "Covering indexes voor ticketlijsten", _migrate_list_indexes, None),
+    (3, "Sorteerrang voor prioriteit en status", _migrate_rank_columns, _backfill_rank_columns),
+    (4, "Full-text zoekindex", _migrate_fts_index, _backfill_fts_index),
+    (5, "Rapportage tellers", _migrate_report_counters, None),
+    (6, "Tijdlijn index voor commentaren", _migrate_timeline_index, None),
+    (7, "Dagelijkse rollup voor analyses", _migrate_analytics_rollup, None),
+    (8, "Opgeslagen HTML voor kennisbankartikelen", _migrate_kb_html, None),
+    (9, "Zoekindex voor artikelen en sjablonen", _migrate_lookup_fts, _backfill_lookup_fts),
+    (10, "Versies van referentiedata", _migrate_reference_versions, None),
+    (11, "Wijzigingsfeed voor live updates", _migrate_change_feed, None),
+    (12, "Data keys voor envelope encryptie", _migrate_ticket_keys, None),
+    (13, "Blind index voor vertrouwelijke notities", _migrate_notes_index, None),
+    (14, "Bijlagen", _migrate_attachments, None),
+    (15, "Printwachtrij", _migrate_print_jobs, None),
+    (16, "Sleutel voor namen van versleutelde bijlagen", _migrate_attachment_id_key, None),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def init_db(config):
+    """
+    Brengt het databaseschema op de laatste versie.
+    Als het schema al actueel is, kost dit alleen het uitlezen van PRAGMA user_version.
+    """
+    DATABASE_FILE = config['DATABASE_FILE']
+    os.makedirs(os.path.dirname(DATABASE_FILE), exist_ok=True)
+
+    # Autocommit modus: de runner beheert de transacties zelf met BEGIN/COMMIT
+    conn = sqlite3.connect(DATABASE_FILE, isolation_level=None)
+    try:
+        current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if current_version >= SCHEMA_VERSION:
+            if current_version > SCHEMA_VERSION:
+                print(f"Waarschuwing: databaseschema (versie {current_version}) is nieuwer dan deze applicatie ({SCHEMA_VERSION}).")
+            return
+
+        batch_size = config.get('MIGRATION_BATCH_SIZE', 5000)
+        for version, description, migrate, backfill in MIGRATIONS:
+            if version <= current_version:
+                continue
+            started = time.perf_counter()
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                migrate(conn)
+                if backfill is None:
+                    conn.execute(f'PRAGMA user_version = {version}')
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+            if backfill is not None:
+                backfill(conn, batch_size)
+                conn.execute(f'PRAGMA user_version = {version}')
+
+            elapsed = time.perf_counter() - started
+            print(f"Migratie {version}: {description} ({elapsed:.2f}s)")
+    finally:
+        conn.close()
 
 def get_db():
-    """Retourneert de database connectie uit de globale context 'g'."""
+    """
+    Retourneert de database connectie voor de huidige request.
+    De verbinding wordt pas bij het eerste gebruik uit de pool geleend, zodat
+    requests zonder databasewerk (zoals statische bestanden) er niets voor betalen.
+    """
+    if 'db' not in g:
+        g.db = current_app.extensions['db_pool'].acquire()
     return g.db
 
-def log_event(ticket_id, author, text, event_type='event'):
+# --- Revisieteller ---
+# Monotone teller die na elke commit van transaction() wordt opgehoogd. Pagina's gebruiken
+# hem in hun ETag: zolang de revisie niet verandert, is een eerder geleverde pagina nog actueel.
+# Het token per proces voorkomt dat een ETag van vóór een herstart weer geldig wordt.
+# Schrijfacties buiten transaction() om (CLI commando's, een ander proces) worden opgemerkt
+# doordat de waarnemer van de pool (ConnectionPool.data_changed) een nieuwe data_version ziet.
+# Een commit van transaction() verwerkt die wijziging zelf, zodat één schrijfactie de revisie
+# één keer ophoogt en niet nog eens per waitress thread.
+_revision = 0
+_revision_token = os.urandom(4).hex()
+_revision_lock = threading.Lock()
+
+def _bump_revision():
+    global _revision
+    with _revision_lock:
+        _revision += 1
+
+def current_revision():
+    """Geeft de huidige revisie van de database als korte string, voor gebruik in ETags."""
+    if current_app.extensions['db_pool'].data_changed():
+        _bump_revision()
+    return f'{_revision_token}-{_revision}'
+
+# --- Unit of Work ---
+@contextmanager
+def transaction():
     """
-    Logt een evenement aan een ticket.
-    Controleert eerst of de databaseverbinding bestaat voordat het probeert te schrijven.
+    Bundelt alle schrijfacties binnen het blok tot één transactie met één commit.
+
+    Geneste aanroepen sluiten aan bij de buitenste transactie, zodat een route die
+    meerdere databasefuncties aanroept nog steeds precies één keer commit. Audit
+    events van log_event() worden verzameld en vlak voor de commit in één keer
+    weggeschreven, net als de wijzigingen van record_change(). Bij een fout wordt
+    alles teruggedraaid, inclusief de events. Callbacks van _after_commit() draaien
+    pas na een geslaagde commit, die van _on_rollback() vlak vóór een rollback. De
+    revisie (en daarmee elke ETag) wordt alleen opgehoogd als de transactie echt rijen
+    heeft gewijzigd.
     """
+    db = get_db()
+    depth = g.get('_tx_depth', 0)
+    if depth == 0:
+        changes_before = db.total_changes
+        g._pending_events = []
+        g._pending_changes = []
+        g._after_commit_callbacks = []
+        g._rollback_callbacks = []
+    g._tx_depth = depth + 1
     try:
-        db = get_db()
-        now = datetime.now().isoformat()
-        db.execute(
+        yield db
+        if depth == 0:
+            _flush_events(db)
+            db.commit()
+    except BaseException:
+        if depth == 0:
+            g._pending_events = []
+            g._pending_changes = []
+            g._after_commit_callbacks = []
+            callbacks, g._rollback_callbacks = g._rollback_callbacks, []
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Fout bij opruimen na rollback: {e}")
+            db.rollback()
+        raise
+    finally:
+        g._tx_depth = depth
+
+    if depth == 0:
+        g._rollback_callbacks = []
+        if db.total_changes != changes_before:
+            current_app.extensions['db_pool'].data_changed()  # Onze eigen commit, zie current_revision()
+            _bump_revision()
+        callbacks, g._after_commit_callbacks = g._after_commit_callbacks, []
+        for callback in callbacks:
+            callback()
+
+def _after_commit(callback):
+    """Voert callback uit na de commit van de lopende transactie (of direct, buiten een transactie)."""
+    if g.get('_tx_depth', 0) > 0:
+        g._after_commit_callbacks.append(callback)
+    else:
+        callback()
+
+def _on_rollback(callback):
+    """
+    Voert callback uit als de lopende transactie wordt teruggedraaid, nog vóór de rollback
+    zelf: de schrijflock is dan nog van ons. Voor bijwerkingen buiten de database.
+    """
+    if g.get('_tx_depth', 0) > 0:
+        g._rollback_callbacks.append(callback)
+
+def _flush_events(db):
+    """Schrijft de verzamelde audit events en feedwijzigingen weg binnen de lopende transactie."""
+    events = g.get('_pending_events')
+    if events:
+        db.executemany(
             'INSERT INTO comments (ticket_id, author, comment_text, created_at, event_type) VALUES (?, ?, ?, ?, ?)',
-            (ticket_id, author, text, now, event_type)
+            events
         )
-        db.commit()
-    except sqlite3.Error as e:
-        print(f"Fout bij loggen van evenement: {e}")
+        g._pending_events = []
+
+    changes = g.get('_pending_changes')
+    if changes:
+        db.executemany('INSERT INTO changes (ticket_id, kind, created_at) VALUES (?, ?, ?)', changes)
+        # De feed is alleen bedoeld om open pagina's bij te werken; oudere rijen mogen weg.
+        # Een range-delete op de primary key, dus goedkoop bij elke commit.
+        retention = current_app.config.get('CHANGES_RETENTION', 1000)
+        db.execute(
+            'DELETE FROM changes WHERE id <= (SELECT max(id) FROM changes) - ?', (retention,)
+        )
+        g._pending_changes = []
+
+def record_change(ticket_id, kind):
+    """
+    Zet een wijziging aan een ticket in de feed voor de live ticketlijst ('created',
+    'assigned', 'status', 'commented', 'kb_linked' of 'attached'). Net als log_event()
+    wordt de wijziging pas met de lopende transactie gecommit.
+    """
+    with transaction():
+        g._pending_changes.append((ticket_id, kind, datetime.now().isoformat()))
+
+def log_event(ticket_id, author, text, event_type='event'):
+    """
+    Logt een evenement aan een ticket.
+    Het event wordt onderdeel van de lopende transactie en samen met de wijziging gecommit.
+    """
+    with transaction():
+        now = datetime.now().isoformat()
+        g._pending_events.append((ticket_id, author, text, now, event_type))
 
 # --- Ticket Functies ---
-def create_ticket(title, description, name, email, phone, priority, sensitive_notes):
-    """Maakt een nieuw ticket aan."""
+def create_ticket(title, description, name, email, phone, priority, sensitive_notes, wrapped_key=None, master_key_id=None,
+                  notes_tokens=(), print_ticket=False):
+    """
+    Maakt een nieuw ticket aan.
+    wrapped_key en master_key_id horen bij notities van utils.encrypt_notes() en worden
+    in dezelfde transactie in ticket_keys opgeslagen, net als de blind index tokens.
+    Met print_ticket komt er in dezelfde transactie een job in de printwachtrij.
+    """
     try:
-        db = get_db()
-        now = datetime.now().isoformat()
+        with transaction() as db:
+            now = datetime.now().isoformat()
 
-        cursor = db.execute(
-            'INSERT INTO tickets (title, description, requester_name, requester_email, requester_phone, status, priority, created_at, updated_at, sensitive_notes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-            (title, description, name, email, phone, 'New', priority, now, now, sensitive_notes)
-        )
-        db.commit()
-        ticket_id = cursor.lastrowid
-        log_event(ticket_id, "Systeem", "Ticket aangemaakt.")
+            cursor = db.execute(
+                'INSERT INTO tickets (title, description, requester_name, requester_email, requester_phone, status, priority, created_at, updated_at, sensitive_notes, priority_rank, status_rank) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (title, description, name, email, phone, 'New', priority, now, now, sensitive_notes, priority_rank(priority), status_rank('New'))
+            )
+            ticket_id = cursor.lastrowid
+            if wrapped_key:
+                db.execute(
+                    'INSERT INTO ticket_keys (ticket_id, wrapped_key, master_key_id) VALUES (?, ?, ?)',
+                    (ticket_id, wrapped_key, master_key_id)
+                )
+            if notes_tokens:
+                db.executemany(
+                    'INSERT OR IGNORE INTO notes_index (token, ticket_id) VALUES (?, ?)',
+                    [(token, ticket_id) for token in notes_tokens]
+                )
+            if print_ticket:
+                db.execute(
+                    'INSERT INTO print_jobs (ticket_id, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                    (ticket_id, now, now, now)
+                )
+                _after_commit(_wake_print_spooler)
+            log_event(ticket_id, "Systeem", "Ticket aangemaakt.")
+            record_change(ticket_id, 'created')
         return ticket_id
     except sqlite3.Error as e:
         print(f"Fout bij aanmaken van ticket: {e}")
@@ -122,36 +1053,52 @@ def create_ticket(title, description, name, email, phone, priority, sensitive_no
 def assign_ticket(ticket_id, user_name, old_assignee):
     """Wijs een ticket toe aan een gebruiker."""
     try:
-        db = get_db()
-        now = datetime.now().isoformat()
+        with transaction() as db:
+            now = datetime.now().isoformat()
 
-        from_text = f"van '{old_assignee}'" if old_assignee else "van 'Niet toegewezen'"
-        db.execute(
-            'UPDATE tickets SET assigned_to = ?, status = \'In Progress\', updated_at = ? WHERE id = ?',
-            (user_name, now, ticket_id)
-        )
-        log_event(ticket_id, user_name, f"Ticket toegewezen {from_text} naar '{user_name}'.")
+            from_text = f"van '{old_assignee}'" if old_assignee else "van 'Niet toegewezen'"
+            db.execute(
+                'UPDATE tickets SET assigned_to = ?, status = \'In Progress\', status_rank = ?, updated_at = ? WHERE id = ?',
+                (user_name, status_rank('In Progress'), now, ticket_id)
+            )
+            log_event(ticket_id, user_name, f"Ticket toegewezen {from_text} naar '{user_name}'.")
+            record_change(ticket_id, 'assigned')
     except sqlite3.Error as e:
         print(f"Fout bij toewijzing van ticket: {e}")
         raise
 
-def update_ticket(ticket_id, new_status, comment, author, old_status):
-    """Werkt de status en/of commentaren van een ticket bij."""
+def update_ticket(ticket_id, new_status, comment, author, old_status, uploads=()):
+    """
+    Werkt de status en/of commentaren van een ticket bij.
+    Bijlagen (uploads van attachments.receive) horen bij de reactie, of zonder reactie bij het ticket.
+    """
     try:
-        db = get_db()
-        now = datetime.now().isoformat()
+        with transaction() as db:
+            now = datetime.now().isoformat()
 
-        if old_status != new_status:
-            db.execute(
-                'UPDATE tickets SET status = ?, updated_at = ? WHERE id = ?',
-                (new_status, now, ticket_id)
-            )
-            log_event(ticket_id, author, f"Status gewijzigd van '{old_status}' naar '{new_status}'.")
+            if old_status != new_status:
+                db.execute(
+                    'UPDATE tickets SET status = ?, status_rank = ?, updated_at = ? WHERE id = ?',
+                    (new_status, status_rank(new_status), now, ticket_id)
+                )
+                log_event(ticket_id, author, f"Status gewijzigd van '{old_status}' naar '{new_status}'.")
+                record_change(ticket_id, 'status')
 
-        if comment:
-            log_event(ticket_id, author, comment, event_type='comment')
+            if comment:
+                log_event(ticket_id, author, comment, event_type='comment')
+                record_change(ticket_id, 'commented')
 
-        db.commit()
+            if uploads:
+                comment_id = None
+                if comment:
+                    # De reactie naar de database schrijven om zijn id te kennen; binnen de
+                    # schrijftransactie is de hoogste id van dit ticket gegarandeerd de onze
+                    _flush_events(db)
+                    comment_id = db.execute(
+                        "SELECT max(id) FROM comments WHERE ticket_id = ? AND event_type = 'comment'",
+                        (ticket_id,)
+                    ).fetchone()[0]
+                _add_attachments(db, ticket_id, comment_id, uploads, author, now)
     except sqlite3.Error as e:
         print(f"Fout bij updaten van ticket: {e}")
         raise
@@ -159,56 +1106,283 @@ def update_ticket(ticket_id, new_status, comment, author, old_status):
 def link_kb_article(ticket_id, kb_article_id, kb_article_title, author):
     """Koppelt een kennisbankartikel aan een ticket."""
     try:
-        db = get_db()
-        now = datetime.now().isoformat()
+        with transaction() as db:
+            now = datetime.now().isoformat()
+
+            db.execute(
+                'UPDATE tickets SET kb_article_id = ?, updated_at = ? WHERE id = ?',
+                (kb_article_id, now, ticket_id)
+            )
+            log_event(ticket_id, author, f"Kennisbank artikel #{kb_article_id} ('{kb_article_title}') gekoppeld.")
+            record_change(ticket_id, 'kb_linked')
+    except sqlite3.Error as e:
+        print(f"Fout bij koppelen van kennisbankartikel: {e}")
+        raise
 
+# --- Bijlage Functies ---
+def _add_attachments(db, ticket_id, comment_id, uploads, author, now):
+    """
+    Legt geüploade bestanden vast binnen de lopende transactie. Een blob met dezelfde inhoud
+    bestaat hooguit één keer; alleen de transactie die de blob-rij aanmaakt, zet het bestand neer
+    en haalt het weer weg als de transactie alsnog wordt teruggedraaid.
+    """
+    for upload in uploads:
+        is_new = db.execute(
+            'INSERT OR IGNORE INTO attachment_blobs (id, size, chunk_size, wrapped_key, master_key_id, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (upload['blob_id'], upload['size'], upload['chunk_size'], upload['wrapped_key'], upload['master_key_id'], now)
+        ).rowcount == 1
+        attachments.place(upload, is_new)
+        if is_new:
+            # Zonder commit verwijst niets naar het bestand; weg ermee zolang wij de schrijflock hebben
+            _on_rollback(functools.partial(attachments.remove, upload['blob_id']))
         db.execute(
-            'UPDATE tickets SET kb_article_id = ?, updated_at = ? WHERE id = ?',
-            (kb_article_id, now, ticket_id)
+            'INSERT INTO attachments (ticket_id, comment_id, blob_id, filename, content_type, size, uploaded_by, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (ticket_id, comment_id, upload['blob_id'], upload['filename'], upload['content_type'], upload['size'], author, now)
         )
-        log_event(ticket_id, author, f"Kennisbank artikel #{kb_article_id} ('{kb_article_title}') gekoppeld.")
+    if comment_id is None:
+        names = ', '.join(f"'{upload['filename']}'" for upload in uploads)
+        log_event(ticket_id, author, f"Bijlage(n) toegevoegd: {names}.")
+    record_change(ticket_id, 'attached')
+
+def add_ticket_attachments(ticket_id, uploads, author):
+    """Voegt bijlagen toe aan een ticket (niet aan een specifieke reactie)."""
+    try:
+        with transaction() as db:
+            _add_attachments(db, ticket_id, None, uploads, author, datetime.now().isoformat())
     except sqlite3.Error as e:
-        print(f"Fout bij koppelen van kennisbankartikel: {e}")
+        print(f"Fout bij toevoegen van bijlagen: {e}")
+        raise
+
+def get_attachment_id_key(master_key):
+    """
+    De sleutel voor de namen van versleutelde blobs (zie attachments.receive). Wordt bij het
+    eerste gebruik willekeurig gemaakt en omhuld met de hoofdsleutel bewaard; rotate-master-key
+    omhult hem opnieuw, zodat ontdubbelen ook na een rotatie blijft werken.
+    """
+    from cryptography.fernet import Fernet
+    fernet = Fernet(master_key)
+    try:
+        with transaction() as db:
+            row = db.execute('SELECT wrapped_key FROM attachment_id_keys WHERE id = 1').fetchone()
+            if row is None:
+                db.execute(
+                    'INSERT OR IGNORE INTO attachment_id_keys (id, wrapped_key, master_key_id) VALUES (1, ?, ?)',
+                    (fernet.encrypt(os.urandom(32)).decode(), utils.master_key_id(master_key))
+                )
+                row = db.execute('SELECT wrapped_key FROM attachment_id_keys WHERE id = 1').fetchone()
+    except sqlite3.Error as e:
+        print(f"Fout bij ophalen van de sleutel voor bijlagen: {e}")
+        raise
+    return fernet.decrypt(row['wrapped_key'].encode())
+
+def get_attachments_for_ticket(ticket_id):
+    """Haalt de metadata van alle bijlagen van een ticket op, oudste eerst."""
+    try:
+        return get_db().execute(
+            'SELECT id, comment_id, filename, content_type, size, uploaded_by, created_at '
+            'FROM attachments WHERE ticket_id = ? ORDER BY id',
+            (ticket_id,)
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Fout bij ophalen van bijlagen: {e}")
+        raise
+
+def get_attachment(attachment_id):
+    """Haalt één bijlage op met de gegevens van de blob die nodig zijn om hem te openen."""
+    try:
+        return get_db().execute(
+            'SELECT a.*, b.chunk_size, b.wrapped_key FROM attachments a '
+            'JOIN attachment_blobs b ON b.id = a.blob_id WHERE a.id = ?',
+            (attachment_id,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Fout bij ophalen van bijlage: {e}")
+        raise
+
+# --- Printwachtrij ---
+PRINT_JOB_STATUSES = ('pending', 'printing', 'failed')
+
+def _wake_print_spooler():
+    spooler = current_app.extensions.get('print_spooler')
+    if spooler is not None:
+        spooler.wake()
+
+def claim_print_job(lease_seconds):
+    """
+    Claimt de oudste job die aan de beurt is: een wachtende job, of een job waarvan de claim
+    is verlopen omdat de worker (of het hele proces) tijdens het printen is gestopt.
+    De claim loopt lease_seconds; retourneert de job, of None als er niets te doen is.
+    """
+    now = datetime.now()
+    try:
+        with transaction() as db:
+            rows = db.execute('''
+                UPDATE print_jobs
+                SET status = 'printing', attempts = attempts + 1, next_attempt_at = ?, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM print_jobs
+                    WHERE status IN ('pending', 'printing') AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at, id
+                    LIMIT 1
+                )
+                RETURNING *
+            ''', ((now + timedelta(seconds=lease_seconds)).isoformat(), now.isoformat(), now.isoformat())).fetchall()
+        return rows[0] if rows else None
+    except sqlite3.Error as e:
+        print(f"Fout bij claimen van printjob: {e}")
+        raise
+
+def finish_print_job(job_id, error=None, retry_at=None):
+    """
+    Legt de uitkomst van een printpoging vast. Een geslaagde job verdwijnt uit de wachtrij;
+    bij een fout wordt hij op retry_at opnieuw geprobeerd, of zonder retry_at definitief 'failed'.
+    """
+    now = datetime.now().isoformat()
+    try:
+        with transaction() as db:
+            if error is None:
+                db.execute('DELETE FROM print_jobs WHERE id = ?', (job_id,))
+            else:
+                db.execute(
+                    'UPDATE print_jobs SET status = ?, last_error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?',
+                    ('pending' if retry_at else 'failed', error, retry_at or now, now, job_id)
+                )
+    except sqlite3.Error as e:
+        print(f"Fout bij bijwerken van printjob: {e}")
+        raise
+
+def retry_print_job(job_id):
+    """Zet een mislukte job terug in de wachtrij, met een nieuwe reeks pogingen. True als dat lukte."""
+    now = datetime.now().isoformat()
+    try:
+        with transaction() as db:
+            updated = db.execute(
+                "UPDATE print_jobs SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'failed'",
+                (now, now, job_id)
+            ).rowcount
+            if updated:
+                _after_commit(_wake_print_spooler)
+        return updated == 1
+    except sqlite3.Error as e:
+        print(f"Fout bij opnieuw aanbieden van printjob: {e}")
+        raise
+
+def next_print_job_at():
+    """Tijdstip (ISO) waarop de eerstvolgende job aan de beurt is of zijn claim verloopt, of None."""
+    try:
+        return get_db().execute(
+            "SELECT min(next_attempt_at) FROM print_jobs WHERE status IN ('pending', 'printing')"
+        ).fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Fout bij ophalen van de printwachtrij: {e}")
+        raise
+
+def get_print_jobs(limit=200):
+    """Alle jobs die nog in de wachtrij staan (wachtend, bezig of mislukt), met aantallen per status."""
+    try:
+        db = get_db()
+        jobs = db.execute('''
+            SELECT j.*, t.title AS ticket_title
+            FROM print_jobs j LEFT JOIN tickets t ON t.id = j.ticket_id
+            ORDER BY j.status = 'failed' DESC, j.id
+            LIMIT ?
+        ''', (limit,)).fetchall()
+        counts = dict.fromkeys(PRINT_JOB_STATUSES, 0)
+        counts.update(db.execute('SELECT status, count(*) FROM print_jobs GROUP BY status').fetchall())
+        return {'jobs': jobs, 'counts': counts}
+    except sqlite3.Error as e:
+        print(f"Fout bij ophalen van de printwachtrij: {e}")
         raise
 
 # --- Kennisbank Functies ---
 def create_kb_article(title, category, content):
-    """Maakt een nieuw kennisbankartikel aan."""
+    """Maakt een nieuw kennisbankartikel aan, met de HTML meteen gerenderd."""
+    content_html = utils.render_markdown(content)
     try:
-        db = get_db()
-        now = datetime.now().isoformat()
+        with transaction() as db:
+            now = datetime.now().isoformat()
 
-        db.execute(
-            'INSERT INTO kb_articles (title, category, content, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
-            (title, category, content, now, now)
-        )
-        db.commit()
+            db.execute(
+                'INSERT INTO kb_articles (title, category, content, content_html, content_html_version, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (title, category, content, content_html, utils.markdown_renderer_version(), now, now)
+            )
+            _invalidate_reference('kb_articles')
     except sqlite3.Error as e:
         print(f"Fout bij aanmaken van kennisbankartikel: {e}")
         raise
 
 def get_all_kb_articles():
-    """Haalt alle kennisbankartikelen op."""
-    return get_db().execute('SELECT * FROM kb_articles ORDER BY category, title').fetchall()
+    """Haalt alle kennisbankartikelen op (zonder inhoud; de overzichten tonen alleen titels)."""
+    return _cached('kb_articles', 'all', lambda db: tuple(
+        db.execute('SELECT id, title, category FROM kb_articles ORDER BY category, title').fetchall()
+    ))
 
 def get_kb_article_by_id(article_id):
     """Haalt een specifiek kennisbankartikel op."""
-    return get_db().execute(
+    return _cached('kb_articles', ('id', article_id), lambda db: db.execute(
         'SELECT * FROM kb_articles WHERE id = ?',
         (article_id,)
-    ).fetchone()
+    ).fetchone())
+
+def search_kb_articles(search_query, limit=20):
+    """
+    Zoekt artikelen voor de typeahead op (prefixen van) woorden in titel en categorie.
+    Geeft alleen id, titel en categorie terug; zonder zoekterm de eerste artikelen op volgorde.
+    """
+    fts_query = _build_fts_query(search_query)
+    if fts_query is None:
+        return _cached('kb_articles', ('search', None, limit), lambda db: tuple(db.execute(
+            'SELECT id, title, category FROM kb_articles ORDER BY category, title LIMIT ?', (limit,)
+        ).fetchall()))
+    return _cached('kb_articles', ('search', fts_query, limit), lambda db: tuple(db.execute('''
+        SELECT a.id, a.title, a.category
+        FROM kb_articles_fts JOIN kb_articles a ON a.id = kb_articles_fts.rowid
+        WHERE kb_articles_fts MATCH ?
+        ORDER BY bm25(kb_articles_fts, 5.0, 1.0), a.title
+        LIMIT ?
+    ''', (fts_query, limit)).fetchall()))
+
+def get_kb_article_html(article):
+    """
+    Geeft de HTML van een artikel. De opgeslagen HTML wordt gebruikt zolang die met de
+    huidige renderer is gemaakt; anders (oude artikelen, nieuwe markdown versie) wordt
+    het artikel eenmalig opnieuw gerenderd en bijgewerkt.
+    """
+    version = utils.markdown_renderer_version()
+    if article['content_html'] is not None and article['content_html_version'] == version:
+        return article['content_html']
+
+    content_html = utils.render_markdown(article['content'])
+    try:
+        with transaction() as db:
+            # Alleen bijwerken als het artikel intussen niet is gewijzigd
+            db.execute(
+                'UPDATE kb_articles SET content_html = ?, content_html_version = ? WHERE id = ? AND updated_at = ?',
+                (content_html, version, article['id'], article['updated_at'])
+            )
+            _invalidate_reference('kb_articles')
+    except sqlite3.Error as e:
+        # De HTML is er al; opslaan is alleen een optimalisatie voor de volgende keer
+        print(f"Fout bij opslaan van gerenderde kennisbank HTML: {e}")
+    return content_html
 
 def update_kb_article(article_id, title, category, content):
-    """Werkt een kennisbankartikel bij."""
+    """Werkt een kennisbankartikel bij, inclusief de gerenderde HTML."""
+    content_html = utils.render_markdown(content)
     try:
-        db = get_db()
-        now = datetime.now().isoformat()
+        with transaction() as db:
+            now = datetime.now().isoformat()
 
-        db.execute(
-            'UPDATE kb_articles SET title = ?, category = ?, content = ?, updated_at = ? WHERE id = ?',
-            (title, category, content, now, article_id)
-        )
-        db.commit()
+            db.execute(
+                'UPDATE kb_articles SET title = ?, category = ?, content = ?, content_html = ?, content_html_version = ?, '
+                'updated_at = ? WHERE id = ?',
+                (title, category, content, content_html, utils.markdown_renderer_version(), now, article_id)
+            )
+            _invalidate_reference('kb_articles')
     except sqlite3.Error as e:
         print(f"Fout bij updaten van kennisbankartikel: {e}")
         raise
@@ -216,21 +1390,20 @@ def update_kb_article(article_id, title, category, content):
 def delete_kb_article(article_id):
     """Verwijdert een kennisbankartikel."""
     try:
-        db = get_db()
-
-        # Controleer eerst of dit artikel aan tickets is gekoppeld
-        result = db.execute(
-            'SELECT COUNT(*) FROM tickets WHERE kb_article_id = ?',
-            (article_id,)
-        ).fetchone()
-        if result[0] > 0:
-            raise ValueError("Kan kennisbankartikel niet verwijderen - het wordt nog gebruikt door ticket(s)")
+        with transaction() as db:
+            # Controleer eerst of dit artikel aan tickets is gekoppeld
+            result = db.execute(
+                'SELECT COUNT(*) FROM tickets WHERE kb_article_id = ?',
+                (article_id,)
+            ).fetchone()
+            if result[0] > 0:
+                raise ValueError("Kan kennisbankartikel niet verwijderen - het wordt nog gebruikt door ticket(s)")
 
-        db.execute(
-            'DELETE FROM kb_articles WHERE id = ?',
-            (article_id,)
-        )
-        db.commit()
+            db.execute(
+                'DELETE FROM kb_articles WHERE id = ?',
+                (article_id,)
+            )
+            _invalidate_reference('kb_articles')
     except sqlite3.Error as e:
         print(f"Fout bij verwijderen van kennisbankartikel: {e}")
         raise
@@ -242,36 +1415,53 @@ def delete_kb_article(article_id):
 def create_template(title, content):
     """Maakt een nieuw sjabloon aan."""
     try:
-        db = get_db()
-        db.execute(
-            'INSERT INTO templates (title, content) VALUES (?, ?)',
-            (title, content)
-        )
-        db.commit()
+        with transaction() as db:
+            db.execute(
+                'INSERT INTO templates (title, content) VALUES (?, ?)',
+                (title, content)
+            )
+            _invalidate_reference('templates')
     except sqlite3.Error as e:
         print(f"Fout bij aanmaken van sjabloon: {e}")
         raise
 
 def get_all_templates():
     """Haalt alle sjablonen op."""
-    return get_db().execute('SELECT * FROM templates ORDER BY title').fetchall()
+    return _cached('templates', 'all', lambda db: tuple(
+        db.execute('SELECT * FROM templates ORDER BY title').fetchall()
+    ))
 
 def get_template_by_id(template_id):
     """Haalt een specifiek sjabloon op."""
-    return get_db().execute(
+    return _cached('templates', ('id', template_id), lambda db: db.execute(
         'SELECT * FROM templates WHERE id = ?',
         (template_id,)
-    ).fetchone()
+    ).fetchone())
+
+def search_templates(search_query, limit=20):
+    """Zoekt sjablonen voor de typeahead op (prefixen van) woorden in de titel; alleen id en titel."""
+    fts_query = _build_fts_query(search_query)
+    if fts_query is None:
+        return _cached('templates', ('search', None, limit), lambda db: tuple(
+            db.execute('SELECT id, title FROM templates ORDER BY title LIMIT ?', (limit,)).fetchall()
+        ))
+    return _cached('templates', ('search', fts_query, limit), lambda db: tuple(db.execute('''
+        SELECT t.id, t.title
+        FROM templates_fts JOIN templates t ON t.id = templates_fts.rowid
+        WHERE templates_fts MATCH ?
+        ORDER BY bm25(templates_fts), t.title
+        LIMIT ?
+    ''', (fts_query, limit)).fetchall()))
 
 def update_template(template_id, title, content):
     """Werkt een sjabloon bij."""
     try:
-        db = get_db()
-        db.execute(
-            'UPDATE templates SET title = ?, content = ? WHERE id = ?',
-            (title, content, template_id)
-        )
-        db.commit()
+        with transaction() as db:
+            db.execute(
+                'UPDATE templates SET title = ?, content = ? WHERE id = ?',
+                (title, content, template_id)
+            )
+            _invalidate_reference('templates')
     except sqlite3.Error as e:
         print(f"Fout bij updaten van sjabloon: {e}")
         raise
@@ -279,99 +1469,321 @@ def update_template(template_id, title, content):
 def delete_template(template_id):
     """Verwijdert een sjabloon."""
     try:
-        db = get_db()
-
-        # Controleer eerst of dit sjabloon door tickets wordt gebruikt (indirect via kennisbankartikelen)
-        result = db.execute('''
-            SELECT COUNT(*) FROM kb_articles WHERE id IN (
-                SELECT kb_article_id FROM tickets
-                JOIN templates ON ...  -- Dit zou een complexe query zijn, misschien niet nodig
+        with transaction() as db:
+            # Sjablonen hebben geen directe referenties en kunnen dus gewoon worden verwijderd
+            db.execute(
+                'DELETE FROM templates WHERE id = ?',
+                (template_id,)
             )
-        ''').fetchone()
-
-        # Voor nu laten we het gewoon verwijderen (sjablonen hebben geen directe referenties)
-        db.execute(
-            'DELETE FROM templates WHERE id = ?',
-            (template_id,)
-        )
-        db.commit()
+            _invalidate_reference('templates')
     except sqlite3.Error as e:
         print(f"Fout bij verwijderen van sjabloon: {e}")
         raise
 
 # --- Rapportage Functies ---
-def get_status_counts():
-    """Haalt het aantal tickets per status op voor rapportages."""
+def _get_counter_rows(dimension, key_name):
+    """Leest de (niet-lege) tellers van één dimensie, gesorteerd op bucket."""
     return get_db().execute(
-        'SELECT status, COUNT(*) as count FROM tickets GROUP BY status'
+        f'SELECT bucket AS {key_name}, count FROM report_counters WHERE dimension = ? AND count > 0 ORDER BY bucket',
+        (dimension,)
     ).fetchall()
 
+def get_status_counts():
+    """Haalt het aantal tickets per status op voor rapportages."""
+    return _get_counter_rows('status', 'status')
+
 def get_priority_counts():
     """Haalt het aantal tickets per prioriteit op voor rapportages."""
-    return get_db().execute(
-        'SELECT priority, COUNT(*) as count FROM tickets GROUP BY priority'
-    ).fetchall()
+    return _get_counter_rows('priority', 'priority')
 
 def get_assignment_counts():
     """Haalt het aantal toegewezen vs niet-toegewezen tickets op."""
-    return get_db().execute('''
-        SELECT
-            CASE WHEN assigned_to IS NULL THEN 'Unassigned' ELSE assigned_to END as assignment_status,
-            COUNT(*) as count
-        FROM tickets GROUP BY assignment_status
-    ''').fetchall()
+    return _get_counter_rows('assignment', 'assignment_status')
 
 def get_kb_category_counts():
     """Haalt het aantal kennisbankartikelen per categorie op voor rapportages."""
-    return get_db().execute(
-        'SELECT category, COUNT(*) as count FROM kb_articles GROUP BY category'
-    ).fetchall()
+    # De tellers veranderen alleen mee met kb_articles, dus dezelfde dataset in de cache
+    return _cached('kb_articles', 'categories', lambda db: tuple(_get_counter_rows('kb_category', 'category')))
+
+@contextmanager
+def read_snapshot():
+    """
+    Voert alle reads binnen het blok uit in één leestransactie.
+    In WAL modus zien alle queries daardoor dezelfde momentopname van de database,
+    ook als er tussendoor door een andere thread wordt geschreven.
+    """
+    db = get_db()
+    if db.in_transaction:
+        # Binnen een lopende (schrijf)transactie is de snapshot er al
+        yield db
+        return
+    db.execute('BEGIN')
+    try:
+        yield db
+    finally:
+        db.rollback()  # Alleen gelezen; rollback beëindigt de leestransactie
+
+def get_dashboard_stats(since=None, until=None):
+    """
+    Haalt alle dashboardaggregaties op in één leestransactie.
+
+    Zonder tijdvenster komen de cijfers uit report_counters. Met since/until (ISO
+    strings, until exclusief) wordt gegroepeerd over de tickets en artikelen die in
+    dat venster zijn aangemaakt. Retourneert {dimensie: {bucket: aantal}} voor alle
+    dimensies uit REPORT_COUNTER_DIMENSIONS.
+    """
+    stats = {dimension: {} for dimension in REPORT_COUNTER_DIMENSIONS}
+    try:
+        with read_snapshot() as db:
+            if since is None and until is None:
+                rows = db.execute(
+                    'SELECT dimension, bucket, count FROM report_counters WHERE count > 0 ORDER BY dimension, bucket'
+                ).fetchall()
+            else:
+                conditions, params = [], []
+                if since is not None:
+                    conditions.append('created_at >= ?')
+                    params.append(since)
+                if until is not None:
+                    conditions.append('created_at < ?')
+                    params.append(until)
+                where = 'WHERE ' + ' AND '.join(conditions)
+                rows = db.execute(
+                    f'SELECT * FROM ({_report_counter_source_sql(where)}) ORDER BY 1, 2',
+                    params * len(REPORT_COUNTER_DIMENSIONS)
+                ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Fout bij ophalen van dashboardstatistieken: {e}")
+        raise
+
+    for dimension, bucket, count in rows:
+        stats[dimension][bucket] = count
+    return stats
+
+def _rebuild_report_counters(conn):
+    """Berekent alle tellers opnieuw vanuit de brontabellen (binnen de lopende transactie)."""
+    conn.execute('DELETE FROM report_counters')
+    conn.execute(f'INSERT INTO report_counters (dimension, bucket, count) {_report_counter_source_sql()}')
+
+def check_report_counters(conn):
+    """
+    Vergelijkt de tellers met een verse GROUP BY over de brontabellen.
+    Retourneert een lijst van (dimensie, bucket, teller, werkelijk) voor elke afwijking.
+    """
+    expected = {(d, b): c for d, b, c in conn.execute(_report_counter_source_sql())}
+    stored = {(d, b): c for d, b, c in conn.execute('SELECT dimension, bucket, count FROM report_counters WHERE count != 0')}
+    return [
+        (dimension, bucket, stored.get((dimension, bucket), 0), expected.get((dimension, bucket), 0))
+        for dimension, bucket in sorted(set(expected) | set(stored))
+        if stored.get((dimension, bucket), 0) != expected.get((dimension, bucket), 0)
+    ]
 
 # --- Functies voor Routes ---
-def _build_ticket_query(base_query, user, filter_by, search_query, sort_by):
-    """Helper function om algemene ticket query logica te bouwen."""
+# Relatieve gewichten voor bm25(): title, description, requester_name, requester_email, comments
+_FTS_RANK = 'bm25(tickets_fts, 10.0, 4.0, 2.0, 2.0, 1.0)'
+
+def _build_fts_query(search_query):
+    """
+    Zet een zoekopdracht van de gebruiker om naar een FTS5 MATCH expressie.
+    Elk woord wordt als prefix gezocht ("print" vindt ook "printer") en alle woorden moeten voorkomen.
+    """
+    terms = re.findall(r'\w+', search_query or '')
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+# Sorteersleutels per sorteeroptie: (kolommen/expressies, richting).
+# Het ticket id wordt altijd als laatste sleutel toegevoegd zodat de volgorde uniek is
+# en de keyset paginering nooit rijen overslaat of dubbel toont.
+_SORT_KEYS = {
+    'created_at_desc': (('t.created_at',), 'DESC'),
+    'created_at_asc': (('t.created_at',), 'ASC'),
+    'priority': (('t.priority_rank', 't.created_at'), 'ASC'),
+    'status': (('t.status_rank', 't.created_at'), 'ASC'),
+    'relevance': ((_FTS_RANK,), 'ASC'),
+}
+
+# Kolommen die de lijstweergaven tonen. Bewust zonder description en sensitive_notes,
+# en volledig gedekt door de idx_tickets_*_list indexes.
+_TICKET_SUMMARY_COLUMNS = 't.id, t.title, t.requester_name, t.created_at, t.status, t.priority, t.assigned_to'
+
+# Cache voor het (optionele) totaal aantal resultaten: {sleutel: (verloopt_op, aantal)}
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+_COUNT_CACHE_MAX_ENTRIES = 256
+
+def encode_cursor(values):
+    """Codeert de sorteersleutel van een rij als een ondoorzichtige, URL-veilige cursor."""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, expected_length):
+    """Decodeert een cursor; geeft None terug bij een ongeldige of gemanipuleerde waarde."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != expected_length:
+        return None
+    # Alleen waarden die SQLite als parameter accepteert (integers binnen 64 bits)
+    for value in values:
+        if isinstance(value, int) and not -2**63 <= value < 2**63:
+            return None
+        if value is not None and not isinstance(value, (str, int, float)):
+            return None
+    return values
+
+def _count_tickets(db, query, params):
+    """Telt het totaal aantal resultaten, met een korte TTL-cache zodat diepe pagina's niets extra kosten."""
+    ttl = current_app.config.get('TICKET_COUNT_CACHE_SECONDS', 30)
+    key = (current_app.config['DATABASE_FILE'], query, tuple(params))
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    total = db.execute(query, params).fetchone()[0]
+
+    with _count_cache_lock:
+        if len(_count_cache) >= _COUNT_CACHE_MAX_ENTRIES:
+            # Gooi verlopen items weg; als dat niet genoeg is, begin opnieuw
+            for stale_key in [k for k, v in _count_cache.items() if v[0] <= now]:
+                del _count_cache[stale_key]
+            if len(_count_cache) >= _COUNT_CACHE_MAX_ENTRIES:
+                _count_cache.clear()
+        _count_cache[key] = (now + ttl, total)
+    return total
+
+def _build_ticket_query(where_clause, user, filter_by, search_query, sort_by,
+                        cursor=None, direction='next', page_size=None, with_total=False,
+                        columns='t.*', notes_tokens=None):
+    """
+    Helper function om algemene ticket query logica te bouwen.
+
+    Met notes_tokens (blind index tokens van utils.notes_index_tokens) wordt niet in de
+    tekst maar in de vertrouwelijke notities gezocht: één index-zoekactie per term.
+
+    Gebruikt keyset paginering: de cursor bevat de sorteersleutel en het id van de
+    laatste (of eerste) rij van de vorige pagina, zodat elke pagina een index-zoekactie
+    is in plaats van een OFFSET die alle voorgaande rijen opnieuw moet doorlopen.
+    Retourneert een dict met 'tickets', 'next_cursor', 'prev_cursor' en 'total'.
+    """
     db = get_db()
+    from_clause = 'tickets t'
+    conditions = [where_clause]
     params = []
 
     if filter_by == 'mine':
-        base_query += " AND assigned_to = ?"
+        conditions.append('t.assigned_to = ?')
         params.append(user)
     elif filter_by == 'unassigned':
-        base_query += " AND assigned_to IS NULL"
+        conditions.append('t.assigned_to IS NULL')
 
-    if search_query:
-        base_query += " AND (title LIKE ? OR description LIKE ?)"
-        params.extend([f'%{search_query}%', f'%{search_query}%'])
+    fts_query = None if notes_tokens is not None else _build_fts_query(search_query)
+    if notes_tokens is not None:
+        # Alle termen moeten voorkomen; de tokens zijn uniek per ticket dus count(*) volstaat
+        placeholders = ', '.join('?' for _ in notes_tokens)
+        conditions.append(
+            f't.id IN (SELECT ticket_id FROM notes_index WHERE token IN ({placeholders}) '
+            f'GROUP BY ticket_id HAVING count(*) = ?)' if notes_tokens else '0'
+        )
+        params.extend(notes_tokens)
+        if notes_tokens:
+            params.append(len(notes_tokens))
+    elif fts_query:
+        from_clause += ' JOIN tickets_fts ON tickets_fts.rowid = t.id'
+        conditions.append('tickets_fts MATCH ?')
+        params.append(fts_query)
 
-    sort_options = {
-        'created_at_desc': 'ORDER BY created_at DESC',
-        'created_at_asc': 'ORDER BY created_at ASC',
-        'priority': "ORDER BY CASE priority WHEN 'Hoog' THEN 1 WHEN 'Gemiddeld' THEN 2 WHEN 'Laag' THEN 3 END ASC",
-        'status': 'ORDER BY status ASC'
-    }
+    # Relevantie heeft alleen betekenis als er gezocht wordt
+    if sort_by == 'relevance' and not fts_query:
+        sort_by = 'created_at_desc'
 
     # Add default sorting if not provided
-    base_query += " " + sort_options.get(sort_by, 'ORDER BY created_at DESC')
+    sort_exprs, order = _SORT_KEYS.get(sort_by, _SORT_KEYS['created_at_desc'])
+    key_exprs = sort_exprs + ('t.id',)
+    page_size = page_size or current_app.config.get('TICKETS_PER_PAGE', 50)
+
+    total = None
+    if with_total:
+        count_query = f"SELECT COUNT(*) FROM {from_clause} WHERE {' AND '.join(conditions)}"
+        total = _count_tickets(db, count_query, params)
+
+    # Bij 'vorige' lopen we de index in omgekeerde richting en draaien het resultaat daarna om
+    backwards = direction == 'prev'
+    walk_order = order
+    if backwards:
+        walk_order = 'ASC' if order == 'DESC' else 'DESC'
+
+    cursor_values = decode_cursor(cursor, len(key_exprs)) if cursor else None
+    page_conditions = list(conditions)
+    page_params = list(params)
+    if cursor_values is not None:
+        operator = '<' if walk_order == 'DESC' else '>'
+        placeholders = ', '.join('?' for _ in key_exprs)
+        page_conditions.append(f"({', '.join(key_exprs)}) {operator} ({placeholders})")
+        page_params.extend(cursor_values)
+
+    select_keys = ', '.join(f'{expr} AS _sort_key_{i}' for i, expr in enumerate(key_exprs))
+    order_clause = 'ORDER BY ' + ', '.join(f'{expr} {walk_order}' for expr in key_exprs)
+    query = (
+        f"SELECT {columns}, {select_keys} FROM {from_clause} "
+        f"WHERE {' AND '.join(page_conditions)} {order_clause} LIMIT ?"
+    )
+    page_params.append(page_size + 1)  # Eén extra rij om te weten of er nog een pagina is
+
+    rows = db.execute(query, page_params).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    def _row_cursor(row):
+        return encode_cursor(row[f'_sort_key_{i}'] for i in range(len(key_exprs)))
 
-    return db.execute(base_query, params).fetchall()
+    next_cursor = prev_cursor = None
+    if rows:
+        if (has_more and not backwards) or (backwards and cursor_values is not None):
+            next_cursor = _row_cursor(rows[-1])
+        if (has_more and backwards) or (not backwards and cursor_values is not None):
+            prev_cursor = _row_cursor(rows[0])
 
-def get_active_tickets(user, filter_by, search_query, sort_by):
-    """Haalt actieve tickets op met filtering en zoeken."""
-    base_query = "SELECT * FROM tickets WHERE status NOT IN ('Resolved', 'Closed')"
-    return _build_ticket_query(base_query, user, filter_by, search_query, sort_by)
+    return {
+        'tickets': rows,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'total': total,
+        'page_size': page_size
+    }
+
+def get_active_tickets(user, filter_by, search_query, sort_by, cursor=None, direction='next', with_total=False,
+                       notes_tokens=None):
+    """Haalt één pagina actieve tickets op (alleen de lijstkolommen) met filtering en zoeken."""
+    where_clause = "t.status NOT IN ('Resolved', 'Closed')"
+    return _build_ticket_query(where_clause, user, filter_by, search_query, sort_by,
+                               cursor=cursor, direction=direction, with_total=with_total,
+                               columns=_TICKET_SUMMARY_COLUMNS, notes_tokens=notes_tokens)
 
-def get_archived_tickets(user, filter_by, search_query, sort_by):
-    """Haalt gearchiveerde tickets op met filtering en zoeken."""
-    base_query = "SELECT * FROM tickets WHERE status IN ('Resolved', 'Closed')"
-    return _build_ticket_query(base_query, user, filter_by, search_query, sort_by)
+def get_archived_tickets(user, filter_by, search_query, sort_by, cursor=None, direction='next', with_total=False,
+                         notes_tokens=None):
+    """Haalt één pagina gearchiveerde tickets op (alleen de lijstkolommen) met filtering en zoeken."""
+    where_clause = "t.status IN ('Resolved', 'Closed')"
+    return _build_ticket_query(where_clause, user, filter_by, search_query, sort_by,
+                               cursor=cursor, direction=direction, with_total=with_total,
+                               columns=_TICKET_SUMMARY_COLUMNS, notes_tokens=notes_tokens)
 
 def get_ticket_by_id(ticket_id):
     """Haalt een specifiek ticket op met bijbehorende kennisbank titel."""
     try:
         db = get_db()
         result = db.execute('''
-            SELECT t.*, k.title as kb_article_title
-            FROM tickets t LEFT JOIN kb_articles k ON t.kb_article_id = k.id WHERE t.id = ?
+            SELECT t.*, k.title as kb_article_title, tk.wrapped_key
+            FROM tickets t
+            LEFT JOIN kb_articles k ON t.kb_article_id = k.id
+            LEFT JOIN ticket_keys tk ON tk.ticket_id = t.id
+            WHERE t.id = ?
         ''', (ticket_id,)).fetchone()
 
         # Voeg een placeholder voor kb_article_title toe als er geen is
@@ -383,21 +1795,65 @@ def get_ticket_by_id(ticket_id):
         print(f"Fout bij ophalen van ticket: {e}")
         raise
 
-def get_comments_for_ticket(ticket_id):
-    """Haalt commentaren voor een specifiek ticket op."""
+def get_comments_for_ticket(ticket_id, before=None, include_events=True, page_size=None):
+    """
+    Haalt één pagina van de tijdlijn (commentaren en events) van een ticket op.
+
+    Leest de nieuwste items eerst via de (ticket_id, created_at, id) index; met de cursor
+    'before' wordt de volgende, oudere pagina opgehaald. Retourneert een dict met
+    'comments' (oud naar nieuw, klaar voor weergave) en 'older_cursor'.
+    """
     try:
         db = get_db()
-        comments = db.execute(
-            'SELECT * FROM comments WHERE ticket_id = ? ORDER BY created_at ASC',
-            (ticket_id,)
+        page_size = page_size or current_app.config.get('TIMELINE_PAGE_SIZE', 50)
+        conditions = ['ticket_id = ?']
+        params = [ticket_id]
+
+        if not include_events:
+            conditions.append("event_type != 'event'")
+
+        cursor_values = decode_cursor(before, 2) if before else None
+        if cursor_values is not None:
+            conditions.append('(created_at, id) < (?, ?)')
+            params.extend(cursor_values)
+
+        params.append(page_size + 1)
+        rows = db.execute(
+            f"SELECT * FROM comments WHERE {' AND '.join(conditions)} "
+            "ORDER BY created_at DESC, id DESC LIMIT ?",
+            params
         ).fetchall()
 
-        # Converteer naar lijst van dicts voor makkelijkere verwerking in templates
-        return [dict(comment) for comment in comments]
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        older_cursor = encode_cursor((rows[-1]['created_at'], rows[-1]['id'])) if has_more else None
+        rows.reverse()
+        return {'comments': rows, 'older_cursor': older_cursor}
     except sqlite3.Error as e:
         print(f"Fout bij ophalen van commentaren: {e}")
         raise
 
+def seal_ticket_notes(ticket_id, old_token, token, wrapped_key, master_key_id):
+    """
+    Vervangt een oud (direct versleuteld) token door een envelope token met data key.
+    Alleen als de notities intussen niet zijn gewijzigd; retourneert of dat gelukt is.
+    """
+    try:
+        with transaction() as db:
+            updated = db.execute(
+                'UPDATE tickets SET sensitive_notes = ? WHERE id = ? AND sensitive_notes = ?',
+                (token, ticket_id, old_token)
+            ).rowcount
+            if updated:
+                db.execute(
+                    'INSERT OR REPLACE INTO ticket_keys (ticket_id, wrapped_key, master_key_id) VALUES (?, ?, ?)',
+                    (ticket_id, wrapped_key, master_key_id)
+                )
+        return bool(updated)
+    except sqlite3.Error as e:
+        print(f"Fout bij omzetten van gevoelige notities: {e}")
+        raise
+
 def get_ticket_details_for_update(ticket_id):
     """Haalt details van een ticket op die kunnen worden bijgewerkt."""
     try:
@@ -408,3 +1864,276 @@ def get_ticket_details_for_update(ticket_id):
     except sqlite3.Error as e:
         print(f"Fout bij ophalen van ticket details voor update: {e}")
         raise
+
+# --- Wijzigingsfeed ---
+def get_changes_since(last_id, limit=200):
+    """
+    Leest de feed na positie last_id, samengevoegd tot één item per ticket met de huidige
+    status, prioriteit en toewijzing. Retourneert {'changes', 'last_id', 'reset'}:
+    'reset' is waar als de client te ver achterloopt (opgeruimde of te veel wijzigingen)
+    en de pagina opnieuw moet laden. Zonder last_id wordt alleen de huidige positie gegeven.
+    """
+    try:
+        with read_snapshot() as db:
+            oldest, head = db.execute('SELECT min(id), max(id) FROM changes').fetchone()
+            head = head or 0
+            if last_id is None or last_id == head:
+                return {'changes': [], 'last_id': head, 'reset': False}
+            # Voorlopen op de feed kan alleen na het vervangen van de database; een lege feed
+            # (oldest is None) heeft niets om in te halen
+            if (last_id < 0 or last_id > head or head - last_id > limit
+                    or oldest is not None and last_id < oldest - 1):
+                return {'changes': [], 'last_id': head, 'reset': True}
+
+            changes = db.execute('''
+                SELECT max(c.id) AS id, c.ticket_id, group_concat(DISTINCT c.kind) AS kinds,
+                       t.title, t.status, t.priority, t.assigned_to
+                FROM changes c LEFT JOIN tickets t ON t.id = c.ticket_id
+                WHERE c.id > ? AND c.id <= ?
+                GROUP BY c.ticket_id
+                ORDER BY id
+            ''', (last_id, head)).fetchall()
+            return {'changes': changes, 'last_id': head, 'reset': False}
+    except sqlite3.Error as e:
+        print(f"Fout bij ophalen van wijzigingen: {e}")
+        raise
+
+# --- Rotatie van de hoofdsleutel ---
+_LEGACY_NOTES_WHERE = "sensitive_notes IS NOT NULL AND sensitive_notes != '' AND substr(sensitive_notes, 1, 5) != 'env1:'"
+
+# Tabellen met omhulde data keys (wrapped_key, master_key_id), per rotatiestap: (tabel, sleutelkolom)
+_WRAPPED_KEY_TABLES = {
+    'rewrapped': ('ticket_keys', 'ticket_id'),
+    'rewrapped_attachments': ('attachment_blobs', 'id'),
+    'rewrapped_id_key': ('attachment_id_keys', 'id'),
+}
+
+def _map_in_pool(executor, workers, worker, rows):
+    """Verdeelt rows in gelijke delen over de workers en voegt de resultaten op volgorde samen."""
+    size = max(1, -(-len(rows) // workers))
+    parts = [rows[i:i + size] for i in range(0, len(rows), size)]
+    return [result for part in executor.map(worker, parts) for result in part]
+
+def rotate_master_key(conn, old_key, new_key, executor, workers=1, batch_size=500, progress=None):
+    """
+    Zet alle versleutelde notities over naar new_key, in batches van elk één transactie.
+
+    1. Oude tokens (direct met old_key versleuteld) krijgen een eigen data key.
+    2. Data keys van notities en bijlagen die nog met old_key zijn omhuld, worden opnieuw
+       omhuld met new_key. De notities en bestanden zelf worden daarbij niet aangeraakt. Het werk per batch draait in de
+    executor; elke batch markeert zijn rijen als klaar (nieuw token of master_key_id), dus
+    een afgebroken rotatie gaat bij de volgende aanroep verder waar hij was.
+    progress(stap, verwerkt, totaal) wordt na elke batch aangeroepen.
+    Retourneert {'sealed', 'rewrapped', 'rewrapped_attachments', 'rewrapped_id_key', 'failed'}; 'failed' telt
+    rijen die niet met old_key te openen waren.
+    """
+    old_id, new_id = utils.master_key_id(old_key), utils.master_key_id(new_key)
+    stats = {'sealed': 0, **dict.fromkeys(_WRAPPED_KEY_TABLES, 0), 'failed': 0}
+    steps = [
+        ('sealed',
+         f'SELECT count(*) FROM tickets WHERE {_LEGACY_NOTES_WHERE}', (),
+         f'SELECT id, sensitive_notes FROM tickets WHERE id > ? AND {_LEGACY_NOTES_WHERE} ORDER BY id LIMIT ?', (),
+         functools.partial(utils.seal_legacy_notes, old_key, new_key)),
+    ]
+    for step, (table, key_column) in _WRAPPED_KEY_TABLES.items():
+        if old_id != new_id:
+            steps.append((
+                step,
+                f'SELECT count(*) FROM {table} WHERE master_key_id = ?', (old_id,),
+                f'SELECT {key_column}, wrapped_key FROM {table} WHERE {key_column} > ? AND master_key_id = ? '
+                f'ORDER BY {key_column} LIMIT ?', (old_id,),
+                functools.partial(utils.rewrap_data_keys, old_key, new_key)
+            ))
+
+    for step, count_sql, count_params, select_sql, select_params, worker in steps:
+        total = conn.execute(count_sql, count_params).fetchone()[0]
+        done, last_id = 0, 0
+        while True:
+            rows = conn.execute(select_sql, (last_id, *select_params, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            originals = dict(rows)
+            results = _map_in_pool(executor, workers, worker, rows)
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for row_id, result in results:
+                    if result is None:
+                        stats['failed'] += 1
+                    elif step == 'sealed':
+                        token, wrapped_key = result
+                        # Alleen als de notities sinds het lezen niet zijn gewijzigd
+                        if conn.execute(
+                            'UPDATE tickets SET sensitive_notes = ? WHERE id = ? AND sensitive_notes = ?',
+                            (token, row_id, originals[row_id])
+                        ).rowcount:
+                            conn.execute(
+                                'INSERT OR REPLACE INTO ticket_keys (ticket_id, wrapped_key, master_key_id) VALUES (?, ?, ?)',
+                                (row_id, wrapped_key, new_id)
+                            )
+                            stats[step] += 1
+                    else:
+                        table, key_column = _WRAPPED_KEY_TABLES[step]
+                        stats[step] += conn.execute(
+                            f'UPDATE {table} SET wrapped_key = ?, master_key_id = ? '
+                            f'WHERE {key_column} = ? AND wrapped_key = ?',
+                            (result, new_id, row_id, originals[row_id])
+                        ).rowcount
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+            done += len(rows)
+            if progress:
+                progress(step, done, total)
+    return stats
+
+def rebuild_notes_index(conn, master_key, batch_size=500, progress=None):
+    """
+    Bouwt de blind index opnieuw op uit de notities, in batches van elk één transactie.
+    Nodig voor tickets van vóór de index en na een nieuwe hoofdsleutel. Retourneert
+    {'indexed', 'failed'}; 'failed' telt notities die niet met master_key te openen waren.
+
+    Alleen tickets die er bij de start al waren worden herbouwd: nieuwere tickets krijgen
+    hun tokens al bij het aanmaken. Elke batch wordt binnen zijn eigen schrijftransactie
+    gelezen, zodat een notitie die tussendoor wordt bewerkt niet met oude tokens wordt
+    overschreven.
+    """
+    from cryptography.fernet import InvalidToken
+    index_key = utils.blind_index_key(master_key)
+    stats = {'indexed': 0, 'failed': 0}
+    total, max_id = conn.execute('SELECT count(*), coalesce(max(id), 0) FROM tickets').fetchone()
+    done, last_id = 0, 0
+    while last_id < max_id:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute('''
+                SELECT t.id, t.sensitive_notes, tk.wrapped_key
+                FROM tickets t LEFT JOIN ticket_keys tk ON tk.ticket_id = t.id
+                WHERE t.id > ? AND t.id <= ? ORDER BY t.id LIMIT ?
+            ''', (last_id, max_id, batch_size)).fetchall()
+            # Zonder rijen ruimt de laatste batch de tokens van verdwenen tickets tot max_id op
+            batch_start, last_id = last_id, rows[-1][0] if rows else max_id
+
+            entries = []
+            for ticket_id, token, wrapped_key in rows:
+                if not token:
+                    continue
+                try:
+                    notes = utils.open_notes(master_key, token, wrapped_key)
+                except (InvalidToken, LookupError):
+                    stats['failed'] += 1
+                    continue
+                entries.extend((index_token, ticket_id) for index_token in utils.blind_index_tokens(index_key, notes))
+                stats['indexed'] += 1
+
+            conn.execute('DELETE FROM notes_index WHERE ticket_id > ? AND ticket_id <= ?', (batch_start, last_id))
+            conn.executemany('INSERT OR IGNORE INTO notes_index (token, ticket_id) VALUES (?, ?)', entries)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        done += len(rows)
+        if progress:
+            progress(done, total)
+    return stats
+
+# --- CLI Commando's ---
+def register_commands(app):
+    """Registreert beheercommando's, bruikbaar via 'flask --app app <commando>'."""
+
+    @app.cli.command('check-counters')
+    @click.option('--repair', is_flag=True, help='Herbouw de tellers als er afwijkingen zijn.')
+    def check_counters_command(repair):
+        """Controleert de rapportage tellers tegen de brontabellen."""
+        conn = sqlite3.connect(app.config['DATABASE_FILE'], isolation_level=None)
+        try:
+            mismatches = check_report_counters(conn)
+            for dimension, bucket, stored, actual in mismatches:
+                click.echo(f"Afwijking in {dimension}/{bucket}: teller {stored}, werkelijk {actual}")
+            if not mismatches:
+                click.echo("Alle rapportage tellers zijn consistent.")
+            elif repair:
+                conn.execute('BEGIN IMMEDIATE')
+                _rebuild_report_counters(conn)
+                conn.execute('COMMIT')
+                click.echo("Rapportage tellers zijn opnieuw opgebouwd.")
+        finally:
+            conn.close()
+
+    @app.cli.command('rotate-master-key')
+    @click.option('--batch-size', type=int, default=None, help='Aantal tickets per transactie.')
+    @click.option('--workers', type=int, default=None, help='Aantal processen voor het cryptowerk.')
+    def rotate_master_key_command(batch_size, workers):
+        """
+        Zet de gevoelige notities over naar een nieuw hoofdwachtwoord. Alleen de omhulde
+        data keys worden opnieuw versleuteld; oude tokens krijgen eerst een eigen data key.
+        Een afgebroken run kan met dezelfde wachtwoorden opnieuw worden gestart. Met een
+        gelijk oud en nieuw wachtwoord worden alleen de oude tokens omgezet.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        old_password = click.prompt('Huidig hoofdwachtwoord', hide_input=True)
+        new_password = click.prompt('Nieuw hoofdwachtwoord', hide_input=True, confirmation_prompt=True)
+        old_key = utils.generate_key_from_password(old_password)
+        new_key = old_key if new_password == old_password else utils.generate_key_from_password(new_password)
+
+        batch_size = batch_size or app.config.get('KEY_ROTATION_BATCH_SIZE', 500)
+        workers = workers or app.config.get('KEY_ROTATION_WORKERS') or os.cpu_count() or 1
+        labels = {'sealed': 'Oude tokens omgezet', 'rewrapped': 'Data keys opnieuw omhuld',
+                  'rewrapped_attachments': 'Bijlagesleutels opnieuw omhuld',
+                  'rewrapped_id_key': 'Sleutel voor bijlagenamen opnieuw omhuld'}
+
+        def progress(step, done, total):
+            click.echo(f"{labels[step]}: {done}/{total}")
+
+        conn = sqlite3.connect(app.config['DATABASE_FILE'], isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout = {app.config.get('DATABASE_PRAGMAS', {}).get('busy_timeout', 5000)}")
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                stats = rotate_master_key(conn, old_key, new_key, executor, workers, batch_size, progress)
+        finally:
+            conn.close()
+
+        click.echo(f"Klaar: {stats['sealed']} oude tokens omgezet, {stats['rewrapped']} data keys en "
+                   f"{stats['rewrapped_attachments']} bijlagesleutels opnieuw omhuld.")
+        if stats['failed']:
+            click.echo(f"Waarschuwing: {stats['failed']} tickets konden niet met het huidige wachtwoord worden geopend.")
+        if new_key != old_key:
+            click.echo("Pas ook het wachtwoord in USERS aan; ingelogde gebruikers moeten opnieuw inloggen.")
+            click.echo("Bouw daarna de zoekindex voor notities opnieuw op met 'flask rebuild-notes-index'.")
+
+    @app.cli.command('rebuild-notes-index')
+    @click.option('--batch-size', type=int, default=None, help='Aantal tickets per transactie.')
+    def rebuild_notes_index_command(batch_size):
+        """Bouwt de blind index voor het zoeken in vertrouwelijke notities opnieuw op."""
+        password = click.prompt('Hoofdwachtwoord', hide_input=True)
+        master_key = utils.generate_key_from_password(password)
+        batch_size = batch_size or app.config.get('KEY_ROTATION_BATCH_SIZE', 500)
+
+        conn = sqlite3.connect(app.config['DATABASE_FILE'], isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout = {app.config.get('DATABASE_PRAGMAS', {}).get('busy_timeout', 5000)}")
+        try:
+            stats = rebuild_notes_index(conn, master_key, batch_size,
+                                        progress=lambda done, total: click.echo(f"Tickets verwerkt: {done}/{total}"))
+        finally:
+            conn.close()
+
+        click.echo(f"Klaar: notities van {stats['indexed']} tickets geïndexeerd.")
+        if stats['failed']:
+            click.echo(f"Waarschuwing: {stats['failed']} tickets konden niet met dit wachtwoord worden geopend.")
+
+    @app.cli.command('reset-analytics')
+    def reset_analytics_command():
+        """Wist de analytics rollup; deze wordt bij het volgende bezoek opnieuw opgebouwd."""
+        conn = sqlite3.connect(app.config['DATABASE_FILE'], isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM analytics_daily')
+            conn.execute('DELETE FROM analytics_state')
+            conn.execute('COMMIT')
+            click.echo("De analytics rollup is gewist.")
+        finally:
+            conn.close()
@@ -1,9 +1,12 @@
 import os
 import sys
+import shlex
 import tempfile
+import threading
 import subprocess
+from datetime import datetime, timedelta
 from flask import current_app
-from . import utils
+from . import database, utils
 
 def generate_ticket_print_content(ticket_data: dict) -> str:
     """Formatteert ticket data naar een schone string voor de printer."""
@@ -27,42 +30,181 @@ def generate_ticket_print_content(ticket_data: dict) -> str:
     ]
     return "\n".join(content)
 
-def print_new_ticket(ticket_data: dict) -> None:
+def send_to_printer(content: str, command=None, timeout: float = 30) -> None:
     """
-    Creëert een tijdelijk bestand met ticketinfo en stuurt dit naar de standaardprinter,
-    indien geconfigureerd.
+    Schrijft content naar een tijdelijk bestand en stuurt dit naar de printer.
+    command is een lijst (of string) met het printcommando; '{file}' wordt vervangen door het
+    pad, anders komt het pad achteraan. Zonder command wordt de standaardprinter van het OS
+    gebruikt ('lpr', of de print-actie van Windows). Fouten, ook een timeout, worden doorgegeven.
     """
-    # Controleer of de printfunctionaliteit is ingeschakeld in de configuratie.
-    if not current_app.config.get('PRINT_NEW_TICKETS', False):
-        return
-
-    print_content = generate_ticket_print_content(ticket_data)
     path = None  # Initialiseer pad voor de finally-clausule
 
     try:
         # Creëer een veilig tijdelijk bestand.
         fd, path = tempfile.mkstemp(suffix=".txt", prefix="ticket-")
         with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
-            tmp_file.write(print_content)
-
-        # Stuur het bestand naar de printer afhankelijk van het OS.
-        if sys.platform.startswith('win'):
-            os.startfile(path, "print")
-        elif sys.platform.startswith('darwin') or sys.platform.startswith('linux'):
-            subprocess.run(['lpr', path], check=True, capture_output=True, text=True)
-        else:
-            current_app.logger.warning(f"Printen wordt niet ondersteund op dit OS: {sys.platform}")
-            return
+            tmp_file.write(content)
 
-        current_app.logger.info(f"Ticket #{ticket_data.get('id')} succesvol naar de printer gestuurd.")
+        if command is None:
+            # Stuur het bestand naar de printer afhankelijk van het OS.
+            if sys.platform.startswith('win'):
+                os.startfile(path, "print")
+                return
+            if not (sys.platform.startswith('darwin') or sys.platform.startswith('linux')):
+                raise OSError(f"Printen wordt niet ondersteund op dit OS: {sys.platform}")
+            command = ['lpr']
 
-    except FileNotFoundError:
-        current_app.logger.error("Printen mislukt: 'lpr' commando niet gevonden. Is CUPS geïnstalleerd?")
-    except subprocess.CalledProcessError as e:
-        current_app.logger.error(f"Fout bij het aanroepen van 'lpr': {e.stderr}")
-    except Exception as e:
-        current_app.logger.error(f"Een onverwachte fout is opgetreden tijdens het printen: {e}")
+        if isinstance(command, str):
+            command = shlex.split(command)
+        if any('{file}' in part for part in command):
+            args = [part.replace('{file}', path) for part in command]
+        else:
+            args = [*command, path]
+        # Bij een timeout stopt subprocess.run het commando voordat de fout wordt doorgegeven
+        subprocess.run(args, check=True, capture_output=True, text=True, timeout=timeout)
     finally:
         # Zorg ervoor dat het tijdelijke bestand altijd wordt opgeruimd.
         if path and os.path.exists(path):
             os.remove(path)
+
+def describe_print_error(error: Exception) -> str:
+    """Korte, leesbare omschrijving van een printfout voor het log en de wachtrijpagina."""
+    if isinstance(error, FileNotFoundError):
+        return f"Printcommando niet gevonden: {error.filename or error}. Is CUPS geïnstalleerd?"
+    if isinstance(error, subprocess.TimeoutExpired):
+        return f"Printcommando reageerde niet binnen {error.timeout:g} seconden."
+    if isinstance(error, subprocess.CalledProcessError):
+        detail = (error.stderr or '').strip() or (error.stdout or '').strip()
+        return f"Printcommando mislukt (exitcode {error.returncode}){': ' + detail if detail else '.'}"
+    return str(error) or type(error).__name__
+
+# ==============================================================================
+# PRINT SPOOLER
+# Nieuwe tickets worden niet in de request geprint: create_ticket zet in dezelfde transactie
+# een job in 'print_jobs' en een achtergrondthread werkt de wachtrij af. Een trage of
+# hangende printerwachtrij houdt zo geen waitress thread bezet. Omdat de jobs in de
+# database staan, gaat het printen na een herstart verder; een job die tijdens het printen
+# bleef hangen, wordt na het verlopen van zijn claim opnieuw opgepakt.
+# ==============================================================================
+
+class PrintSpooler:
+    """
+    Achtergrondthread die de printwachtrij afwerkt. Elke poging heeft een timeout
+    (PRINT_JOB_TIMEOUT); een mislukte poging wordt herhaald na PRINT_RETRY_DELAY seconden,
+    bij elke volgende poging verdubbeld tot PRINT_RETRY_MAX_DELAY. Na PRINT_MAX_ATTEMPTS
+    pogingen blijft de job als 'failed' op de wachtrijpagina staan.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='print-spooler', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Laat de worker direct kijken of er werk is, bijvoorbeeld na het aanmaken van een ticket."""
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        # Een eigen verbinding, zodat deze thread geen plek van de waitress threads in de pool bezet
+        self.app.extensions['db_pool'].dedicate_thread()
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                while not self._stopping.is_set() and self.run_once():
+                    pass
+                wait = self._seconds_until_next_job()
+            except Exception as e:
+                self.app.logger.error(f"Fout in de print spooler: {e}")
+                wait = self.app.config.get('PRINT_POLL_INTERVAL', 60)
+            self._wakeup.wait(wait)
+
+    def _seconds_until_next_job(self):
+        # Ook zonder wake() af en toe kijken: een ander proces kan jobs hebben toegevoegd
+        poll_interval = self.app.config.get('PRINT_POLL_INTERVAL', 60)
+        with self.app.app_context():
+            next_at = database.next_print_job_at()
+        if next_at is None:
+            return poll_interval
+        seconds = (datetime.fromisoformat(next_at) - datetime.now()).total_seconds()
+        return min(max(seconds, 0.1), poll_interval)
+
+    def run_once(self) -> bool:
+        """Print één job die aan de beurt is. Retourneert False als er niets te doen was."""
+        config = self.app.config
+        timeout = config.get('PRINT_JOB_TIMEOUT', 30)
+        with self.app.app_context():
+            # De claim loopt ruim langer dan de timeout, zodat alleen een echt vastgelopen job vrijkomt
+            job = database.claim_print_job(lease_seconds=timeout + 60)
+            if job is None:
+                return False
+            ticket = database.get_ticket_by_id(job['ticket_id'])
+            content = generate_ticket_print_content(ticket) if ticket else None
+
+        # Het printen zelf gebeurt buiten de app context, zonder databaseverbinding vast te houden
+        error = None
+        if content is None:
+            error = f"Ticket #{job['ticket_id']} bestaat niet meer."
+        else:
+            try:
+                send_to_printer(content, config.get('PRINT_COMMAND'), timeout)
+            except Exception as e:
+                error = describe_print_error(e)
+
+        retry_at = None
+        if error is None:
+            self.app.logger.info(f"Ticket #{job['ticket_id']} succesvol naar de printer gestuurd.")
+        elif content is not None and job['attempts'] < config.get('PRINT_MAX_ATTEMPTS', 5):
+            delay = min(config.get('PRINT_RETRY_DELAY', 10) * 2 ** (job['attempts'] - 1),
+                        config.get('PRINT_RETRY_MAX_DELAY', 600))
+            retry_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+            self.app.logger.warning(
+                f"Printen van ticket #{job['ticket_id']} mislukt (poging {job['attempts']}), "
+                f"nieuwe poging over {delay:g} seconden: {error}"
+            )
+        else:
+            self.app.logger.error(f"Printen van ticket #{job['ticket_id']} definitief mislukt: {error}")
+
+        with self.app.app_context():
+            database.finish_print_job(job['id'], error, retry_at)
+        return True
+
+def _serving_app() -> bool:
+    """
+    False als de app voor een 'flask' beheercommando wordt geladen (rotate-master-key,
+    rebuild-notes-index, ...): dan mag er geen worker op de achtergrond jobs printen.
+    'flask run' en servers als waitress-serve bedienen wel requests.
+    """
+    import click
+    ctx = click.get_current_context(silent=True)
+    return ctx is None or ctx.info_name == 'run'
+
+def init_spooler(app):
+    """
+    Maakt de print spooler aan en registreert deze op de app. De worker thread start alleen
+    als PRINT_NEW_TICKETS aan staat en de app requests bedient; wachtende jobs van een
+    vorige run worden dan direct opgepakt.
+    """
+    spooler = PrintSpooler(app)
+    app.extensions['print_spooler'] = spooler
+    if app.config.get('PRINT_NEW_TICKETS', False) and _serving_app():
+        spooler.start()
+    return spooler
+
+def get_spooler() -> PrintSpooler:
+    return current_app.extensions['print_spooler']
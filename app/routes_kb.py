@@ -1,4 +1,5 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, jsonify
+from markupsafe import Markup
 from collections import defaultdict
 from . import database
 from .auth import login_required
@@ -19,6 +20,19 @@ def kb_index():
 
     return render_template('kb_index.html', grouped_articles=grouped_articles)
 
+@bp.route('/search.json')
+@login_required
+def kb_search():
+    """Typeahead: artikelen (id, titel, categorie) waarvan de titel of categorie op de zoekterm past."""
+    try:
+        articles = database.search_kb_articles(
+            request.args.get('q', ''), current_app.config.get('TYPEAHEAD_LIMIT', 20)
+        )
+        return jsonify([dict(a) for a in articles])
+    except Exception as e:
+        current_app.logger.error(f"Fout bij zoeken naar kennisbankartikelen: {e}")
+        abort(500)
+
 @bp.route('/create', methods=['GET', 'POST'])
 @login_required
 def kb_create():
@@ -66,6 +80,7 @@ def kb_article(article_id):
 
         # Convert row to dict for template consistency
         article_dict = dict(article) if hasattr(article, 'keys') else article
+        article_dict['content_html'] = Markup(database.get_kb_article_html(article_dict))
 
         return render_template('kb_article.html', article=article_dict)
     except Exception as e:
@@ -170,6 +185,28 @@ def templates_index():
         current_app.logger.error(f"Fout bij ophalen van sjablonen: {e}")
         abort(500)
 
+@bp_templates.route('/search.json')
+@login_required
+def templates_search():
+    """Typeahead: sjablonen (id, titel) waarvan de titel op de zoekterm past."""
+    try:
+        templates = database.search_templates(
+            request.args.get('q', ''), current_app.config.get('TYPEAHEAD_LIMIT', 20)
+        )
+        return jsonify([dict(t) for t in templates])
+    except Exception as e:
+        current_app.logger.error(f"Fout bij zoeken naar sjablonen: {e}")
+        abort(500)
+
+@bp_templates.route('/<int:template_id>.json')
+@login_required
+def templates_get(template_id):
+    """Geeft de inhoud van één sjabloon, op te halen zodra het in de typeahead wordt gekozen."""
+    template = database.get_template_by_id(template_id)
+    if not template:
+        abort(404)
+    return jsonify(dict(template))
+
 @bp_templates.route('/create', methods=['GET', 'POST'])
 @login_required
 def templates_create():
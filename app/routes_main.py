@@ -1,6 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, g, flash, session, current_app, abort
-from . import database, printer, utils
+from flask import (Blueprint, render_template, request, redirect, url_for, g, flash, session, current_app, abort,
+                   make_response, get_flashed_messages, send_file)
+from werkzeug.exceptions import RequestEntityTooLarge
+from . import attachments, database, printer, utils
 from .auth import login_required
+import functools
+import hashlib
+import json
 import os
 import threading
 
@@ -24,23 +29,78 @@ def welcome():
         return redirect(url_for('main.index'))
     return redirect(url_for('auth.login'))
 
+def conditional_page(view):
+    """
+    Conditional GET voor pagina's die alleen van de database afhangen.
+    De ETag combineert de databaserevisie met de gebruiker, de route en de querystring;
+    bij een match volgt een 304 zonder dat de view (queries en template) wordt uitgevoerd.
+    Pagina's met flash-berichten worden altijd volledig gerenderd en niet gecached.
+    """
+    @functools.wraps(view)
+    def wrapped_view(*args, **kwargs):
+        if '_flashes' in session:
+            return view(*args, **kwargs)
+
+        key = [database.current_revision(), g.user, request.endpoint, request.view_args,
+               sorted(request.args.items(multi=True))]
+        etag = hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()[:32]
+
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            # Foutmeldingen en doorverwijzingen krijgen geen ETag
+            if response.status_code != 200 or get_flashed_messages():
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapped_view
+
+def _get_notes_search(search_query):
+    """Blind index tokens als er in de vertrouwelijke notities gezocht wordt (?notes=1), anders None."""
+    if request.args.get('notes') != '1' or not search_query.strip():
+        return None
+    return utils.notes_index_tokens(search_query, g.key_handle, query=True)
+
+def _get_page_args():
+    """Leest de pagineringscursor uit de querystring ('after' voor volgende, 'before' voor vorige)."""
+    if request.args.get('before'):
+        return request.args['before'], 'prev'
+    return request.args.get('after') or None, 'next'
+
 @bp.route('/tickets')
 @login_required
+@conditional_page
 def index():
     """Toont de lijst met actieve tickets."""
     search_query = request.args.get('search', '')
     sort_by = request.args.get('sort', 'created_at_desc') if request.args.get('sort') else 'created_at_desc'
     filter_by = request.args.get('filter', 'all')
+    cursor, direction = _get_page_args()
 
     try:
+        # Positie in de wijzigingsfeed vóór de lijst lezen: een wijziging daartussen komt
+        # dan hooguit dubbel binnen, wat de live updates zonder gevolgen opnieuw toepassen.
+        feed_position = database.get_changes_since(None)['last_id']
+
         # Delegeer de query-logica naar de database module
-        tickets = database.get_active_tickets(g.user, filter_by, search_query, sort_by)
+        page = database.get_active_tickets(
+            g.user, filter_by, search_query, sort_by,
+            cursor=cursor,
+            direction=direction,
+            with_total=current_app.config.get('TICKET_LIST_SHOW_TOTAL', False),
+            notes_tokens=_get_notes_search(search_query)
+        )
         return render_template(
             'index.html',
-            tickets=tickets,
+            tickets=page['tickets'],
+            page=page,
             search_query=search_query,
             sort_by=sort_by,
-            filter_by=filter_by
+            filter_by=filter_by,
+            search_notes=request.args.get('notes') == '1',
+            feed_position=feed_position
         )
     except Exception as e:
         current_app.logger.error(f"Fout bij ophalen van actieve tickets: {e}")
@@ -48,27 +108,39 @@ def index():
         return render_template(
             'index.html',
             tickets=[],
+            page=None,
             search_query=search_query,
             sort_by=sort_by,
-            filter_by=filter_by
+            filter_by=filter_by,
+            search_notes=request.args.get('notes') == '1'
         )
 
 @bp.route('/archive')
 @login_required
+@conditional_page
 def archive():
     """Toont de lijst met gearchiveerde tickets."""
     search_query = request.args.get('search', '')
     sort_by = request.args.get('sort', 'created_at_desc') if request.args.get('sort') else 'created_at_desc'
     filter_by = request.args.get('filter', 'all')
+    cursor, direction = _get_page_args()
 
     try:
-        archived_tickets = database.get_archived_tickets(g.user, filter_by, search_query, sort_by)
+        page = database.get_archived_tickets(
+            g.user, filter_by, search_query, sort_by,
+            cursor=cursor,
+            direction=direction,
+            with_total=current_app.config.get('TICKET_LIST_SHOW_TOTAL', False),
+            notes_tokens=_get_notes_search(search_query)
+        )
         return render_template(
             'archive.html',
-            tickets=archived_tickets,
+            tickets=page['tickets'],
+            page=page,
             search_query=search_query,
             sort_by=sort_by,
-            filter_by=filter_by
+            filter_by=filter_by,
+            search_notes=request.args.get('notes') == '1'
         )
     except Exception as e:
         current_app.logger.error(f"Fout bij ophalen van gearchiveerde tickets: {e}")
@@ -76,9 +148,11 @@ def archive():
         return render_template(
             'archive.html',
             tickets=[],
+            page=None,
             search_query=search_query,
             sort_by=sort_by,
-            filter_by=filter_by
+            filter_by=filter_by,
+            search_notes=request.args.get('notes') == '1'
         )
 
 @bp.route('/create', methods=['GET', 'POST'])
@@ -94,11 +168,14 @@ def create():
                     flash(f'Vel {field.replace("_", " ").capitalize()} is vereist.', 'error')
                     return render_template('create_ticket.html')
 
-            # Encrypt gevoelige data
-            encrypted_notes = utils.encrypt_data(
+            # Encrypt gevoelige data met een eigen data key voor dit ticket
+            encrypted_notes, wrapped_key, master_key_id = utils.encrypt_notes(
                 request.form['sensitive_notes'],
-                g.master_password,
-                )
+                g.key_handle,
+                ) or (None, None, None)
+
+            # Blind index tokens, zodat de notities later doorzoekbaar zijn zonder ontsleutelen
+            notes_tokens = utils.notes_index_tokens(request.form['sensitive_notes'], g.key_handle) or ()
 
             ticket_id = database.create_ticket(
                 title=request.form['title'].strip(),
@@ -107,15 +184,14 @@ def create():
                 email=request.form['requester_email'],
                 phone=request.form['requester_phone'],
                 priority=request.form.get('priority', 'Gemiddeld'),
-                sensitive_notes=encrypted_notes
+                sensitive_notes=encrypted_notes,
+                wrapped_key=wrapped_key,
+                master_key_id=master_key_id,
+                notes_tokens=notes_tokens,
+                # Printen gebeurt op de achtergrond via de printwachtrij (zie printer.py)
+                print_ticket=current_app.config.get('PRINT_NEW_TICKETS', False)
             )
 
-            # Haal het nieuwe ticket op voor printen (indien geconfigureerd)
-            new_ticket_data = database.get_ticket_by_id(ticket_id)
-
-            if current_app.config.get('PRINT_NEW_TICKETS', False) and new_ticket_data:
-                printer.print_new_ticket(new_ticket_data)
-
             flash(f'Ticket #{ticket_id} succesvol aangemaakt!', 'success')
         except Exception as e:
             current_app.logger.error(f"Fout bij aanmaken van ticket: {e}")
@@ -126,8 +202,78 @@ def create():
         default_priority='Gemiddeld'
     )
 
+@bp.route('/print-jobs')
+@login_required
+def print_jobs():
+    """Toont de printwachtrij: jobs die nog wachten, bezig zijn of definitief zijn mislukt."""
+    try:
+        queue = database.get_print_jobs()
+    except Exception as e:
+        current_app.logger.error(f"Fout bij ophalen van de printwachtrij: {e}")
+        flash('Kon de printwachtrij niet ophalen.', 'error')
+        queue = {'jobs': [], 'counts': {}}
+    return render_template('print_jobs.html', queue=queue, spooler_running=printer.get_spooler().running)
+
+@bp.route('/print-jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_print_job(job_id):
+    """Biedt een mislukte printjob opnieuw aan."""
+    try:
+        if database.retry_print_job(job_id):
+            flash(f'Printjob #{job_id} staat weer in de wachtrij.', 'success')
+        else:
+            flash(f'Printjob #{job_id} is niet (meer) mislukt.', 'warning')
+    except Exception as e:
+        current_app.logger.error(f"Fout bij opnieuw aanbieden van printjob: {e}")
+        flash('Er is een fout opgetreden bij het opnieuw aanbieden van de printjob.', 'error')
+    return redirect(url_for('main.print_jobs'))
+
+def _seal_legacy_notes(ticket_id, old_token, notes):
+    """Zet een oud token bij het bekijken om naar envelope encryptie; een fout hier is niet fataal."""
+    try:
+        envelope = utils.encrypt_notes(notes, g.key_handle)
+        if envelope:
+            database.seal_ticket_notes(ticket_id, old_token, *envelope)
+    except Exception as e:
+        current_app.logger.warning(f"Omzetten van gevoelige notities van ticket #{ticket_id} mislukt: {e}")
+
+def _group_attachments(ticket_id):
+    """Bijlagen van een ticket per reactie-id; bijlagen bij het ticket zelf staan onder None."""
+    grouped = {}
+    for attachment in database.get_attachments_for_ticket(ticket_id):
+        grouped.setdefault(attachment['comment_id'], []).append(attachment)
+    return grouped
+
+def _receive_uploads():
+    """
+    Kopieert de bestanden uit het 'attachments' veld naar de opslag (nog niet vastgelegd).
+    Met ATTACHMENTS_ENCRYPT worden ze met de sleutel van de sessie versleuteld.
+    """
+    master_key = utils.get_keyring().get(g.key_handle) if current_app.config.get('ATTACHMENTS_ENCRYPT') else None
+    uploads = []
+    try:
+        for file in request.files.getlist('attachments'):
+            # Alleen de naam zelf; sommige browsers sturen het volledige pad mee
+            filename = (file.filename or '').replace('\\', '/').rsplit('/', 1)[-1].strip()[:255]
+            if not filename:
+                continue
+            upload = attachments.receive(file.stream, master_key)
+            upload['filename'] = filename
+            upload['content_type'] = attachments.guess_content_type(filename)
+            uploads.append(upload)
+    except BaseException:
+        for upload in uploads:
+            attachments.discard(upload)
+        raise
+    return uploads
+
+def _flash_upload_too_large():
+    limit = current_app.config.get('MAX_CONTENT_LENGTH') or 0
+    flash(f'De bijlage is te groot (maximaal {limit // (1024 * 1024)} MB per keer).', 'error')
+
 @bp.route('/ticket/<int:ticket_id>')
 @login_required
+@conditional_page
 def view_ticket(ticket_id):
     """Toont de details van een specifiek ticket."""
     try:
@@ -140,31 +286,60 @@ def view_ticket(ticket_id):
         ticket = dict(ticket_data)  # Maak een muteerbare kopie
         if ticket.get('sensitive_notes'):
             try:
-                decrypted_notes = utils.decrypt_data(
+                decrypted_notes = utils.decrypt_notes(
                     ticket['sensitive_notes'],
-                    g.master_password,
+                    ticket.get('wrapped_key'),
+                    g.key_handle,
                 )
+                if utils.is_legacy_token(ticket['sensitive_notes']) and isinstance(decrypted_notes, str):
+                    _seal_legacy_notes(ticket_id, ticket['sensitive_notes'], decrypted_notes)
                 ticket['sensitive_notes'] = decrypted_notes
             except Exception as e:
                 current_app.logger.error(f"Fout bij ontcrypten van notities: {e}")
                 flash("Gevoelige notities kunnen niet worden weergegeven.", 'warning')
 
         # Haal gerelateerde data op voor het template
-        comments = database.get_comments_for_ticket(ticket_id)
-        templates = database.get_all_templates()
-        kb_articles = database.get_all_kb_articles()
+        hide_events = request.args.get('events') == '0'
+        timeline = database.get_comments_for_ticket(ticket_id, include_events=not hide_events)
+        ticket_attachments = _group_attachments(ticket_id)
 
+        # Sjablonen en artikelen worden via de typeahead opgezocht; alleen het gekoppelde
+        # artikel (al in 'ticket' via de join) hoort bij de pagina zelf.
         return render_template(
             'view_ticket.html',
             ticket=ticket,
-            comments=comments if hasattr(comments, '__iter__') else [],
-            templates=[dict(t) for t in templates] or [],
-            kb_articles=[dict(a) for a in kb_articles] or []
+            comments=timeline['comments'],
+            older_cursor=timeline['older_cursor'],
+            hide_events=hide_events,
+            attachments=ticket_attachments
         )
     except Exception as e:
         current_app.logger.error(f"Fout bij weergave van ticket: {e}")
         abort(500)
 
+@bp.route('/ticket/<int:ticket_id>/timeline')
+@login_required
+def ticket_timeline(ticket_id):
+    """Geeft een HTML-fragment met oudere tijdlijn-items terug voor de 'oudere items laden' knop."""
+    try:
+        hide_events = request.args.get('events') == '0'
+        timeline = database.get_comments_for_ticket(
+            ticket_id,
+            before=request.args.get('before'),
+            include_events=not hide_events
+        )
+        return render_template(
+            'timeline_items.html',
+            ticket_id=ticket_id,
+            comments=timeline['comments'],
+            older_cursor=timeline['older_cursor'],
+            hide_events=hide_events,
+            attachments=_group_attachments(ticket_id)
+        )
+    except Exception as e:
+        current_app.logger.error(f"Fout bij ophalen van tijdlijn: {e}")
+        abort(500)
+
 @bp.route('/ticket/<int:ticket_id>/assign', methods=['POST'])
 @login_required
 def assign(ticket_id):
@@ -208,14 +383,85 @@ def update(ticket_id):
             flash(f"Ongeldige status '{new_status}'. Gebruik een van: {', '.join(valid_statuses)}.", 'error')
             return redirect(url_for('main.view_ticket', ticket_id=ticket_id))
 
-        database.update_ticket(ticket_id, new_status, comment or None, g.user, old_status)
+        uploads = _receive_uploads()
+        try:
+            database.update_ticket(ticket_id, new_status, comment or None, g.user, old_status, uploads=uploads)
+        finally:
+            # Vastgelegde uploads staan al op hun plek; de rest wordt hier opgeruimd
+            for upload in uploads:
+                attachments.discard(upload)
         flash(f'Ticket #{ticket_id} status bijgewerkt van {old_status} naar {new_status}.', 'success')
+    except RequestEntityTooLarge:
+        _flash_upload_too_large()
     except Exception as e:
         current_app.logger.error(f"Fout bij update ticket: {e}")
         flash('Er is een fout opgetreden bij het opslaan van de updates.', 'error')
 
     return redirect(url_for('main.view_ticket', ticket_id=ticket_id))
 
+@bp.route('/ticket/<int:ticket_id>/attachments', methods=['POST'])
+@login_required
+def upload_attachments(ticket_id):
+    """Voegt een of meer bijlagen toe aan een ticket."""
+    try:
+        if not database.get_ticket_details_for_update(ticket_id):
+            flash(f'Ticket #{ticket_id} niet gevonden.', 'error')
+            return redirect(url_for('main.index'))
+
+        uploads = _receive_uploads()
+        if not uploads:
+            flash('Kies eerst een bestand om toe te voegen.', 'warning')
+            return redirect(url_for('main.view_ticket', ticket_id=ticket_id))
+        try:
+            database.add_ticket_attachments(ticket_id, uploads, g.user)
+        finally:
+            for upload in uploads:
+                attachments.discard(upload)
+        flash(f'{len(uploads)} bijlage(n) toegevoegd.', 'success')
+    except RequestEntityTooLarge:
+        _flash_upload_too_large()
+    except Exception as e:
+        current_app.logger.error(f"Fout bij toevoegen van bijlagen: {e}")
+        flash('Er is een fout opgetreden bij het opslaan van de bijlagen.', 'error')
+
+    return redirect(url_for('main.view_ticket', ticket_id=ticket_id))
+
+@bp.route('/attachment/<int:attachment_id>')
+@login_required
+def download_attachment(attachment_id):
+    """
+    Levert een bijlage, met ondersteuning voor range requests en conditional GET.
+    Het bestand wordt via wsgi.file_wrapper gestreamd; versleutelde blobs worden per blok
+    ontsleuteld. Alleen veilige types worden inline getoond, de rest als download.
+    """
+    attachment = database.get_attachment(attachment_id)
+    if not attachment:
+        abort(404)
+    try:
+        file = attachments.open_blob(attachment, utils.get_keyring().get(g.key_handle))
+    except FileNotFoundError:
+        current_app.logger.error(f"Blob van bijlage #{attachment_id} ontbreekt op schijf.")
+        abort(404)
+    except Exception as e:
+        current_app.logger.error(f"Fout bij openen van bijlage #{attachment_id}: {e}")
+        abort(403)
+
+    inline = attachment['content_type'] in attachments.INLINE_TYPES
+    response = send_file(
+        file,
+        mimetype=attachment['content_type'],
+        as_attachment=not inline,
+        download_name=attachment['filename'],
+        conditional=False,
+        etag=False
+    )
+    response.content_length = attachment['size']
+    response.set_etag(attachment['blob_id'])
+    response.cache_control.private = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = 'sandbox'
+    return response.make_conditional(request, accept_ranges=True, complete_length=attachment['size'])
+
 @bp.route('/ticket/<int:ticket_id>/link_kb', methods=['POST'])
 @login_required
 def link_kb(ticket_id):
@@ -253,3 +499,49 @@ def link_kb(ticket_id):
         flash('Er is een fout opgetreden bij het koppelen.', 'error')
 
     return redirect(url_for('main.view_ticket', ticket_id=ticket_id))
+
+@bp.route('/changes')
+@login_required
+def poll_changes():
+    """
+    Eén poll van de wijzigingsfeed: de wijzigingen aan tickets sinds de positie van de
+    client (Last-Event-ID, of ?last_id bij de eerste opvraging).
+
+    Dit is bewust geen doorlopende stream maar korte polling in het server-sent events
+    formaat: alles wat klaarstaat wordt in één keer geleverd en het antwoord sluit, waarna
+    EventSource na 'retry' milliseconden opnieuw vraagt met de laatst ontvangen id. Een
+    open stream zou per tab een van de waitress threads bezet houden.
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    if last_id is not None and last_id < 0:
+        abort(400)  # Posities in de feed zijn nooit negatief
+
+    try:
+        feed = database.get_changes_since(last_id, limit=current_app.config.get('CHANGES_POLL_LIMIT', 200))
+    except Exception as e:
+        current_app.logger.error(f"Fout bij ophalen van wijzigingen: {e}")
+        abort(500)
+
+    lines = [f"retry: {current_app.config.get('CHANGES_POLL_INTERVAL_MS', 3000)}\n\n"]
+    if feed['reset']:
+        lines.append('event: reset\ndata: {}\n\n')
+    for change in feed['changes']:
+        data = {
+            'id': change['ticket_id'],
+            'kinds': change['kinds'].split(','),
+            'title': change['title'],
+            'status': change['status'],
+            'priority': change['priority'],
+            'assigned_to': change['assigned_to']
+        }
+        lines.append(f"id: {change['id']}\nevent: ticket\ndata: {json.dumps(data)}\n\n")
+    # Zonder data wordt er niets afgeleverd, maar de browser onthoudt de positie wel
+    lines.append(f"id: {feed['last_id']}\n\n")
+
+    response = current_app.response_class(''.join(lines), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
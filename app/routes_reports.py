@@ -1,21 +1,343 @@
-from flask import Blueprint, render_template, Response, current_app, abort
+from flask import Blueprint, render_template, Response, current_app, abort, request, jsonify, make_response, g
+from markupsafe import Markup
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import base64
+import hashlib
+import json
+import threading
+import time
 from . import database, utils
 from .auth import login_required
 
 bp = Blueprint('reports', __name__, url_prefix='/reports')
 
+# De grafieken op de rapportagepagina: (dimensie, titel, grafiektype, alt-tekst, volle breedte)
+DASHBOARD_CHARTS = [
+    ('status', "Tickets per Status", 'pie', "Cirkeldiagram van tickets per status", False),
+    ('priority', "Tickets per Prioriteit", 'pie', "Cirkeldiagram van tickets per prioriteit", False),
+    ('assignment', "Ticket Toewijzingen", 'pie', "Cirkeldiagram van toegewezen vs. niet-toegewezen tickets", False),
+    ('kb_category', "Kennisbank Artikelen per Categorie", 'bar', "Staafdiagram van kennisbank artikelen per categorie", True),
+]
+
+def _parse_window_bound(value, is_until):
+    """
+    Zet een since/until parameter om naar een ISO string die vergelijkbaar is met created_at.
+    Een kale datum als 'until' telt de hele dag mee (de grens is exclusief).
+    """
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f"Ongeldige datum: {value}")
+    if is_until and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.isoformat()
+
+def _get_window():
+    """Leest het optionele tijdvenster (since/until) uit de query string."""
+    since = request.args.get('since', '').strip()
+    until = request.args.get('until', '').strip()
+    return (
+        _parse_window_bound(since, False) if since else None,
+        _parse_window_bound(until, True) if until else None
+    )
+
+def _dashboard_payload(since, until):
+    """Stelt alle dashboardcijfers samen uit één momentopname van de database."""
+    stats = database.get_dashboard_stats(since, until)
+    return {
+        'window': {'since': since, 'until': until},
+        'totals': {
+            'tickets': sum(stats['status'].values()),
+            'kb_articles': sum(stats['kb_category'].values())
+        },
+        **stats
+    }
+
+def _conditional_response(etag, build_response):
+    """Geeft een 304 als de client deze versie al heeft, anders de response van build_response()."""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = build_response()
+        if response.cache_control.no_store:
+            return response  # Onvolledige pagina (bijv. een mislukte grafiek): niet hergebruiken
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _page_etag(payload):
+    """ETag van een rapportagepagina: de data, het grafiekformaat en de gebruiker (in de navigatie)."""
+    return hashlib.sha256(
+        json.dumps([payload, utils.chart_mimetype(), g.user], ensure_ascii=False).encode()
+    ).hexdigest()[:32]
+
+def _inline_charts(specs):
+    """
+    Grafieken voor inline weergave: SVG markup of een PNG data URI, per spec
+    (chart_type, titel, data, soort, alt-tekst, volle breedte).
+    Alle ontbrekende grafieken worden eerst tegelijk aan de render pool aangeboden en daarna
+    opgehaald, zodat de pagina zo lang duurt als de traagste render in plaats van de som.
+    Een grafiek die niet binnen CHART_RENDER_TIMEOUT klaar is, wordt een placeholder ('error').
+    """
+    cache = _get_chart_cache()
+    mimetype = utils.chart_mimetype()
+    pending = []
+    for chart_type, title, chart_data, kind, alt, full_width in specs:
+        etag = _chart_fingerprint(f'{chart_type}:{mimetype}', title, chart_data)
+        image = cache.get(etag)
+        future = None
+        if image is None:
+            try:
+                future = utils.submit_chart(kind, chart_data, title)
+            except Exception as e:
+                current_app.logger.error(f"Grafiek '{title}' kon niet worden aangeboden: {e}")
+        pending.append(({'title': title, 'alt': alt, 'full_width': full_width}, etag, image, future))
+
+    deadline = time.monotonic() + current_app.config.get('CHART_RENDER_TIMEOUT', 10.0)
+    charts = []
+    for chart, etag, image, future in pending:
+        if image is None and future is not None:
+            try:
+                image = future.result(timeout=max(deadline - time.monotonic(), 0))
+                cache.put(etag, image)
+            except Exception as e:
+                future.cancel()
+                current_app.logger.error(f"Grafiek '{chart['title']}' kon niet worden gerenderd: {e!r}")
+        if image is None:
+            chart['error'] = True
+        elif mimetype == 'image/svg+xml':
+            chart['svg'] = Markup(image.decode('utf-8'))
+        else:
+            chart['src'] = 'data:image/png;base64,' + base64.b64encode(image).decode('ascii')
+        charts.append(chart)
+    return charts
+
+def _chart_page(template, charts, **context):
+    """Rendert een pagina met inline grafieken; met een placeholder erin wordt hij niet gecachet."""
+    response = make_response(render_template(template, charts=charts, **context))
+    if any(chart.get('error') for chart in charts):
+        response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @bp.route('/')
 @login_required
 def reports_index():
-    """Toont de hoofdpagina van de rapportages."""
-    return render_template('reports.html')
+    """
+    Toont de hoofdpagina van de rapportages.
+    Alle grafieken komen uit één payload en worden inline in de pagina gezet,
+    zodat de pagina in één request compleet is.
+    """
+    since, until = _get_window()
+    try:
+        payload = _dashboard_payload(since, until)
+    except Exception as e:
+        current_app.logger.error(f"Fout bij ophalen van dashboardstatistieken: {e}")
+        abort(503)
+
+    etag = _page_etag(payload)
+
+    def build_page():
+        charts = _inline_charts([
+            (dimension, title, payload[dimension], kind, alt, full_width)
+            for dimension, title, kind, alt, full_width in DASHBOARD_CHARTS
+        ])
+        return _chart_page(
+            'reports.html', charts, totals=payload['totals'],
+            since=request.args.get('since', ''), until=request.args.get('until', '')
+        )
+
+    return _conditional_response(etag, build_page)
+
+@bp.route('/stats.json')
+@login_required
+def stats_json():
+    """
+    Alle dashboardaggregaties in één JSON payload, uit één leestransactie.
+    Ondersteunt een since/until venster en conditional GET via de ETag.
+    """
+    since, until = _get_window()
+    try:
+        payload = _dashboard_payload(since, until)
+    except Exception as e:
+        current_app.logger.error(f"Fout bij ophalen van dashboardstatistieken: {e}")
+        abort(503)
+
+    body = json.dumps(payload, ensure_ascii=False)
+    etag = hashlib.sha256(body.encode()).hexdigest()[:32]
+    return _conditional_response(etag, lambda: Response(body, mimetype='application/json'))
+
+class ChartCache:
+    """
+    Begrensde LRU cache van gerenderde grafieken (PNG/SVG bytes), op sleutel van de data-fingerprint.
+    Houdt hit/miss tellers bij zodat de werking van de cache te controleren is.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png
 
-def _create_chart_response(chart_buffer):
-    """Creëert een Flask Response object voor een grafiek met caching headers."""
-    response = Response(chart_buffer.getvalue(), mimetype='image/png')
-    response.headers['Cache-Control'] = 'public, max-age=60'
+    def put(self, key, png):
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None
+            }
+
+_chart_cache = None
+_chart_cache_lock = threading.Lock()
+
+def _get_chart_cache():
+    """Geeft de (lazy aangemaakte) grafiekcache met de geconfigureerde grootte."""
+    global _chart_cache
+    with _chart_cache_lock:
+        if _chart_cache is None:
+            _chart_cache = ChartCache(current_app.config.get('CHART_CACHE_SIZE', 32))
+        return _chart_cache
+
+def _chart_fingerprint(chart_type, title, chart_data):
+    """Berekent een sterke ETag op basis van het grafiektype en de onderliggende data."""
+    payload = json.dumps([chart_type, title, list(chart_data.items())], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+def _get_chart_image(chart_type, title, chart_data, kind, etag=None):
+    """
+    Geeft de afbeelding (PNG of SVG, zie CHART_FORMAT) van een grafiek uit de cache,
+    of rendert deze eenmalig als type 'kind' ('pie'/'bar').
+    """
+    cache = _get_chart_cache()
+    if etag is None:
+        etag = _chart_fingerprint(f'{chart_type}:{utils.chart_mimetype()}', title, chart_data)
+    image = cache.get(etag)
+    if image is None:
+        image = utils.render_chart(kind, chart_data, title)
+        cache.put(etag, image)
+    return image
+
+def _create_chart_response(chart_type, title, chart_data, kind):
+    """
+    Creëert een Flask Response object voor een grafiek met caching headers.
+    Een ongewijzigde grafiek levert een 304 op; anders komt de afbeelding uit _get_chart_image().
+    """
+    mimetype = utils.chart_mimetype()
+    etag = _chart_fingerprint(f'{chart_type}:{mimetype}', title, chart_data)
+
+    if request.if_none_match.contains(etag):
+        _get_chart_cache().record_not_modified()
+        response = Response(status=304)
+    else:
+        response = Response(_get_chart_image(chart_type, title, chart_data, kind, etag), mimetype=mimetype)
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=60'
     return response
 
+def _get_analytics_args():
+    """
+    Venster en granulariteit voor de analyses. Het venster wordt afgerond op hele dagen
+    (until exclusief); standaard de laatste ANALYTICS_DEFAULT_DAYS dagen tot en met vandaag.
+    """
+    since, until = _get_window()
+    until_day = until[:10] if until else (date.today() + timedelta(days=1)).isoformat()
+    if since:
+        since_day = since[:10]
+    else:
+        days = current_app.config.get('ANALYTICS_DEFAULT_DAYS', 30)
+        since_day = (date.fromisoformat(until_day) - timedelta(days=days)).isoformat()
+    if since_day >= until_day:
+        abort(400, description="De begindatum moet vóór de einddatum liggen.")
+
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('day', 'week'):
+        abort(400, description=f"Ongeldige granulariteit: {granularity}")
+    return since_day, until_day, granularity
+
+def _analytics_payload():
+    """Haalt de analyses op voor het gevraagde venster, of antwoordt met 503 bij een fout."""
+    from . import analytics  # Importeert NumPy pas als de analyses worden opgevraagd
+    since, until, granularity = _get_analytics_args()
+    try:
+        return analytics.get_analytics(since, until, granularity)
+    except Exception as e:
+        current_app.logger.error(f"Fout bij berekenen van analyses: {e}")
+        abort(503)
+
+@bp.route('/analytics')
+@login_required
+def analytics_index():
+    """Toont de trends (aangemaakt/opgelost per periode) en de SLA-percentielen."""
+    payload = _analytics_payload()
+    period = 'Week' if payload['granularity'] == 'week' else 'Dag'
+
+    def build_page():
+        throughput = payload['throughput']
+        charts = _inline_charts([
+            (f"analytics_created_{payload['granularity']}", f"Aangemaakte Tickets per {period}",
+             dict(zip(throughput['labels'], throughput['created'])), 'bar',
+             f"Staafdiagram van aangemaakte tickets per {period.lower()}", True),
+            (f"analytics_resolved_{payload['granularity']}", f"Opgeloste Tickets per {period}",
+             dict(zip(throughput['labels'], throughput['resolved'])), 'bar',
+             f"Staafdiagram van opgeloste tickets per {period.lower()}", True),
+        ])
+        until_inclusive = date.fromisoformat(payload['window']['until']) - timedelta(days=1)
+        return _chart_page(
+            'analytics.html', charts, payload=payload,
+            since=payload['window']['since'], until=until_inclusive.isoformat()
+        )
+
+    return _conditional_response(_page_etag(payload), build_page)
+
+@bp.route('/analytics.json')
+@login_required
+def analytics_json():
+    """De trends en SLA-percentielen (doorlooptijden in seconden) als JSON, met conditional GET."""
+    body = json.dumps(_analytics_payload(), ensure_ascii=False)
+    etag = hashlib.sha256(body.encode()).hexdigest()[:32]
+    return _conditional_response(etag, lambda: Response(body, mimetype='application/json'))
+
+@bp.route('/chart_cache.json')
+@login_required
+def chart_cache_stats():
+    """Toont de hit/miss statistieken van de grafiekcache."""
+    return jsonify(_get_chart_cache().stats())
+
+@bp.route('/reference_cache.json')
+@login_required
+def reference_cache_stats():
+    """Toont de hit/miss statistieken van de referentiedata cache (kennisbank en sjablonen)."""
+    return jsonify(current_app.extensions['reference_cache'].stats())
+
 def _process_db_data_to_dict(db_data):
     """Converteert database rijen (lijst van Row-objecten) naar een simpele dictionary."""
     if not db_data:
@@ -40,8 +362,7 @@ def status_chart():
     try:
         db_data = database.get_status_counts()
         chart_data = _process_db_data_to_dict(db_data)
-        chart_buffer = utils.generate_pie_chart(chart_data, "Tickets per Status")
-        return _create_chart_response(chart_buffer)
+        return _create_chart_response('status', "Tickets per Status", chart_data, 'pie')
     except Exception as e:
         current_app.logger.error(f"Fout bij genereren van status grafiek: {e}")
         abort(503)
@@ -53,8 +374,7 @@ def priority_chart():
     try:
         db_data = database.get_priority_counts()
         chart_data = _process_db_data_to_dict(db_data)
-        chart_buffer = utils.generate_pie_chart(chart_data, "Tickets per Prioriteit")
-        return _create_chart_response(chart_buffer)
+        return _create_chart_response('priority', "Tickets per Prioriteit", chart_data, 'pie')
     except Exception as e:
         current_app.logger.error(f"Fout bij genereren van prioriteit grafiek: {e}")
         abort(503)
@@ -66,8 +386,7 @@ def assignment_chart():
     try:
         db_data = database.get_assignment_counts()
         chart_data = _process_db_data_to_dict(db_data)
-        chart_buffer = utils.generate_pie_chart(chart_data, "Toegewezen vs. Niet-toegewezen")
-        return _create_chart_response(chart_buffer)
+        return _create_chart_response('assignment', "Toegewezen vs. Niet-toegewezen", chart_data, 'pie')
     except Exception as e:
         current_app.logger.error(f"Fout bij genereren van assignment grafiek: {e}")
         abort(503)
@@ -79,11 +398,7 @@ def kb_chart():
     try:
         db_data = database.get_kb_category_counts()
         chart_data = _process_db_data_to_dict(db_data)
-        chart_buffer = utils.generate_bar_chart(
-            chart_data,
-            "KB Artikelen per Categorie"
-        )
-        return _create_chart_response(chart_buffer)
+        return _create_chart_response('kb_category', "KB Artikelen per Categorie", chart_data, 'bar')
     except Exception as e:
         current_app.logger.error(f"Fout bij genereren van KB grafiek: {e}")
         abort(503)
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Zo vroeg mogelijk vastgelegd: het moment waarop het 'app' package werd geladen.
+PROCESS_STARTED = time.perf_counter()
+
+class StartupTimer:
+    """
+    Meet de duur van de opstartfases (imports, database, blueprints) en de tijd tot de
+    eerste response. Alleen actief als PYDESK_STARTUP_TIMING=1 is gezet, zodat regressies
+    in de opstarttijd van het executable tussen releases te volgen zijn.
+    """
+
+    def __init__(self, enabled=None):
+        if enabled is None:
+            enabled = os.environ.get('PYDESK_STARTUP_TIMING') == '1'
+        self.enabled = enabled
+        self.phases = []
+
+    def record(self, name, seconds):
+        """Legt een al gemeten fase vast."""
+        if self.enabled:
+            self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name):
+        """Meet de duur van het blok als fase 'name'."""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def report(self):
+        """Print een overzicht van alle gemeten fases."""
+        if not self.enabled:
+            return
+        print("PyDesk opstarttijden:")
+        for name, seconds in self.phases:
+            print(f"  {name:<28} {seconds * 1000:8.1f} ms")
+        print(f"  {'totaal sinds import app':<28} {(time.perf_counter() - PROCESS_STARTED) * 1000:8.1f} ms")
+        heavy = [m for m in ('matplotlib', 'markdown', 'cryptography') if m in sys.modules]
+        print(f"  al geladen zware modules: {', '.join(heavy) or 'geen'}")
+
+    def install_first_response_hook(self, app):
+        """Rapporteert eenmalig de tijd tot de eerste afgeronde response."""
+        if not self.enabled:
+            return
+        reported = []
+
+        @app.after_request
+        def report_first_response(response):
+            if not reported:
+                reported.append(True)
+                elapsed = time.perf_counter() - PROCESS_STARTED
+                print(f"PyDesk eerste response ({response.status_code}) na {elapsed * 1000:.1f} ms")
+            return response
@@ -0,0 +1,137 @@
+import math
+from io import BytesIO
+from html import escape
+from .utils import has_chart_data, aggregate_small_slices
+
+# ==============================================================================
+# SVG GRAFIEKEN
+# Puur-Python alternatief voor de matplotlib grafieken in utils.py, met dezelfde
+# interface (data_dict, title) -> BytesIO. Levert compacte SVG zonder matplotlib,
+# numpy of pillow; te kiezen met CHART_FORMAT = 'svg' in config/settings.py.
+# ==============================================================================
+
+WIDTH, HEIGHT = 800, 500  # Zelfde afmetingen als de PNG variant (8x5 inch op 100 dpi)
+FONT = 'font-family="-apple-system, Segoe UI, Roboto, Arial, sans-serif"'
+
+# De standaard matplotlib kleurencyclus ('tab10'), zodat beide backends er hetzelfde uitzien
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+          '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+BAR_COLOR = '#1f9e89'  # viridis(0.6)
+
+def _fmt(value: float) -> str:
+    """Compacte getalnotatie voor coördinaten."""
+    return f'{value:.1f}'.rstrip('0').rstrip('.')
+
+def _text(x, y, content, size=13, anchor='middle', extra=''):
+    return (f'<text x="{_fmt(x)}" y="{_fmt(y)}" font-size="{size}" text-anchor="{anchor}" '
+            f'dominant-baseline="middle"{extra}>{escape(str(content))}</text>')
+
+def _document(title: str, body: list) -> BytesIO:
+    """Verpakt de elementen in een SVG document met titel."""
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {WIDTH} {HEIGHT}" '
+        f'width="{WIDTH}" height="{HEIGHT}" {FONT} fill="#2d3748">',
+        _text(WIDTH / 2, 30, title, size=16),
+        *body,
+        '</svg>'
+    ]
+    return BytesIO(''.join(parts).encode('utf-8'))
+
+def _empty_state(title: str) -> BytesIO:
+    return _document(title, [_text(WIDTH / 2, HEIGHT / 2, "Geen data beschikbaar")])
+
+def _point(cx, cy, radius, angle):
+    """Punt op een cirkel; hoeken in graden, 0 = rechts, tegen de klok in (zoals matplotlib)."""
+    rad = math.radians(angle)
+    return cx + radius * math.cos(rad), cy - radius * math.sin(rad)
+
+def generate_pie_chart(data_dict: dict, title: str) -> BytesIO:
+    """Genereert een donut-stijl cirkeldiagram als SVG."""
+    if not has_chart_data(data_dict):
+        return _empty_state(title)
+
+    filtered_data = {k: v for k, v in aggregate_small_slices(data_dict).items() if v > 0}
+    total = sum(filtered_data.values())
+    cx, cy, outer = WIDTH / 2, HEIGHT / 2 + 20, 180
+    inner = outer * 0.6  # wedge breedte 0.4, zoals in de matplotlib variant
+
+    body = []
+    angle = 90.0  # startangle=90: de eerste punt begint bovenaan
+    for index, (label, value) in enumerate(filtered_data.items()):
+        color = COLORS[index % len(COLORS)]
+        sweep = 360.0 * value / total
+        end = angle + sweep
+
+        if sweep >= 359.99:
+            # Een volledige ring kan niet als één boog; teken twee cirkels met evenodd
+            path = (f'M{_fmt(cx - outer)} {_fmt(cy)}a{outer} {outer} 0 1 0 {outer * 2} 0a{outer} {outer} 0 1 0 {-outer * 2} 0'
+                    f'M{_fmt(cx - inner)} {_fmt(cy)}a{_fmt(inner)} {_fmt(inner)} 0 1 0 {_fmt(inner * 2)} 0a{_fmt(inner)} {_fmt(inner)} 0 1 0 {_fmt(-inner * 2)} 0Z')
+            body.append(f'<path d="{path}" fill="{color}" fill-rule="evenodd" stroke="#fff"/>')
+        else:
+            large = 1 if sweep > 180 else 0
+            x1, y1 = _point(cx, cy, outer, angle)
+            x2, y2 = _point(cx, cy, outer, end)
+            x3, y3 = _point(cx, cy, inner, end)
+            x4, y4 = _point(cx, cy, inner, angle)
+            path = (f'M{_fmt(x1)} {_fmt(y1)}A{outer} {outer} 0 {large} 0 {_fmt(x2)} {_fmt(y2)}'
+                    f'L{_fmt(x3)} {_fmt(y3)}A{_fmt(inner)} {_fmt(inner)} 0 {large} 1 {_fmt(x4)} {_fmt(y4)}Z')
+            body.append(f'<path d="{path}" fill="{color}" stroke="#fff"/>')
+
+        middle = angle + sweep / 2
+        px, py = _point(cx, cy, (outer + inner) / 2, middle)
+        body.append(_text(px, py, f'{100.0 * value / total:.1f}%', size=12, extra=' fill="#fff"'))
+        lx, ly = _point(cx, cy, outer + 18, middle)
+        anchor = 'start' if math.cos(math.radians(middle)) > 0.01 else 'end' if math.cos(math.radians(middle)) < -0.01 else 'middle'
+        body.append(_text(lx, ly, label, anchor=anchor))
+        angle = end
+
+    return _document(title, body)
+
+def _nice_step(maximum: float, max_ticks: int = 6) -> float:
+    """Kiest een 'mooie' stapgrootte (1, 2 of 5 x 10^n) voor de y-as."""
+    raw = maximum / max_ticks
+    magnitude = 10 ** math.floor(math.log10(raw)) if raw > 0 else 1
+    for factor in (1, 2, 5, 10):
+        if raw <= factor * magnitude:
+            return max(factor * magnitude, 1)
+    return 10 * magnitude
+
+def generate_bar_chart(data_dict: dict, title: str) -> BytesIO:
+    """Genereert een staafdiagram als SVG."""
+    if not has_chart_data(data_dict):
+        return _empty_state(title)
+
+    left, right, top, bottom = 70, WIDTH - 30, 70, HEIGHT - 110
+    plot_width, plot_height = right - left, bottom - top
+    step = _nice_step(max(data_dict.values()))
+    y_max = step * math.ceil(max(data_dict.values()) / step)
+
+    body = []
+    # Y-as met rasterlijnen
+    tick = 0
+    while tick <= y_max:
+        y = bottom - plot_height * tick / y_max
+        body.append(f'<line x1="{left}" y1="{_fmt(y)}" x2="{right}" y2="{_fmt(y)}" stroke="#e2e8f0"/>')
+        body.append(_text(left - 8, y, f'{tick:g}', size=12, anchor='end'))
+        tick += step
+    body.append(f'<line x1="{left}" y1="{top}" x2="{left}" y2="{bottom}" stroke="#2d3748"/>')
+    body.append(f'<line x1="{left}" y1="{bottom}" x2="{right}" y2="{bottom}" stroke="#2d3748"/>')
+
+    # Staven met schuine labels (45 graden, zoals tick_params(rotation=45))
+    slot = plot_width / len(data_dict)
+    bar_width = slot * 0.8
+    for index, (label, value) in enumerate(data_dict.items()):
+        x = left + slot * index + (slot - bar_width) / 2
+        height = plot_height * value / y_max
+        body.append(f'<rect x="{_fmt(x)}" y="{_fmt(bottom - height)}" width="{_fmt(bar_width)}" '
+                    f'height="{_fmt(height)}" fill="{BAR_COLOR}"/>')
+        lx = x + bar_width / 2
+        body.append(_text(lx, bottom + 14, label, size=12, anchor='end',
+                          extra=f' transform="rotate(-45 {_fmt(lx)} {bottom + 14})"'))
+
+    return _document(title, body)
+
+SVG_GENERATORS = {
+    'pie': generate_pie_chart,
+    'bar': generate_bar_chart,
+}
@@ -1,15 +1,20 @@
 import base64
-import functools
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.fernet import Fernet, InvalidToken
-import matplotlib as mpl
-mpl.use('Agg')  # Zorg ervoor dat we geen GUI backend gebruiken
-import matplotlib.pyplot as plt
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 from io import BytesIO
 from datetime import datetime
 from flask import current_app
 
+# Zware afhankelijkheden (cryptography, matplotlib) worden pas bij het eerste gebruik
+# geïmporteerd, zodat het opstarten en de loginpagina er niet op hoeven te wachten.
+
 # --- DATUMFORMATTERING FUNCTIE ---
 def format_datetime(value, format='%d-%m-%Y %H:%M'):
     """Converteert een ISO-datumstring naar een leesbaar formaat."""
@@ -27,8 +32,44 @@ def format_datetime(value, format='%d-%m-%Y %H:%M'):
     except AttributeError:
         return str(dt_object)
 
+def format_filesize(value):
+    """Toont een aantal bytes als leesbare grootte, bijv. '1,5 MB'."""
+    size = float(value or 0)
+    for unit in ('bytes', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'bytes' else f"{size:.1f} {unit}".replace('.', ',')
+        size /= 1024
+    return f"{size:.1f} GB".replace('.', ',')
+
+# --- MARKDOWN FUNCTIES ---
+MARKDOWN_EXTENSIONS = ('fenced_code', 'tables')
+MARKDOWN_RENDER_REVISION = 1  # Verhogen als de opgeslagen HTML om een andere reden opnieuw moet
+_markdown_local = threading.local()
+
+def markdown_renderer_version() -> str:
+    """
+    Stempel van de renderer waarmee opgeslagen HTML is gemaakt. Verandert bij een nieuwe
+    versie van de markdown library, andere extensies of een hogere MARKDOWN_RENDER_REVISION.
+    """
+    import markdown
+    return f"{MARKDOWN_RENDER_REVISION}:{markdown.__version__}:{','.join(MARKDOWN_EXTENSIONS)}"
+
+def render_markdown(text: str) -> str:
+    """
+    Zet Markdown om naar HTML met een per-thread hergebruikte Markdown instantie.
+    Het opbouwen van de instantie (extensies laden, parsers registreren) gebeurt zo maar
+    één keer per thread; reset() wist alleen de toestand van de vorige conversie.
+    """
+    md = getattr(_markdown_local, 'instance', None)
+    if md is None:
+        import markdown  # Pas laden wanneer er echt een artikel wordt gerenderd
+        md = _markdown_local.instance = markdown.Markdown(extensions=list(MARKDOWN_EXTENSIONS))
+    return md.reset().convert(text or '')
+
 # --- ENCRYPTIE FUNCTIES ---
-@functools.lru_cache(maxsize=128)
+# De sleutel wordt één keer bij het inloggen afgeleid en in de KeyRing van het proces bewaard.
+# De sessie bevat alleen een ondoorzichtig handvat; het wachtwoord zelf wordt niet bewaard.
+
 def generate_key_from_password(password: str, salt=None, iterations=None):
     """Genereert een encryptiesleutel van een wachtwoord met PBKDF2HMAC."""
     if not password or isinstance(password, str) and not password.strip():
@@ -38,6 +79,8 @@ def generate_key_from_password(password: str, salt=None, iterations=None):
     iterations = iterations or config.get('ENCRYPTION_ITERATIONS', 480000)
     if not salt:
         raise ValueError("Geen zout beschikbaar voor encryptie")
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
@@ -46,28 +89,170 @@ def generate_key_from_password(password: str, salt=None, iterations=None):
     )
     return base64.urlsafe_b64encode(kdf.derive(password.encode()))
 
-def encrypt_data(data: str, password: str) -> str | None:
-    """Versleutelt de gegeven data met een afgeleide sleutel."""
+class KeyRing:
+    """
+    Afgeleide sleutels per sessie, opgezocht via een willekeurig handvat.
+
+    Sleutels die langer dan idle_ttl seconden niet zijn gebruikt, worden verwijderd; de
+    gebruiker moet dan opnieuw inloggen. Gelijktijdige afleidingen van hetzelfde wachtwoord
+    (single-flight) wachten op de eerste in plaats van zelf PBKDF2 uit te voeren.
+    """
+
+    def __init__(self, idle_ttl=3600):
+        self.idle_ttl = idle_ttl
+        self._entries = {}   # handvat -> [sleutel, laatst gebruikt]
+        self._inflight = {}  # vingerafdruk van het wachtwoord -> Future van de afleiding
+        self._lock = threading.Lock()
+        self._secret = os.urandom(32)  # Maakt de vingerafdrukken alleen binnen dit proces bruikbaar
+        self._last_sweep = time.monotonic()
+
+    def _sweep(self, now):
+        """Verwijdert verlopen sleutels; hooguit een paar keer per TTL (houdt de lock al vast)."""
+        if now - self._last_sweep < self.idle_ttl / 4:
+            return
+        self._last_sweep = now
+        expired = [handle for handle, (_, used) in self._entries.items() if now - used > self.idle_ttl]
+        for handle in expired:
+            del self._entries[handle]
+
+    def open(self, password: str, **kdf_options) -> str:
+        """Leidt de sleutel van password af en geeft een nieuw handvat ervoor terug."""
+        fingerprint = hmac.new(self._secret, password.encode(), hashlib.sha256).digest()
+        with self._lock:
+            future = self._inflight.get(fingerprint)
+            owner = future is None
+            if owner:
+                future = self._inflight[fingerprint] = Future()
+
+        if owner:
+            try:
+                future.set_result(generate_key_from_password(password, **kdf_options))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._inflight[fingerprint]
+        key = future.result()
+
+        handle = secrets.token_urlsafe(32)
+        with self._lock:
+            now = time.monotonic()
+            self._sweep(now)
+            self._entries[handle] = [key, now]
+        return handle
+
+    def get(self, handle):
+        """Geeft de sleutel bij handle (en markeert hem als gebruikt), of None als hij verlopen is."""
+        if not handle:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self._sweep(now)
+            entry = self._entries.get(handle)
+            if entry is None or now - entry[1] > self.idle_ttl:
+                self._entries.pop(handle, None)
+                return None
+            entry[1] = now
+            return entry[0]
+
+    def close(self, handle):
+        """Verwijdert de sleutel bij handle, bijvoorbeeld bij uitloggen."""
+        with self._lock:
+            self._entries.pop(handle, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+def init_keyring(app):
+    """Maakt de KeyRing aan op basis van de configuratie en registreert deze op de app."""
+    keyring = KeyRing(idle_ttl=app.config.get('KEYRING_IDLE_TTL', 3600))
+    app.extensions['keyring'] = keyring
+    return keyring
+
+def get_keyring() -> KeyRing:
+    return current_app.extensions['keyring']
+
+def _master_key(key_handle) -> bytes:
+    """De hoofdsleutel achter key_handle; LookupError als die er niet (meer) is."""
+    key = get_keyring().get(key_handle)
+    if key is None:
+        raise LookupError("Geen encryptiesleutel voor deze sessie")
+    return key
+
+# --- Envelope encryptie ---
+# Elk ticket krijgt een eigen, willekeurige data key. Alleen die data key wordt met de
+# hoofdsleutel (afgeleid van het hoofdwachtwoord) versleuteld ('omhuld') en apart bewaard
+# in ticket_keys. Een nieuw hoofdwachtwoord vraagt daardoor alleen het opnieuw omhullen van
+# de kleine data keys, niet het opnieuw versleutelen van alle notities.
+ENVELOPE_PREFIX = 'env1:'  # Tokens zonder dit voorvoegsel zijn direct met de hoofdsleutel versleuteld
+
+def master_key_id(master_key: bytes) -> str:
+    """Korte, niet-omkeerbare aanduiding van een hoofdsleutel, opgeslagen bij elke omhulde data key."""
+    return hmac.new(master_key, b'pydesk-master-key-id', hashlib.sha256).hexdigest()[:16]
+
+def is_legacy_token(token) -> bool:
+    """Geeft aan of een token nog van vóór de envelope encryptie is."""
+    return bool(token) and not token.startswith(ENVELOPE_PREFIX)
+
+def _seal(data: str, master_key: bytes):
+    """Versleutelt data met een nieuwe data key: (token, omhulde data key)."""
+    from cryptography.fernet import Fernet
+    data_key = Fernet.generate_key()
+    token = ENVELOPE_PREFIX + Fernet(data_key).encrypt(data.encode()).decode()
+    return token, Fernet(master_key).encrypt(data_key).decode()
+
+def encrypt_notes(data: str, key_handle: str) -> tuple | None:
+    """
+    Versleutelt de gegeven data met een nieuwe data key, omhuld met de sleutel van de sessie.
+    Retourneert (token, omhulde data key, id van de hoofdsleutel), of None bij een fout.
+    """
     if not isinstance(data, str):
-        current_app.logger.warning(f"Ongeldig type gegeven aan encrypt_data: {type(data)}")
+        current_app.logger.warning(f"Ongeldig type gegeven aan encrypt_notes: {type(data)}")
         return None
     try:
-        key = generate_key_from_password(password)
-        f = Fernet(key)
-        encrypted_bytes = f.encrypt(data.encode())
-        return encrypted_bytes.decode()
+        master_key = _master_key(key_handle)
+        return (*_seal(data, master_key), master_key_id(master_key))
     except Exception as e:
         current_app.logger.error(f"Fout bij versleutelen: {e}")
         return None
 
-def decrypt_data(encrypted_data: str, password: str) -> str | bytes:
-    """Ontsleutelt de gegeven data met een afgeleide sleutel."""
+def open_notes(master_key: bytes, token: str, wrapped_key: str | None) -> str:
+    """
+    Ontsleutelt een envelope token of een oud token direct met de hoofdsleutel.
+    Gooit InvalidToken als het niet met deze hoofdsleutel te openen is.
+    """
+    from cryptography.fernet import Fernet
+    if not token.startswith(ENVELOPE_PREFIX):
+        return Fernet(master_key).decrypt(token.encode()).decode()
+    if not wrapped_key:
+        raise LookupError("Geen data key bij dit token")
+    data_key = Fernet(master_key).decrypt(wrapped_key.encode())
+    return Fernet(data_key).decrypt(token[len(ENVELOPE_PREFIX):].encode()).decode()
+
+def decrypt_notes(token: str, wrapped_key: str | None, key_handle: str) -> str | bytes:
+    """Ontsleutelt een token van encrypt_notes(); oude tokens gaan via decrypt_data()."""
+    if not isinstance(token, str):
+        current_app.logger.warning(f"Ongeldig type gegeven aan decrypt_notes: {type(token)}")
+        return b"DECRYPTIE MISLUKT"
+    if not token.startswith(ENVELOPE_PREFIX):
+        return decrypt_data(token, key_handle)
+    from cryptography.fernet import InvalidToken
+    try:
+        return open_notes(_master_key(key_handle), token, wrapped_key)
+    except InvalidToken:
+        return b"DECRYPTIE MISLUKT (ongeldig token)"
+    except Exception as e:
+        current_app.logger.error(f"Fout bij ontsleutelen: {e}")
+        return b"DECRYPTIE MISLUKT"
+
+def decrypt_data(encrypted_data: str, key_handle: str) -> str | bytes:
+    """Ontsleutelt data die direct met de sleutel van de sessie is versleuteld (oude tokens)."""
     if not isinstance(encrypted_data, str):
         current_app.logger.warning(f"Ongeldig type gegeven aan decrypt_data: {type(encrypted_data)}")
         return b"DECRYPTIE MISLUKT"
+    from cryptography.fernet import Fernet, InvalidToken
     try:
-        key = generate_key_from_password(password)
-        f = Fernet(key)
+        f = Fernet(_master_key(key_handle))
         if not encrypted_data or (isinstance(encrypted_data, str) and not encrypted_data.strip()):
             return ""
         decrypted_bytes = f.decrypt(encrypted_data.encode())
@@ -78,42 +263,115 @@ def decrypt_data(encrypted_data: str, password: str) -> str | bytes:
         current_app.logger.error(f"Fout bij ontsleutelen: {e}")
         return b"DECRYPTIE MISLUKT"
 
+# --- Blind index ---
+# Zoeken in versleutelde notities zonder te ontsleutelen: elke genormaliseerde term wordt een
+# HMAC token met een sleutel die van de hoofdsleutel is afgeleid. Alleen de tokens staan in
+# de database (notes_index); een zoekterm wordt op dezelfde manier omgezet en opgezocht.
+# Het vindt alleen exacte termen, en na een nieuwe hoofdsleutel moet de index opnieuw worden opgebouwd.
+_TERM = re.compile(r'\w+(?:[-./@:]\w+)*')  # Ook samengestelde termen als 'PC-1234' of 'jan@example.nl'
+
+def blind_index_key(master_key: bytes) -> bytes:
+    """Sleutel voor de blind index, afgeleid van de hoofdsleutel (los van de encryptiesleutel)."""
+    return hmac.new(master_key, b'pydesk-blind-index', hashlib.sha256).digest()
+
+def _blind_token(index_key: bytes, term: str) -> bytes:
+    return hmac.new(index_key, term.encode(), hashlib.sha256).digest()[:16]
+
+def _normalise_terms(text: str) -> list:
+    return _TERM.findall(unicodedata.normalize('NFKC', text or '').casefold())
+
+def blind_index_tokens(index_key: bytes, text: str) -> set:
+    """Tokens om op te slaan: elke term, en bij samengestelde termen ook de losse delen."""
+    terms = set()
+    for term in _normalise_terms(text):
+        terms.add(term)
+        terms.update(re.findall(r'\w+', term))
+    return {_blind_token(index_key, term) for term in terms}
+
+def blind_query_tokens(index_key: bytes, query: str) -> list:
+    """Tokens voor een zoekopdracht: alle termen moeten in de notities voorkomen."""
+    return sorted({_blind_token(index_key, term) for term in _normalise_terms(query)})
+
+def notes_index_tokens(text: str, key_handle: str, query=False):
+    """Blind index tokens met de sleutel van de sessie, of None als die sleutel er niet is."""
+    master_key = get_keyring().get(key_handle)
+    if master_key is None:
+        return None
+    index_key = blind_index_key(master_key)
+    return blind_query_tokens(index_key, text) if query else blind_index_tokens(index_key, text)
+
+# Workers voor het rotatiecommando (draaien in een procespool, dus zonder app context).
+# Rijen die niet met de oude hoofdsleutel te openen zijn, krijgen None als resultaat.
+
+def rewrap_data_keys(old_master_key: bytes, new_master_key: bytes, rows):
+    """[(ticket_id, omhulde data key)] -> [(ticket_id, opnieuw omhulde data key of None)]."""
+    from cryptography.fernet import Fernet, InvalidToken
+    old, new = Fernet(old_master_key), Fernet(new_master_key)
+    results = []
+    for ticket_id, wrapped_key in rows:
+        try:
+            results.append((ticket_id, new.encrypt(old.decrypt(wrapped_key.encode())).decode()))
+        except InvalidToken:
+            results.append((ticket_id, None))
+    return results
+
+def seal_legacy_notes(old_master_key: bytes, new_master_key: bytes, rows):
+    """[(ticket_id, oud token)] -> [(ticket_id, (envelope token, omhulde data key) of None)]."""
+    from cryptography.fernet import Fernet, InvalidToken
+    old = Fernet(old_master_key)
+    results = []
+    for ticket_id, token in rows:
+        try:
+            results.append((ticket_id, _seal(old.decrypt(token.encode()).decode(), new_master_key)))
+        except InvalidToken:
+            results.append((ticket_id, None))
+    return results
+
 # --- GRAFIEK GENERATIE FUNCTIES ---
+# Grafieken worden gebouwd met matplotlib.figure.Figure in plaats van pyplot. Elke figuur
+# staat op zichzelf (eigen Agg canvas), zodat gelijktijdige renders elkaar niet raken.
+
+def has_chart_data(data_dict: dict) -> bool:
+    """Geeft aan of er iets te tonen is; anders tonen de grafieken 'Geen data beschikbaar'."""
+    return bool(data_dict) and not all(v == 0 for v in data_dict.values())
+
+def aggregate_small_slices(data_dict: dict) -> dict:
+    """Aggregeert kleine waarden (< 5% van het totaal) in een 'Andere' categorie."""
+    total = sum(data_dict.values())
+    threshold = total * 0.05  # items kleiner dan 5% worden gegroepeerd
+
+    filtered_data = {}
+    others_sum = 0
+    for key, value in data_dict.items():
+        if value < threshold and len(data_dict) > 3:
+            others_sum += value
+        else:
+            filtered_data[key] = value
 
-def _finalize_chart(fig: plt.Figure) -> BytesIO:
-    """Slaat een Matplotlib figuur op in een in-memory buffer en sluit het figuur."""
+    if others_sum > 0:
+        filtered_data['Andere'] = others_sum
+    return filtered_data
+
+def _finalize_chart(fig) -> BytesIO:
+    """Slaat een Matplotlib figuur op in een in-memory buffer."""
     buf = BytesIO()
-    try:
-        fig.tight_layout(pad=1.0)
-        fig.savefig(buf, format="png", transparent=True)
-        buf.seek(0)
-        return buf
-    finally:
-        plt.close(fig)  # Essentieel om geheugenlekkage te voorkomen
+    fig.tight_layout(pad=1.0)
+    fig.savefig(buf, format="png", transparent=True)
+    buf.seek(0)
+    return buf
 
 def generate_pie_chart(data_dict: dict, title: str) -> BytesIO:
     """Genereert een donut-stijl cirkeldiagram."""
-    fig, ax = plt.subplots(figsize=(8, 5), dpi=100)
-    
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(8, 5), dpi=100)
+    ax = fig.subplots()
+
     # Toon 'Geen data' melding als de dictionary leeg is
-    if not data_dict or all(v == 0 for v in data_dict.values()):
+    if not has_chart_data(data_dict):
         ax.text(0.5, 0.5, "Geen data beschikbaar", horizontalalignment='center', verticalalignment='center', transform=ax.transAxes)
         ax.axis('off') # Verberg de assen
     else:
-        # Aggregeer kleine waarden in een 'Andere' categorie
-        total = sum(data_dict.values())
-        threshold = total * 0.05  # items kleiner dan 5% worden gegroepeerd
-        
-        filtered_data = {}
-        others_sum = 0
-        for key, value in data_dict.items():
-            if value < threshold and len(data_dict) > 3:
-                others_sum += value
-            else:
-                filtered_data[key] = value
-        
-        if others_sum > 0:
-            filtered_data['Andere'] = others_sum
+        filtered_data = aggregate_small_slices(data_dict)
 
         ax.pie(
             filtered_data.values(),
@@ -129,22 +387,114 @@ def generate_pie_chart(data_dict: dict, title: str) -> BytesIO:
 
 def generate_bar_chart(data_dict: dict, title: str) -> BytesIO:
     """Genereert een staafdiagram."""
-    fig, ax = plt.subplots(figsize=(8, 5), dpi=100)
+    import matplotlib as mpl
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(8, 5), dpi=100)
+    ax = fig.subplots()
 
     # Toon 'Geen data' melding als de dictionary leeg is
-    if not data_dict or all(v == 0 for v in data_dict.values()):
+    if not has_chart_data(data_dict):
         ax.text(0.5, 0.5, "Geen data beschikbaar", horizontalalignment='center', verticalalignment='center', transform=ax.transAxes)
         ax.axis('off') # Verberg de assen
     else:
         keys = list(data_dict.keys())
         values = list(data_dict.values())
-        
-        ax.bar(keys, values, color=plt.cm.viridis(0.6))
-        
+
+        ax.bar(keys, values, color=mpl.colormaps['viridis'](0.6))
+
         # Verbeter layout
         ax.spines['top'].set_visible(False)
         ax.spines['right'].set_visible(False)
         ax.tick_params(axis='x', rotation=45)
-    
+
     ax.set_title(title, pad=20)
-    return _finalize_chart(fig)
\ No newline at end of file
+    return _finalize_chart(fig)
+
+_CHART_GENERATORS = {
+    'pie': generate_pie_chart,
+    'bar': generate_bar_chart,
+}
+
+def _render_chart_png(kind: str, data_dict: dict, title: str) -> bytes:
+    """Rendert een grafiek naar PNG bytes. Draait in een worker (thread of proces)."""
+    return _CHART_GENERATORS[kind](data_dict, title).getvalue()
+
+class ChartRenderPool:
+    """
+    Kleine, vaste pool van render-workers waar request threads grafieken aan aanbieden.
+
+    Het aantal openstaande renders is begrensd (workers + wachtrij). Een request die
+    binnen de timeout geen plek krijgt of geen resultaat ontvangt, krijgt een TimeoutError
+    in plaats van een waitress thread eindeloos bezet te houden.
+    """
+
+    def __init__(self, mode='thread', workers=2, queue_size=8, timeout=10.0):
+        if mode == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chart-render')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self.timeout = timeout
+
+    def submit(self, kind: str, data_dict: dict, title: str) -> Future:
+        """
+        Biedt een render aan zonder op het resultaat te wachten, zodat een pagina al haar
+        grafieken tegelijk kan laten renderen. TimeoutError als er binnen 'timeout' geen plek is.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Grafiek-renderwachtrij is vol")
+        try:
+            future = self._executor.submit(_render_chart_png, kind, dict(data_dict), title)
+        except BaseException:
+            self._slots.release()
+            raise
+        # De plek komt pas vrij als de render echt klaar is, ook als de request al is opgegeven
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def chart_mimetype() -> str:
+    """Het content type van de grafieken volgens CHART_FORMAT ('png' of 'svg')."""
+    return 'image/svg+xml' if current_app.config.get('CHART_FORMAT', 'png') == 'svg' else 'image/png'
+
+def _get_render_pool() -> ChartRenderPool:
+    """De gedeelde render pool, aangemaakt bij het eerste gebruik."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            config = current_app.config
+            _render_pool = ChartRenderPool(
+                mode=config.get('CHART_RENDER_MODE', 'thread'),
+                workers=config.get('CHART_RENDER_WORKERS', 2),
+                queue_size=config.get('CHART_RENDER_QUEUE_SIZE', 8),
+                timeout=config.get('CHART_RENDER_TIMEOUT', 10.0)
+            )
+        return _render_pool
+
+def submit_chart(kind: str, data_dict: dict, title: str) -> Future:
+    """
+    Biedt een grafiek ('pie' of 'bar') aan voor rendering in het formaat van CHART_FORMAT en
+    geeft een Future met de bytes. SVG wordt direct in de request thread gemaakt (puur Python,
+    geen matplotlib) en is meteen klaar; PNG gaat via de gedeelde render pool.
+    TimeoutError als de renderwachtrij vol blijft.
+    """
+    if current_app.config.get('CHART_FORMAT', 'png') == 'svg':
+        from . import svg_charts
+        future = Future()
+        future.set_result(svg_charts.SVG_GENERATORS[kind](data_dict, title).getvalue())
+        return future
+    return _get_render_pool().submit(kind, data_dict, title)
+
+def render_chart(kind: str, data_dict: dict, title: str) -> bytes:
+    """Rendert één grafiek en wacht maximaal CHART_RENDER_TIMEOUT seconden op het resultaat."""
+    future = submit_chart(kind, data_dict, title)
+    try:
+        return future.result(timeout=current_app.config.get('CHART_RENDER_TIMEOUT', 10.0))
+    except TimeoutError:
+        future.cancel()
+        raise
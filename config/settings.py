@@ -14,7 +14,14 @@ PORT = 5001
 SECRET_KEY = 'change-this-to-a-real-secret-key-in-production'
 
 # --- Printer Instellingen ---
+# Nieuwe tickets gaan via een wachtrij in de database naar een achtergrondthread (zie app/printer.py).
 PRINT_NEW_TICKETS = True
+PRINT_COMMAND = None              # Bijv. ['lpr', '-P', 'helpdesk', '{file}'] of een testscript; None = standaardprinter van het OS
+PRINT_JOB_TIMEOUT = 30            # Seconden dat één printpoging mag duren
+PRINT_MAX_ATTEMPTS = 5            # Daarna blijft de job als mislukt op de wachtrijpagina staan
+PRINT_RETRY_DELAY = 10            # Seconden tot de tweede poging; verdubbelt bij elke volgende poging
+PRINT_RETRY_MAX_DELAY = 600       # Maximale wachttijd tussen twee pogingen
+PRINT_POLL_INTERVAL = 60          # Seconden tussen controles op jobs van andere processen
 
 # --- Pad naar het databasebestand ---
 if getattr(sys, 'frozen', False):
@@ -27,6 +34,59 @@ PROJECT_ROOT = os.path.abspath(os.path.join(application_path, os.pardir))
 
 DATABASE_FILE = os.path.join(PROJECT_ROOT, 'data', 'tickets.db')
 
+# --- Database Connectie Pool ---
+# Elke waitress worker thread houdt een eigen, persistente verbinding vast.
+# DATABASE_POOL_SIZE is het maximum aantal gepoolde verbindingen; threads daarboven
+# krijgen een tijdelijke verbinding die na de request weer wordt gesloten.
+DATABASE_POOL_SIZE = 4
+DATABASE_POOL_HEALTH_CHECK = True  # Voer 'SELECT 1' uit bij het uitlenen van een verbinding
+DATABASE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,       # Negatief = KiB, dus ~16 MB page cache per verbinding
+    'mmap_size': 134217728,     # 128 MB memory-mapped I/O
+    'busy_timeout': 5000,       # Milliseconden wachten op een schrijflock
+    'temp_store': 'MEMORY',
+}
+
+# --- Schema Migraties ---
+MIGRATION_BATCH_SIZE = 5000  # Aantal rijen per transactie bij het vullen van nieuwe kolommen/indexes
+
+# --- Ticketlijsten ---
+TICKETS_PER_PAGE = 50             # Aantal tickets per pagina in de lijst en het archief
+TICKET_LIST_SHOW_TOTAL = True     # Toon het totaal aantal resultaten (extra COUNT query, gecached)
+TICKET_COUNT_CACHE_SECONDS = 30   # Hoe lang een berekend totaal wordt hergebruikt
+TIMELINE_PAGE_SIZE = 50           # Aantal geschiedenis-items per keer op de ticketpagina
+TYPEAHEAD_LIMIT = 20              # Maximaal aantal suggesties bij het zoeken naar artikelen en sjablonen
+
+# --- Referentiedata Cache ---
+# Kennisbankartikelen, categorieën en sjablonen worden in het geheugen gehouden tot ze wijzigen.
+REFERENCE_CACHE_SIZE = 256        # Maximaal aantal gecachte resultaten (lijsten, artikelen, zoekopdrachten)
+
+# --- Live Updates ---
+# De ticketlijst pollt de wijzigingsfeed via /changes (korte polling in server-sent events formaat).
+# Elk antwoord sluit direct; de browser vraagt na CHANGES_POLL_INTERVAL_MS opnieuw, zodat open tabs
+# geen threads bezetten.
+CHANGES_POLL_INTERVAL_MS = 3000   # Milliseconden tussen twee opvragingen van de feed per tab
+CHANGES_POLL_LIMIT = 200          # Loopt een tab verder achter, dan laadt die de lijst opnieuw
+CHANGES_RETENTION = 1000          # Aantal wijzigingen dat in de feed bewaard blijft
+
+# --- Bijlagen ---
+# Bestanden worden in blokken naar schijf gekopieerd en op inhoud ontdubbeld (zie app/attachments.py).
+ATTACHMENTS_DIR = None            # Map voor de bestanden (None = 'attachments' naast het databasebestand)
+ATTACHMENT_CHUNK_SIZE = 64 * 1024 # Bytes per blok bij het kopiëren en versleutelen van uploads
+ATTACHMENTS_ENCRYPT = False       # Versleutel bijlagen met de hoofdsleutel, net als de vertrouwelijke notities
+MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # Maximale grootte van één formulier met bijlagen (bytes)
+
+# --- Rapportages ---
+CHART_FORMAT = 'png'              # 'png' (matplotlib) of 'svg' (puur Python, geen matplotlib nodig)
+CHART_CACHE_SIZE = 32             # Maximaal aantal gerenderde grafieken in het geheugen
+CHART_RENDER_MODE = 'thread'      # 'thread' of 'process': waar de grafieken worden gerenderd
+CHART_RENDER_WORKERS = 4          # Aantal render-workers (het rapportenscherm toont 4 grafieken)
+CHART_RENDER_QUEUE_SIZE = 8       # Maximaal aantal wachtende renders bovenop de actieve
+CHART_RENDER_TIMEOUT = 10.0       # Seconden dat een request op een render wacht
+ANALYTICS_DEFAULT_DAYS = 30       # Standaard periode (in dagen) van de trend- en SLA-analyses
+
 # --- Gebruikersauthenticatie ---
 USERS = {
     "admin": "scrypt:32768:8:1$uei4xBji4Z6afAQw$2ef112b5e13e5aad4576149f9533adaa0bcf0aef211ffe99830834915d9c050834664b607ae332108ab3857a4618cdb1ad607f75ed2bf3b20e4e56296b6840f3"
@@ -35,3 +95,6 @@ USERS = {
 # --- Encryptie Instellingen ---
 ENCRYPTION_SALT = b'q\x8c\xbf\xe3\x9c\x01\xfd`\xe9\x1f\xd1\xec\x97\xd8\xda\x15'
 ENCRYPTION_ITERATIONS = 480000
+KEYRING_IDLE_TTL = 3600           # Seconden zonder activiteit waarna de sessiesleutel vervalt (opnieuw inloggen)
+KEY_ROTATION_BATCH_SIZE = 500     # Tickets per transactie bij 'flask rotate-master-key'
+KEY_ROTATION_WORKERS = None       # Processen voor het cryptowerk bij rotatie (None = aantal CPU's)
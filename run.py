@@ -1,5 +1,6 @@
 import webbrowser
 import threading
+import multiprocessing
 import time
 from waitress import serve
 from app import create_app
@@ -25,4 +26,6 @@ def run_app():
     serve(app, host=HOST, port=PORT, threads=4)
 
 if __name__ == '__main__':
+    # Nodig voor CHART_RENDER_MODE = 'process' in het gebundelde (PyInstaller) executable
+    multiprocessing.freeze_support()
     run_app()
\ No newline at end of file
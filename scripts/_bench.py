@@ -0,0 +1,46 @@
+"""
+Gedeelde opzet voor de benchmarks in deze map.
+
+Benchmarks met een database draaien via temp_app() tegen een eigen, lege database in
+een tijdelijke map, zodat de echte tickets.db nooit wordt aangeraakt. Bijvoorbeeld:
+
+    python scripts/bench_transactions.py
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config.settings as settings
+
+
+@contextmanager
+def temp_app(**overrides):
+    """Een app met een lege database (alle migraties gedraaid); overrides vervangen instellingen."""
+    from app import create_app
+    saved = {name: getattr(settings, name) for name in ('DATABASE_FILE', 'PRINT_NEW_TICKETS', *overrides)}
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.DATABASE_FILE = os.path.join(tmp, 'data', 'tickets.db')
+        settings.PRINT_NEW_TICKETS = False
+        for name, value in overrides.items():
+            setattr(settings, name, value)
+        try:
+            with redirect_stdout(io.StringIO()):  # Migratiemeldingen horen niet in de uitvoer
+                app = create_app()
+            app.config['TESTING'] = True
+            yield app
+            app.extensions['db_pool'].close_all()
+        finally:
+            for name, value in saved.items():
+                setattr(settings, name, value)
+
+
+def timed(func, *args, **kwargs):
+    """Voert func één keer uit en geeft (resultaat, milliseconden) terug."""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
@@ -0,0 +1,55 @@
+"""
+Benchmark: de twee grafiek-backends (CHART_FORMAT 'png' en 'svg') naast elkaar.
+
+Rendert elke grafiek --renders keer met matplotlib (PNG) en met app/svg_charts.py (SVG)
+en toont de gemiddelde rendertijd en de grootte van het resultaat. Het importeren van
+matplotlib valt buiten de meting; dat gebeurt eenmalig voor de eerste render.
+
+    python scripts/bench_charts.py [--renders 20]
+"""
+import argparse
+import time
+
+import _bench  # noqa: F401  (zet de projectmap op sys.path)
+
+CASES = (
+    ('taart, 5 segmenten', 'pie', {'New': 12, 'In Progress': 7, 'Pending': 3, 'Resolved': 25, 'Closed': 40}),
+    ('taart, 1 segment', 'pie', {'New': 5}),
+    ('geen data', 'pie', {}),
+    ('staaf, 4 staven', 'bar', {'Hoog': 9, 'Gemiddeld': 14, 'Laag': 6, 'Onbekend': 2}),
+)
+
+
+def measure(generate, data, renders):
+    """Gemiddelde rendertijd in milliseconden en de grootte van het resultaat in KB."""
+    size = len(generate(data, 'Bench').getvalue())  # Opwarmen: imports en caches
+    started = time.perf_counter()
+    for _ in range(renders):
+        generate(data, 'Bench')
+    return (time.perf_counter() - started) * 1000 / renders, size / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--renders', type=int, default=20)
+    args = parser.parse_args()
+
+    from app import svg_charts, utils
+    try:
+        import matplotlib  # noqa: F401
+    except ImportError:
+        matplotlib = None
+        print("matplotlib is niet geïnstalleerd; alleen SVG wordt gemeten.")
+
+    print(f"{args.renders} renders per grafiek: PNG (matplotlib) tegenover SVG")
+    for label, kind, data in CASES:
+        line = f"  {label:<20}"
+        if matplotlib:
+            ms, kb = measure(getattr(utils, f'generate_{kind}_chart'), data, args.renders)
+            line += f" PNG {ms:7.2f} ms / {kb:5.1f} KB  "
+        ms, kb = measure(getattr(svg_charts, f'generate_{kind}_chart'), data, args.renders)
+        print(f"{line} SVG {ms:7.2f} ms / {kb:5.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: waar de sleutelafleiding (PBKDF2) in de requests terechtkomt.
+
+Meet via de test client de login, de eerste weergave van een ticket met vertrouwelijke
+notities en een tweede weergave. Sinds de KeyRing hoort de afleiding bij de login en
+betaalt de eerste weergave niet meer voor de sleutel. Daarnaast: de kale afleiding, en
+--opens gelijktijdige KeyRing.open() met hetzelfde wachtwoord, die samen één afleiding
+delen (via de login meet dat niet zuiver door de wachtwoordcontrole).
+
+    python scripts/bench_keyring.py [--opens 8]
+"""
+import argparse
+import threading
+
+from _bench import temp_app, timed
+
+USERNAME = 'bench'
+PASSWORD = 'bench-wachtwoord'
+NOTES = 'vertrouwelijk-123'
+
+
+def login(client):
+    response = client.post('/auth/login', data={'username': USERNAME, 'password': PASSWORD})
+    assert response.status_code == 302, response.status_code
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--opens', type=int, default=8)
+    args = parser.parse_args()
+
+    from werkzeug.security import generate_password_hash
+    from app import auth, utils
+
+    auth.USERS[USERNAME] = generate_password_hash(PASSWORD)
+    try:
+        with temp_app() as app:
+            client = app.test_client()
+            login(client)
+            client.post('/create', data={
+                'title': 'Bench', 'description': 'Ticket met notities', 'requester_name': 'n',
+                'requester_email': 'e@example.com', 'requester_phone': '0', 'priority': 'Hoog',
+                'sensitive_notes': NOTES
+            })
+
+            # Nieuwe sessie: de sleutel moet opnieuw worden afgeleid
+            client = app.test_client()
+            _, login_ms = timed(login, client)
+            first, first_ms = timed(client.get, '/ticket/1')
+            assert NOTES in first.get_data(as_text=True), first.status_code
+            _, second_ms = timed(client.get, '/ticket/1')
+
+            with app.app_context():
+                _, derive_ms = timed(utils.generate_key_from_password, PASSWORD)
+
+            def open_key():
+                with app.app_context():
+                    utils.get_keyring().open(PASSWORD)
+
+            def open_all():
+                threads = [threading.Thread(target=open_key) for _ in range(args.opens)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            _, concurrent_ms = timed(open_all)
+    finally:
+        del auth.USERS[USERNAME]
+
+    print(f"  PBKDF2 afleiding                {derive_ms:7.1f} ms")
+    print(f"  login                           {login_ms:7.1f} ms")
+    print(f"  eerste ticketweergave           {first_ms:7.1f} ms")
+    print(f"  tweede ticketweergave           {second_ms:7.1f} ms")
+    print(f"  {f'{args.opens} gelijktijdige KeyRing.open':<32}{concurrent_ms:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
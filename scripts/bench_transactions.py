@@ -0,0 +1,89 @@
+"""
+Benchmark: één commit per ticketwijziging tegenover de oude drie.
+
+Vier threads (zoals de waitress workers) doen elk een reeks statuswijzigingen met een
+reactie op een eigen ticket. 'per unit of work' is database.update_ticket zoals de app
+het nu doet; 'per statement' voert dezelfde statements uit met een commit na de
+statuswijziging, na het status-event en na de reactie, zoals vóór transaction().
+
+Per variant telt de snelste van --rounds rondes, elk tegen een verse database.
+
+    python scripts/bench_transactions.py [--threads 4] [--updates 200] [--rounds 3]
+"""
+import argparse
+import threading
+import time
+from datetime import datetime
+
+from _bench import settings, temp_app
+
+STATUSES = ('In Progress', 'Pending')
+
+
+def update_per_statement(database, ticket_id, new_status, comment, author, old_status):
+    """De oude volgorde van commits: elk statement in een eigen transactie."""
+    with database.transaction() as db:
+        db.execute(
+            'UPDATE tickets SET status = ?, status_rank = ?, updated_at = ? WHERE id = ?',
+            (new_status, database.status_rank(new_status), datetime.now().isoformat(), ticket_id)
+        )
+        database.record_change(ticket_id, 'status')
+    with database.transaction():
+        database.log_event(ticket_id, author, f"Status gewijzigd van '{old_status}' naar '{new_status}'.")
+    with database.transaction():
+        database.log_event(ticket_id, author, comment, event_type='comment')
+        database.record_change(ticket_id, 'commented')
+
+
+def run(app, update, threads, updates):
+    """Laat elke thread 'updates' wijzigingen doen; geeft de totale duur in seconden terug."""
+    from flask import g
+    from app import database
+
+    with app.test_request_context():
+        ticket_ids = [database.create_ticket(f'Bench {n}', 'd', 'n', 'e', 'p', 'Laag', None) for n in range(threads)]
+
+    def worker(ticket_id):
+        with app.test_request_context():
+            g.user = 'admin'
+            old_status = 'New'
+            for i in range(updates):
+                new_status = STATUSES[i % 2]
+                update(database, ticket_id, new_status, f'Reactie {i}', 'admin', old_status)
+                old_status = new_status
+
+    workers = [threading.Thread(target=worker, args=(ticket_id,)) for ticket_id in ticket_ids]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    from app import database
+    variants = (
+        ('per statement (3 commits)', update_per_statement),
+        ('per unit of work (1 commit)', lambda _db, *a: database.update_ticket(*a)),
+    )
+    print(f"{args.threads} threads x {args.updates} statuswijzigingen met reactie, WAL")
+    for synchronous in ('FULL', 'NORMAL'):
+        pragmas = {**settings.DATABASE_PRAGMAS, 'synchronous': synchronous}
+        for label, update in variants:
+            rounds = []
+            for _ in range(args.rounds):
+                with temp_app(DATABASE_PRAGMAS=pragmas) as app:
+                    rounds.append(run(app, update, args.threads, args.updates))
+            seconds = min(rounds)
+            print(f"  synchronous={synchronous:<6} {label:<28} {seconds:6.3f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config.settings as settings
+from app import create_app, utils
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Een app met een eigen, lege database (alle migraties gedraaid) in een tijdelijke map."""
+    monkeypatch.setattr(settings, 'DATABASE_FILE', str(tmp_path / 'data' / 'tickets.db'))
+    monkeypatch.setattr(settings, 'PRINT_NEW_TICKETS', False)
+    monkeypatch.setattr(settings, 'ENCRYPTION_ITERATIONS', 1000)  # Snelle sleutelafleiding
+    flask_app = create_app()
+    flask_app.config['TESTING'] = True
+    yield flask_app
+    flask_app.extensions['db_pool'].close_all()
+
+
+@pytest.fixture
+def db_context(app):
+    """Een request context, zodat de databasefuncties get_db() en g kunnen gebruiken."""
+    with app.test_request_context():
+        yield
+
+
+@pytest.fixture
+def client(app):
+    """Een test client waarmee 'admin' is ingelogd, met een geopende sleutel in de keyring."""
+    test_client = app.test_client()
+    with app.app_context():
+        key_handle = utils.get_keyring().open('geheim')
+    with test_client.session_transaction() as session:
+        session['username'] = 'admin'
+        session['key_handle'] = key_handle
+    return test_client
@@ -0,0 +1,91 @@
+import io
+import os
+
+import pytest
+
+from app import attachments, database
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes, over meerdere blokken
+
+
+@pytest.fixture(params=[False, True], ids=['plain', 'encrypted'])
+def encrypted(request, app):
+    app.config['ATTACHMENT_CHUNK_SIZE'] = 1000  # Kleine blokken, zodat ranges blokgrenzen kruisen
+    app.config['ATTACHMENTS_ENCRYPT'] = request.param
+    return request.param
+
+
+@pytest.fixture
+def ticket_id(db_context):
+    return database.create_ticket('Bijlagen', 'd', 'n', 'e', 'p', 'Hoog', None)
+
+
+def _upload(client, ticket_id, content=CONTENT, filename='rapport.bin'):
+    response = client.post(f'/ticket/{ticket_id}/attachments',
+                           data={'attachments': (io.BytesIO(content), filename)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+    return database.get_attachments_for_ticket(ticket_id)[-1]
+
+
+def _blob_files():
+    root = attachments.storage_dir()
+    return sorted(name for _, _, names in os.walk(root) for name in names if not name.startswith('.upload-'))
+
+
+def test_round_trip(client, ticket_id, encrypted, app):
+    attachment = _upload(client, ticket_id)
+    response = client.get(f"/attachment/{attachment['id']}")
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Disposition'].startswith('attachment')
+
+    on_disk = open(attachments.blob_path(database.get_attachment(attachment['id'])['blob_id']), 'rb').read()
+    assert (on_disk != CONTENT) is encrypted
+
+
+@pytest.mark.parametrize('header, start, end', [
+    ('bytes=0-9', 0, 10),
+    ('bytes=990-2010', 990, 2011),      # Kruist twee blokgrenzen
+    ('bytes=5000-', 5000, len(CONTENT)),
+    ('bytes=-25', len(CONTENT) - 25, len(CONTENT)),
+])
+def test_range_requests(client, ticket_id, encrypted, header, start, end):
+    attachment = _upload(client, ticket_id)
+    response = client.get(f"/attachment/{attachment['id']}", headers={'Range': header})
+    assert response.status_code == 206
+    assert response.data == CONTENT[start:end]
+    assert response.headers['Content-Range'] == f'bytes {start}-{end - 1}/{len(CONTENT)}'
+
+
+def test_unsatisfiable_range_and_conditional_get(client, ticket_id, encrypted):
+    attachment = _upload(client, ticket_id)
+    url = f"/attachment/{attachment['id']}"
+    assert client.get(url, headers={'Range': f'bytes={len(CONTENT)}-'}).status_code == 416
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_identical_uploads_share_one_blob(client, ticket_id, encrypted, app):
+    first = _upload(client, ticket_id, filename='a.txt')
+    second = _upload(client, ticket_id, filename='b.txt')
+    assert database.get_attachment(first['id'])['blob_id'] == database.get_attachment(second['id'])['blob_id']
+    assert len(_blob_files()) == 1
+    assert client.get(f"/attachment/{second['id']}").data == CONTENT
+
+
+def test_rolled_back_upload_leaves_nothing_behind(app, ticket_id, encrypted):
+    master_key = app.extensions['keyring'].get(app.extensions['keyring'].open('geheim')) if encrypted else None
+    upload = attachments.receive(io.BytesIO(CONTENT), master_key)
+    upload.update(filename='weg.bin', content_type='application/octet-stream')
+
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            database.add_ticket_attachments(ticket_id, [upload], 'admin')
+            raise RuntimeError('mislukt na het plaatsen')
+    attachments.discard(upload)
+
+    assert database.get_attachments_for_ticket(ticket_id) == []
+    assert _blob_files() == []
+    assert not any(name.startswith('.upload-') for name in os.listdir(attachments.storage_dir()))
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from app import database
+
+
+def _events(response):
+    """Splitst een /changes antwoord in (event, data) paren; de afsluitende 'id:' regel wordt ('id', id)."""
+    events = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+        elif 'id' in fields:
+            events.append(('id', int(fields['id'])))
+    return events
+
+
+def test_empty_feed_has_no_changes(db_context):
+    assert database.get_changes_since(None) == {'changes': [], 'last_id': 0, 'reset': False}
+    assert database.get_changes_since(0) == {'changes': [], 'last_id': 0, 'reset': False}
+
+
+@pytest.mark.parametrize('last_id', [-5, 3])
+def test_empty_feed_resets_unknown_positions(db_context, last_id):
+    assert database.get_changes_since(last_id) == {'changes': [], 'last_id': 0, 'reset': True}
+
+
+def test_changes_are_merged_per_ticket(db_context):
+    first = database.create_ticket('Eerste', 'd', 'n', 'e', 'p', 'Hoog', None)
+    position = database.get_changes_since(None)['last_id']
+    second = database.create_ticket('Tweede', 'd', 'n', 'e', 'p', 'Laag', None)
+    database.assign_ticket(first, 'admin', None)
+    database.update_ticket(first, 'Resolved', 'klaar', 'admin', 'New')
+
+    feed = database.get_changes_since(position)
+    assert not feed['reset']
+    by_ticket = {change['ticket_id']: change for change in feed['changes']}
+    assert set(by_ticket) == {first, second}
+    assert set(by_ticket[first]['kinds'].split(',')) == {'assigned', 'status', 'commented'}
+    assert (by_ticket[first]['status'], by_ticket[first]['assigned_to']) == ('Resolved', 'admin')
+    assert database.get_changes_since(feed['last_id'])['changes'] == []
+
+
+def test_lagging_or_pruned_positions_reset(app, db_context):
+    app.config['CHANGES_RETENTION'] = 3
+    ticket_id = database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', None)
+    for status in ['In Progress', 'Pending', 'In Progress', 'Pending']:
+        database.update_ticket(ticket_id, status, None, 'admin', 'onbekend')
+    head = database.get_changes_since(None)['last_id']
+
+    assert database.get_changes_since(0)['reset']                 # Opgeruimd
+    assert database.get_changes_since(head + 1)['reset']          # Voorloper
+    assert database.get_changes_since(head - 2, limit=1)['reset']  # Te ver achter
+    assert not database.get_changes_since(head - 2)['reset']
+
+
+def test_poll_delivers_events_and_position(client, db_context):
+    ticket_id = database.create_ticket('Nieuw', 'd', 'n', 'e', 'p', 'Hoog', None)
+
+    response = client.get('/changes?last_id=0')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-store'
+    events = _events(response)
+    assert events[0] == ('ticket', {'id': ticket_id, 'kinds': ['created'], 'title': 'Nieuw',
+                                    'status': 'New', 'priority': 'Hoog', 'assigned_to': None})
+    assert events[-1][0] == 'id'
+
+    # Herverbinden met Last-Event-ID levert niets nieuws
+    again = client.get('/changes', headers={'Last-Event-ID': str(events[-1][1])})
+    assert _events(again) == [events[-1]]
+
+
+@pytest.mark.parametrize('query, status', [('?last_id=-5', 400), ('?last_id=abc', 200), ('?last_id=7', 200)])
+def test_poll_rejects_or_survives_bad_positions_on_empty_feed(client, query, status):
+    response = client.get('/changes' + query)
+    assert response.status_code == status
+    if query == '?last_id=7':
+        assert _events(response) == [('reset', {}), ('id', 0)]
+
+
+def test_poll_requires_login(app):
+    assert app.test_client().get('/changes').status_code == 302
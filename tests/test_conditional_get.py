@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+
+from app import database
+
+
+def _revisions_from_threads(app, count=4):
+    """current_revision() zoals 'count' verschillende waitress threads (elk met een eigen verbinding) hem zien."""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        with app.test_request_context():
+            database.get_db()
+            barrier.wait()  # Alle threads tegelijk actief, dus elk een eigen gepoolde verbinding
+            results[i] = database.current_revision()
+            database.close_db()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_unchanged_list_answers_304(client, db_context):
+    database.create_ticket('Eerste', 'd', 'n', 'e', 'p', 'Hoog', None)
+    first = client.get('/tickets')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    again = client.get('/tickets', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+
+
+def test_a_write_gives_a_new_etag(client, db_context):
+    ticket_id = database.create_ticket('Eerste', 'd', 'n', 'e', 'p', 'Hoog', None)
+    etag = client.get(f'/ticket/{ticket_id}').headers['ETag']
+    assert client.get(f'/ticket/{ticket_id}', headers={'If-None-Match': etag}).status_code == 304
+
+    database.update_ticket(ticket_id, 'In Progress', 'bezig', 'admin', 'New')
+    changed = client.get(f'/ticket/{ticket_id}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert 'bezig' in changed.get_data(as_text=True)
+    assert client.get(f'/ticket/{ticket_id}', headers={'If-None-Match': changed.headers['ETag']}).status_code == 304
+
+
+def test_etag_depends_on_the_query(client, db_context):
+    etag = client.get('/tickets').headers['ETag']
+    assert client.get('/tickets?filter=mine', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_one_write_changes_the_revision_once_for_all_threads(app, db_context):
+    before = _revisions_from_threads(app)
+    assert len(set(before)) == 1
+
+    database.create_ticket('Nieuw', 'd', 'n', 'e', 'p', 'Hoog', None)
+    after_write = database.current_revision()
+    assert after_write != before[0]
+    assert _revisions_from_threads(app) == [after_write] * 4
+    assert database.current_revision() == after_write
+
+
+def test_a_write_outside_the_app_changes_the_revision_once(app, db_context):
+    database.create_ticket('Nieuw', 'd', 'n', 'e', 'p', 'Hoog', None)
+    before = database.current_revision()
+
+    conn = sqlite3.connect(app.config['DATABASE_FILE'])
+    conn.execute("UPDATE tickets SET priority = 'Laag'")
+    conn.commit()
+    conn.close()
+
+    after = _revisions_from_threads(app)
+    assert len(set(after)) == 1 and after[0] != before
+    assert database.current_revision() == after[0]
+
+
+def test_reads_and_empty_transactions_keep_the_revision(app, db_context):
+    database.create_ticket('Nieuw', 'd', 'n', 'e', 'p', 'Hoog', None)
+    revision = database.current_revision()
+    database.get_active_tickets('admin', 'all', '', 'created_at_desc')
+    with database.transaction() as db:
+        db.execute("UPDATE tickets SET priority = 'Hoog' WHERE id = -1")
+    assert _revisions_from_threads(app) == [revision] * 4
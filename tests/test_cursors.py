@@ -0,0 +1,43 @@
+import base64
+import json
+
+import pytest
+
+from app import database
+
+
+def _tampered(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def test_cursor_round_trip():
+    cursor = database.encode_cursor(['2024-01-01T10:00:00', 42])
+    assert database.decode_cursor(cursor, 2) == ['2024-01-01T10:00:00', 42]
+    assert database.decode_cursor(database.encode_cursor([None, 1.5]), 2) == [None, 1.5]
+
+
+@pytest.mark.parametrize('cursor', [
+    'geen-base64!',
+    _tampered({'a': 1}),
+    _tampered([1]),
+    _tampered([{}, 1]),
+    _tampered([[1], 1]),
+    _tampered(['x', 2**64]),
+])
+def test_invalid_cursors_decode_to_none(cursor):
+    assert database.decode_cursor(cursor, 2) is None
+
+
+@pytest.mark.parametrize('path', ['/tickets', '/archive'])
+@pytest.mark.parametrize('param', ['after', 'before'])
+def test_list_ignores_a_tampered_cursor(client, db_context, path, param):
+    for i in range(3):
+        ticket_id = database.create_ticket(f'Ticket {i}', 'd', 'n', 'e', 'p', 'Hoog', None)
+        if path == '/archive':
+            database.update_ticket(ticket_id, 'Closed', None, 'admin', 'New')
+
+    response = client.get(path, query_string={param: _tampered([{}, 1])})
+    html = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'Er is een fout opgetreden' not in html
+    assert all(f'Ticket {i}' in html for i in range(3))
@@ -0,0 +1,92 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app import database, utils
+
+
+@pytest.fixture
+def keys(app, db_context):
+    """Handvatten voor het huidige en het nieuwe hoofdwachtwoord."""
+    keyring = utils.get_keyring()
+    return keyring.open('geheim'), keyring.open('nieuw geheim')
+
+
+def _create(key_handle, notes):
+    token, wrapped_key, key_id = utils.encrypt_notes(notes, key_handle)
+    return database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', token, wrapped_key=wrapped_key, master_key_id=key_id)
+
+
+def _notes(ticket_id, key_handle):
+    ticket = database.get_ticket_by_id(ticket_id)
+    return utils.decrypt_notes(ticket['sensitive_notes'], ticket['wrapped_key'], key_handle)
+
+
+def _rotate(app, old_handle, new_handle):
+    conn = sqlite3.connect(app.config['DATABASE_FILE'], isolation_level=None)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            return database.rotate_master_key(conn, utils._master_key(old_handle), utils._master_key(new_handle),
+                                              executor, workers=2, batch_size=2)
+    finally:
+        conn.close()
+
+
+def test_each_ticket_gets_its_own_data_key(keys):
+    current, _ = keys
+    first, second = _create(current, 'pincode 1234'), _create(current, 'pincode 1234')
+    assert _notes(first, current) == _notes(second, current) == 'pincode 1234'
+    one, two = database.get_ticket_by_id(first), database.get_ticket_by_id(second)
+    assert one['sensitive_notes'].startswith(utils.ENVELOPE_PREFIX)
+    assert one['sensitive_notes'] != two['sensitive_notes']
+    assert one['wrapped_key'] != two['wrapped_key']
+
+
+def test_another_master_key_cannot_open_the_notes(keys):
+    current, other = keys
+    assert _notes(_create(current, 'geheim'), other) == b"DECRYPTIE MISLUKT (ongeldig token)"
+
+
+def test_legacy_tokens_are_still_readable(keys):
+    current, _ = keys
+    token = Fernet(utils._master_key(current)).encrypt(b'oude notitie').decode()
+    ticket_id = database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', token)
+    assert _notes(ticket_id, current) == 'oude notitie'
+
+
+def test_rotation_rewraps_keys_and_seals_legacy_tokens(app, keys):
+    current, new = keys
+    envelope_ids = [_create(current, f'notitie {i}') for i in range(5)]
+    tokens_before = {i: database.get_ticket_by_id(i)['sensitive_notes'] for i in envelope_ids}
+    legacy_token = Fernet(utils._master_key(current)).encrypt(b'oude notitie').decode()
+    legacy_id = database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', legacy_token)
+    other = utils.get_keyring().open('onbekend')
+    other_id = _create(other, 'andere sleutel')
+    foreign_token = Fernet(utils._master_key(other)).encrypt(b'niet te openen').decode()
+    database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', foreign_token)
+
+    stats = _rotate(app, current, new)
+    assert stats == {'sealed': 1, 'rewrapped': 5, 'rewrapped_attachments': 0, 'rewrapped_id_key': 0, 'failed': 1}
+
+    for i, ticket_id in enumerate(envelope_ids):
+        # Alleen de data key is opnieuw omhuld; het token zelf is ongewijzigd
+        assert database.get_ticket_by_id(ticket_id)['sensitive_notes'] == tokens_before[ticket_id]
+        assert _notes(ticket_id, new) == f'notitie {i}'
+        assert _notes(ticket_id, current) == b"DECRYPTIE MISLUKT (ongeldig token)"
+    assert database.get_ticket_by_id(legacy_id)['sensitive_notes'].startswith(utils.ENVELOPE_PREFIX)
+    assert _notes(legacy_id, new) == 'oude notitie'
+    # Notities onder een andere hoofdsleutel blijven onaangeroerd
+    assert _notes(other_id, other) == 'andere sleutel'
+
+    # Een tweede run heeft niets meer te doen, op het onleesbare oude token na
+    assert _rotate(app, current, new) == {'sealed': 0, 'rewrapped': 0, 'rewrapped_attachments': 0,
+                                          'rewrapped_id_key': 0, 'failed': 1}
+
+
+def test_ticket_page_shows_the_decrypted_notes(client, db_context):
+    with client.session_transaction() as session:
+        key_handle = session['key_handle']
+    ticket_id = _create(key_handle, 'kluiscode 9876')
+    assert 'kluiscode 9876' in client.get(f'/ticket/{ticket_id}').get_data(as_text=True)
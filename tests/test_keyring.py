@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import auth, utils
+
+
+@pytest.fixture
+def user(monkeypatch):
+    monkeypatch.setitem(auth.USERS, 'piet', generate_password_hash('wachtwoord'))
+    return 'piet', 'wachtwoord'
+
+
+def _login(client, user):
+    return client.post('/auth/login', data={'username': user[0], 'password': user[1]})
+
+
+def test_login_keeps_only_a_handle_in_the_session(app, user):
+    client = app.test_client()
+    assert _login(client, user).status_code == 302
+    with client.session_transaction() as session:
+        assert 'master_password' not in session
+        handle = session['key_handle']
+    with app.app_context():
+        assert utils.get_keyring().get(handle) == utils.generate_key_from_password('wachtwoord')
+    assert client.get('/tickets').status_code == 200
+
+
+def test_logout_closes_the_key(app, user):
+    client = app.test_client()
+    _login(client, user)
+    with client.session_transaction() as session:
+        handle = session['key_handle']
+    client.get('/auth/logout')
+    assert app.extensions['keyring'].get(handle) is None
+
+
+def test_unknown_handle_sends_the_user_back_to_login(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'admin'
+        session['key_handle'] = 'verlopen-of-van-voor-een-herstart'
+    response = client.get('/tickets')
+    assert response.status_code == 302
+    assert '/auth/login' in response.headers['Location']
+    with client.session_transaction() as session:
+        assert 'username' not in session
+
+
+def test_legacy_session_is_converted_and_the_password_dropped(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'admin'
+        session['master_password'] = 'geheim'
+    assert client.get('/tickets').status_code == 200
+    with client.session_transaction() as session:
+        assert 'master_password' not in session
+        assert app.extensions['keyring'].get(session['key_handle']) is not None
+
+
+def test_idle_keys_expire(app, monkeypatch):
+    keyring = utils.KeyRing(idle_ttl=60)
+    clock = [1000.0]
+    monkeypatch.setattr(utils.time, 'monotonic', lambda: clock[0])
+    with app.app_context():
+        handle = keyring.open('geheim')
+    clock[0] += 50
+    assert keyring.get(handle) is not None  # Gebruik verlengt de levensduur
+    clock[0] += 50
+    assert keyring.get(handle) is not None
+    clock[0] += 61
+    assert keyring.get(handle) is None
+    assert len(keyring) == 0
+
+
+def test_concurrent_opens_share_one_derivation(app, monkeypatch):
+    derivations = []
+    derive = utils.generate_key_from_password
+
+    def slow_derive(password, **kwargs):
+        derivations.append(password)
+        time.sleep(0.2)
+        return derive(password, **kwargs)
+
+    monkeypatch.setattr(utils, 'generate_key_from_password', slow_derive)
+    keyring = utils.KeyRing()
+    handles = []
+
+    def open_key():
+        with app.app_context():
+            handles.append(keyring.open('geheim'))
+
+    threads = [threading.Thread(target=open_key) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(derivations) == 1
+    assert len(set(handles)) == 8
+    assert len({keyring.get(handle) for handle in handles}) == 1
@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app import database, utils
+
+
+@pytest.fixture
+def key_handle(app, db_context):
+    return utils.get_keyring().open('geheim')
+
+
+def _create_with_notes(key_handle, notes):
+    token, wrapped_key, key_id = utils.encrypt_notes(notes, key_handle)
+    return database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', token, wrapped_key=wrapped_key, master_key_id=key_id,
+                                  notes_tokens=utils.notes_index_tokens(notes, key_handle))
+
+
+def _search_notes(key_handle, query):
+    page = database.get_active_tickets('admin', 'all', query, 'created_at_desc',
+                                       notes_tokens=utils.notes_index_tokens(query, key_handle, query=True))
+    return sorted(ticket['id'] for ticket in page['tickets'])
+
+
+def _rebuild(app, key_handle, progress=None):
+    conn = sqlite3.connect(app.config['DATABASE_FILE'], isolation_level=None)
+    try:
+        return database.rebuild_notes_index(conn, utils._master_key(key_handle), batch_size=2, progress=progress)
+    finally:
+        conn.close()
+
+
+def test_search_finds_notes_by_blind_index(key_handle):
+    first = _create_with_notes(key_handle, 'wachtwoord kluis-42 bij de balie')
+    second = _create_with_notes(key_handle, 'pincode kluis-42')
+    assert _search_notes(key_handle, 'kluis-42') == [first, second]
+    assert _search_notes(key_handle, 'balie kluis') == [first]
+    assert _search_notes(key_handle, 'onbekend') == []
+
+
+def test_rebuild_restores_the_index(app, key_handle):
+    ticket_ids = [_create_with_notes(key_handle, f'notitie nummer{i}') for i in range(5)]
+    database.create_ticket('Zonder notities', 'd', 'n', 'e', 'p', 'Laag', None)
+    db = database.get_db()
+    db.execute('DELETE FROM notes_index')
+    db.commit()
+
+    assert _rebuild(app, key_handle) == {'indexed': 5, 'failed': 0}
+    assert _search_notes(key_handle, 'notitie') == ticket_ids
+    assert _search_notes(key_handle, 'nummer3') == [ticket_ids[3]]
+
+
+def test_rebuild_keeps_tokens_of_tickets_created_meanwhile(app, key_handle):
+    for i in range(5):
+        _create_with_notes(key_handle, f'oud{i}')
+    created = []
+
+    def create_between_batches(done, total):
+        # Tickets die tijdens de rebuild via de app worden aangemaakt, met hun eigen tokens
+        if len(created) < 3:
+            created.append(_create_with_notes(key_handle, f'tussendoor{len(created)}'))
+
+    # Alleen de tickets van bij de start worden herbouwd
+    assert _rebuild(app, key_handle, progress=create_between_batches) == {'indexed': 5, 'failed': 0}
+    for i, ticket_id in enumerate(created):
+        assert _search_notes(key_handle, f'tussendoor{i}') == [ticket_id]
+    assert len(_search_notes(key_handle, 'oud0')) == 1
+
+
+def test_rebuild_does_not_overwrite_notes_edited_during_a_batch(app, key_handle, monkeypatch):
+    ticket_id = _create_with_notes(key_handle, 'oude notitie')
+    _create_with_notes(key_handle, 'ander ticket')
+
+    def edit_notes():
+        with app.test_request_context():
+            token, wrapped_key, _ = utils.encrypt_notes('nieuwe notitie', key_handle)
+            with database.transaction() as db:
+                db.execute('UPDATE tickets SET sensitive_notes = ? WHERE id = ?', (token, ticket_id))
+                db.execute('UPDATE ticket_keys SET wrapped_key = ? WHERE ticket_id = ?', (wrapped_key, ticket_id))
+                db.execute('DELETE FROM notes_index WHERE ticket_id = ?', (ticket_id,))
+                db.executemany('INSERT INTO notes_index (token, ticket_id) VALUES (?, ?)',
+                               [(t, ticket_id) for t in utils.notes_index_tokens('nieuwe notitie', key_handle)])
+            database.close_db()
+
+    editor = threading.Thread(target=edit_notes)
+    open_notes = utils.open_notes
+
+    def open_notes_while_editing(*args):
+        # Het ticket wordt bewerkt terwijl de batch gelezen is; de bewerking moet op de batch wachten
+        if editor.ident is None:
+            editor.start()
+            editor.join(timeout=0.5)
+        return open_notes(*args)
+
+    monkeypatch.setattr(utils, 'open_notes', open_notes_while_editing)
+    _rebuild(app, key_handle)
+    editor.join()
+    assert _search_notes(key_handle, 'nieuwe') == [ticket_id]
+    assert _search_notes(key_handle, 'oude') == []
+
+
+def test_rebuild_counts_notes_of_another_master_key_as_failed(app, key_handle):
+    _create_with_notes(key_handle, 'eerste')
+    other = utils.get_keyring().open('ander wachtwoord')
+    _create_with_notes(other, 'tweede')
+    assert _rebuild(app, key_handle) == {'indexed': 1, 'failed': 1}
@@ -0,0 +1,124 @@
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import database, printer
+
+
+@pytest.fixture
+def spooler(app, db_context):
+    app.config.update(PRINT_RETRY_DELAY=10, PRINT_RETRY_MAX_DELAY=25, PRINT_MAX_ATTEMPTS=4, PRINT_JOB_TIMEOUT=5)
+    return app.extensions['print_spooler']
+
+
+class Printed(list):
+    """De geprinte inhoud; zet 'fail' op een fout om pogingen te laten mislukken."""
+    fail = None
+
+
+@pytest.fixture
+def printed(monkeypatch):
+    """Vervangt de printer door een die alleen de inhoud bewaart."""
+    printed = Printed()
+
+    def fake_send(content, command=None, timeout=30):
+        if printed.fail:
+            raise printed.fail
+        printed.append(content)
+
+    monkeypatch.setattr(printer, 'send_to_printer', fake_send)
+    return printed
+
+
+def _job():
+    jobs = database.get_print_jobs()['jobs']
+    return jobs[0] if jobs else None
+
+
+def _make_due(job_id):
+    """Laat de tijd verstrijken tot de volgende poging."""
+    db = database.get_db()
+    db.execute('UPDATE print_jobs SET next_attempt_at = ? WHERE id = ?',
+               ((datetime.now() - timedelta(seconds=1)).isoformat(), job_id))
+    db.commit()
+
+
+def test_new_ticket_is_printed_and_leaves_the_queue(spooler, printed):
+    ticket_id = database.create_ticket('Printer test', 'd', 'n', 'e', 'p', 'Hoog', None, print_ticket=True)
+    assert _job()['ticket_id'] == ticket_id
+    assert spooler.run_once()
+    assert 'Onderwerp: Printer test' in printed[0]
+    assert _job() is None
+    assert not spooler.run_once()
+
+
+def test_failed_attempts_back_off_until_the_job_fails(spooler, printed):
+    database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', None, print_ticket=True)
+    printed.fail = OSError('printer offline')
+
+    delays = []
+    for attempt in range(1, 4):
+        assert spooler.run_once()
+        job = _job()
+        assert (job['status'], job['attempts'], job['last_error']) == ('pending', attempt, 'printer offline')
+        delays.append(round((datetime.fromisoformat(job['next_attempt_at'])
+                             - datetime.fromisoformat(job['updated_at'])).total_seconds()))
+        assert not spooler.run_once()  # Nog niet aan de beurt
+        _make_due(job['id'])
+    assert delays == [10, 20, 25]  # Verdubbeld, tot PRINT_RETRY_MAX_DELAY
+
+    assert spooler.run_once()
+    job = _job()
+    assert (job['status'], job['attempts']) == ('failed', 4)
+    assert not spooler.run_once()
+    assert printed == []
+
+    # Handmatig opnieuw aanbieden geeft een nieuwe reeks pogingen
+    printed.fail = None
+    assert database.retry_print_job(job['id'])
+    assert not database.retry_print_job(job['id'])  # Alleen mislukte jobs
+    assert spooler.run_once()
+    assert len(printed) == 1 and _job() is None
+
+
+def test_job_for_a_deleted_ticket_fails_without_retries(spooler, printed):
+    ticket_id = database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', None, print_ticket=True)
+    db = database.get_db()
+    db.execute('DELETE FROM tickets WHERE id = ?', (ticket_id,))
+    db.commit()
+    assert spooler.run_once()
+    assert (_job()['status'], _job()['attempts']) == ('failed', 1)
+
+
+def test_hanging_print_command_times_out(app, spooler):
+    app.config.update(PRINT_JOB_TIMEOUT=0.5,
+                      PRINT_COMMAND=[sys.executable, '-c', 'import time; time.sleep(10)', '{file}'])
+    database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', None, print_ticket=True)
+    started = time.monotonic()
+    assert spooler.run_once()
+    assert time.monotonic() - started < 5
+    assert _job()['last_error'] == 'Printcommando reageerde niet binnen 0.5 seconden.'
+
+
+def test_expired_claim_is_picked_up_again(spooler, printed):
+    database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', None, print_ticket=True)
+    job = database.claim_print_job(lease_seconds=60)  # Een worker die tijdens het printen stopte
+    assert not spooler.run_once()
+    _make_due(job['id'])
+    assert spooler.run_once()
+    assert len(printed) == 1 and _job() is None
+
+
+def test_background_worker_drains_the_queue(app, spooler, printed):
+    spooler.start()
+    try:
+        database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', None, print_ticket=True)
+        deadline = time.monotonic() + 5
+        while _job() is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert _job() is None and len(printed) == 1
+    finally:
+        spooler.stop(timeout=5)
+    assert not spooler.running
@@ -0,0 +1,77 @@
+import pytest
+
+from app import database
+
+# Welke covering index elke lijstpagina moet gebruiken: (lijst, filter, sortering) -> index
+EXPECTED_INDEXES = {
+    ('active', 'all', 'created_at_desc'): 'idx_tickets_created_list',
+    ('active', 'all', 'created_at_asc'): 'idx_tickets_created_list',
+    ('active', 'all', 'priority'): 'idx_tickets_priority_list',
+    ('active', 'all', 'status'): 'idx_tickets_status_rank_list',
+    ('active', 'mine', 'created_at_desc'): 'idx_tickets_assigned_list',
+    ('active', 'mine', 'created_at_asc'): 'idx_tickets_assigned_list',
+    ('active', 'unassigned', 'created_at_desc'): 'idx_tickets_assigned_list',
+    ('active', 'unassigned', 'created_at_asc'): 'idx_tickets_assigned_list',
+    ('archive', 'all', 'created_at_desc'): 'idx_tickets_status_created',
+    ('archive', 'all', 'created_at_asc'): 'idx_tickets_status_created',
+    ('archive', 'mine', 'created_at_desc'): 'idx_tickets_assigned_list',
+    ('archive', 'unassigned', 'created_at_desc'): 'idx_tickets_assigned_list',
+}
+
+LIST_FUNCTIONS = {'active': database.get_active_tickets, 'archive': database.get_archived_tickets}
+
+
+@pytest.fixture
+def tickets(app, db_context):
+    """Genoeg tickets in alle statussen, toegewezen en niet, voor meerdere pagina's."""
+    app.config['TICKETS_PER_PAGE'] = 5
+    statuses = ['New', 'In Progress', 'Resolved', 'Closed']
+    for i in range(40):
+        ticket_id = database.create_ticket(f'Ticket {i}', 'beschrijving', 'naam', 'e', 'p',
+                                           ['Hoog', 'Gemiddeld', 'Laag'][i % 3], None)
+        if i % 3 == 0:
+            database.assign_ticket(ticket_id, 'admin', None)
+        status = statuses[i % 4]
+        database.update_ticket(ticket_id, status, None, 'admin', 'In Progress' if i % 3 == 0 else 'New')
+
+
+def _list_query_plans(list_name, filter_by, sort_by):
+    """
+    Haalt de eerste en tweede pagina op en geeft het query plan van de lijstquery van
+    beide pagina's (de tweede met een keyset cursor).
+    """
+    db = database.get_db()
+    statements = []
+    db.set_trace_callback(statements.append)
+    try:
+        first = LIST_FUNCTIONS[list_name]('admin', filter_by, '', sort_by)
+        assert first['next_cursor'], 'te weinig tickets voor een tweede pagina'
+        LIST_FUNCTIONS[list_name]('admin', filter_by, '', sort_by, cursor=first['next_cursor'])
+    finally:
+        db.set_trace_callback(None)
+
+    list_queries = [sql for sql in statements if sql.startswith('SELECT t.id, t.title')]
+    assert len(list_queries) == 2
+    return [
+        [row['detail'] for row in db.execute('EXPLAIN QUERY PLAN ' + sql)]
+        for sql in list_queries
+    ]
+
+
+@pytest.mark.parametrize('list_name, filter_by, sort_by', sorted(EXPECTED_INDEXES))
+def test_list_pages_use_covering_index(tickets, list_name, filter_by, sort_by):
+    index = EXPECTED_INDEXES[list_name, filter_by, sort_by]
+    for plan in _list_query_plans(list_name, filter_by, sort_by):
+        table_steps = [step for step in plan if step.startswith(('SCAN t', 'SEARCH t'))]
+        assert table_steps == [step for step in table_steps if f'USING COVERING INDEX {index}' in step], plan
+        assert len(table_steps) == 1, plan
+
+
+@pytest.mark.parametrize('list_name', sorted(LIST_FUNCTIONS))
+@pytest.mark.parametrize('filter_by', ['mine', 'unassigned'])
+@pytest.mark.parametrize('sort_by', ['priority', 'status'])
+def test_filtered_rank_sorts_never_scan_the_table(tickets, list_name, filter_by, sort_by):
+    # Deze combinaties hebben geen eigen covering index, maar mogen de tabel nooit helemaal lezen
+    for plan in _list_query_plans(list_name, filter_by, sort_by):
+        assert not any(step == 'SCAN t' for step in plan), plan
+        assert any('idx_tickets_assigned_list' in step for step in plan), plan
@@ -0,0 +1,81 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app import database
+
+
+@pytest.fixture
+def cache(app, db_context):
+    database.create_kb_article('Printer', 'Hardware', 'Zet hem uit en aan.')
+    database.create_template('Groet', 'Beste collega,')
+    return app.extensions['reference_cache']
+
+
+def _stats_delta(cache, before):
+    after = cache.stats()
+    return {key: after[key] - before[key] for key in ('hits', 'misses', 'invalidations', 'external_invalidations')}
+
+
+def _in_other_thread(app, func):
+    result = []
+
+    def worker():
+        with app.test_request_context():
+            result.append(func())
+            database.close_db()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_repeated_reads_come_from_the_cache(cache):
+    first = database.get_all_kb_articles()
+    before = cache.stats()
+    assert database.get_all_kb_articles() is first
+    assert database.get_kb_article_by_id(1)['title'] == 'Printer'
+    assert database.get_kb_article_by_id(1)['title'] == 'Printer'
+    assert _stats_delta(cache, before) == {'hits': 2, 'misses': 1, 'invalidations': 0, 'external_invalidations': 0}
+
+
+def test_writes_invalidate_only_their_dataset(cache):
+    database.get_all_templates()
+    assert database.get_kb_article_by_id(1)['content'] == 'Zet hem uit en aan.'
+
+    database.update_kb_article(1, 'Printer', 'Hardware', 'Eerst de kabel controleren.')
+    before = cache.stats()
+    assert database.get_kb_article_by_id(1)['content'] == 'Eerst de kabel controleren.'
+    assert database.get_all_templates()[0]['title'] == 'Groet'
+    assert _stats_delta(cache, before) == {'hits': 1, 'misses': 1, 'invalidations': 0, 'external_invalidations': 0}
+
+
+def test_ticket_writes_keep_the_cache(cache):
+    database.get_all_kb_articles()
+    database.create_ticket('T', 'd', 'n', 'e', 'p', 'Hoog', None)
+    before = cache.stats()
+    database.get_all_kb_articles()
+    assert _stats_delta(cache, before)['hits'] == 1
+
+
+def test_own_writes_are_not_seen_as_external_by_other_threads(app, cache):
+    _in_other_thread(app, database.get_all_templates)
+    database.update_template(1, 'Groet', 'Hallo,')
+    before = cache.stats()
+    templates = _in_other_thread(app, database.get_all_templates)
+    assert templates[0]['content'] == 'Hallo,'
+    assert _stats_delta(cache, before)['external_invalidations'] == 0
+
+
+def test_writes_outside_the_app_are_picked_up(app, cache):
+    assert database.get_kb_article_by_id(1)['title'] == 'Printer'
+    conn = sqlite3.connect(app.config['DATABASE_FILE'])
+    conn.execute("UPDATE kb_articles SET title = 'Printer storing' WHERE id = 1")
+    conn.commit()
+    conn.close()
+
+    before = cache.stats()
+    assert database.get_kb_article_by_id(1)['title'] == 'Printer storing'
+    assert _stats_delta(cache, before)['external_invalidations'] == 1
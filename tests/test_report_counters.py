@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from app import database
+
+STATUSES = ['New', 'In Progress', 'Pending', 'Resolved', 'Closed']
+PRIORITIES = ['Hoog', 'Gemiddeld', 'Laag', 'Onbekend']
+AGENTS = ['admin', 'piet', None]
+CATEGORIES = ['Hardware', 'Software', 'Netwerk']
+
+
+def _group_by_counts(db):
+    """De dashboardcijfers zoals een GROUP BY over de brontabellen ze berekent."""
+    queries = {
+        'status': 'SELECT status, count(*) FROM tickets GROUP BY status',
+        'priority': 'SELECT priority, count(*) FROM tickets GROUP BY priority',
+        'assignment': "SELECT coalesce(assigned_to, 'Unassigned'), count(*) FROM tickets GROUP BY 1",
+        'kb_category': 'SELECT category, count(*) FROM kb_articles GROUP BY category',
+    }
+    return {dimension: dict(db.execute(sql).fetchall()) for dimension, sql in queries.items()}
+
+
+def _counter_values(db):
+    counts = {dimension: {} for dimension in database.REPORT_COUNTER_DIMENSIONS}
+    for dimension, bucket, count in db.execute('SELECT dimension, bucket, count FROM report_counters WHERE count != 0'):
+        counts[dimension][bucket] = count
+    return counts
+
+
+def _random_mutation(rng, db, tickets, articles):
+    """Eén willekeurige wijziging, via de applicatiefuncties of direct in SQL (zoals de sqlite3 shell)."""
+    operation = rng.choice([
+        'create', 'create', 'status', 'assign', 'raw_update', 'raw_delete',
+        'kb_create', 'kb_update', 'kb_delete', 'raw_kb_update'
+    ])
+    if operation == 'create' or not tickets and operation in ('status', 'assign', 'raw_update', 'raw_delete'):
+        tickets.append(database.create_ticket('titel', 'beschrijving', 'naam', 'e', 'p', rng.choice(PRIORITIES), None))
+    elif operation == 'status':
+        database.update_ticket(rng.choice(tickets), rng.choice(STATUSES), None, 'admin', 'onbekend')
+    elif operation == 'assign':
+        database.assign_ticket(rng.choice(tickets), rng.choice(AGENTS[:2]), None)
+    elif operation == 'raw_update':
+        db.execute(
+            'UPDATE tickets SET status = ?, priority = ?, assigned_to = ? WHERE id = ?',
+            (rng.choice(STATUSES), rng.choice(PRIORITIES), rng.choice(AGENTS), rng.choice(tickets))
+        )
+        db.commit()
+    elif operation == 'raw_delete':
+        db.execute('DELETE FROM tickets WHERE id = ?', (tickets.pop(rng.randrange(len(tickets))),))
+        db.commit()
+    elif operation == 'kb_create' or not articles:
+        database.create_kb_article('artikel', rng.choice(CATEGORIES), 'inhoud')
+        articles.append(db.execute('SELECT max(id) FROM kb_articles').fetchone()[0])
+    elif operation == 'kb_update':
+        database.update_kb_article(rng.choice(articles), 'artikel', rng.choice(CATEGORIES), 'nieuwe inhoud')
+    elif operation == 'kb_delete':
+        database.delete_kb_article(articles.pop(rng.randrange(len(articles))))
+    else:
+        db.execute('UPDATE kb_articles SET category = ? WHERE id = ?', (rng.choice(CATEGORIES), rng.choice(articles)))
+        db.commit()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_counters_match_group_by_after_random_mutations(db_context, seed):
+    rng = random.Random(seed)
+    db = database.get_db()
+    tickets, articles = [], []
+    for step in range(300):
+        _random_mutation(rng, db, tickets, articles)
+        if step % 50 == 49:
+            assert _counter_values(db) == _group_by_counts(db), f'na stap {step}'
+
+    assert _counter_values(db) == _group_by_counts(db)
+    assert database.check_report_counters(db) == []
+    # De rapportagefuncties lezen dezelfde cijfers als een GROUP BY
+    expected = _group_by_counts(db)
+    assert dict(map(tuple, database.get_status_counts())) == expected['status']
+    assert dict(map(tuple, database.get_priority_counts())) == expected['priority']
+    assert dict(map(tuple, database.get_assignment_counts())) == expected['assignment']
+    assert dict(map(tuple, database.get_kb_category_counts())) == expected['kb_category']
+
+
+def test_check_counters_command_repairs_drift(app, db_context):
+    database.create_ticket('titel', 'beschrijving', 'naam', 'e', 'p', 'Hoog', None)
+    db = database.get_db()
+    db.execute("UPDATE report_counters SET count = 99 WHERE dimension = 'status' AND bucket = 'New'")
+    db.commit()
+    assert database.check_report_counters(db) == [('status', 'New', 99, 1)]
+
+    runner = app.test_cli_runner()
+    assert 'New' in runner.invoke(args=['check-counters']).output
+    runner.invoke(args=['check-counters', '--repair'])
+    assert database.check_report_counters(db) == []
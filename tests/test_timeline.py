@@ -0,0 +1,68 @@
+import base64
+import json
+
+import pytest
+
+from app import database
+
+
+@pytest.fixture
+def ticket_id(app, db_context):
+    """Een ticket met een aanmaak-event, 7 reacties en 2 statuswijzigingen."""
+    app.config['TIMELINE_PAGE_SIZE'] = 3
+    ticket_id = database.create_ticket('Tijdlijn', 'd', 'n', 'e', 'p', 'Hoog', None)
+    for i in range(7):
+        database.update_ticket(ticket_id, 'New', f'reactie {i}', 'admin', 'New')
+    database.update_ticket(ticket_id, 'In Progress', None, 'admin', 'New')
+    database.update_ticket(ticket_id, 'Pending', None, 'admin', 'In Progress')
+    return ticket_id
+
+
+def _all_items(ticket_id, **kwargs):
+    """Loopt alle pagina's af zoals de 'oudere items laden' knop; retourneert de ids per pagina."""
+    pages, before = [], None
+    while True:
+        page = database.get_comments_for_ticket(ticket_id, before=before, **kwargs)
+        pages.append([row['id'] for row in page['comments']])
+        before = page['older_cursor']
+        if before is None:
+            return pages
+
+
+def test_paging_walks_the_whole_timeline_once(ticket_id):
+    db = database.get_db()
+    expected = [row[0] for row in db.execute(
+        'SELECT id FROM comments WHERE ticket_id = ? ORDER BY created_at, id', (ticket_id,))]
+    pages = _all_items(ticket_id)
+    assert all(len(page) <= 3 for page in pages)
+    # Pagina's komen nieuw naar oud binnen, elk oud naar nieuw gesorteerd
+    assert [item for page in reversed(pages) for item in page] == expected
+
+
+def test_paging_without_events_only_returns_comments(ticket_id):
+    pages = _all_items(ticket_id, include_events=False)
+    rows = database.get_db().execute(
+        "SELECT id FROM comments WHERE ticket_id = ? AND event_type = 'comment'", (ticket_id,)).fetchall()
+    assert sorted(item for page in pages for item in page) == sorted(row[0] for row in rows)
+    assert len(rows) == 7
+
+
+def test_timeline_fragment_links_to_the_next_page(client, ticket_id):
+    first = database.get_comments_for_ticket(ticket_id)
+    response = client.get(f'/ticket/{ticket_id}/timeline', query_string={'before': first['older_cursor']})
+    html = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'Oudere items laden' in html
+    assert html.count('class="comment-item') == 3
+
+
+@pytest.mark.parametrize('before', [
+    'rommel',
+    base64.urlsafe_b64encode(json.dumps([{}, 1]).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps(['2024-01-01', 2**70]).encode()).decode(),
+])
+def test_bad_cursor_returns_the_newest_page(client, ticket_id, before):
+    response = client.get(f'/ticket/{ticket_id}/timeline', query_string={'before': before})
+    assert response.status_code == 200
+    newest = client.get(f'/ticket/{ticket_id}/timeline')
+    assert response.get_data(as_text=True) == newest.get_data(as_text=True)